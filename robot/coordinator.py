@@ -0,0 +1,40 @@
+#!/usr/bin/env pybricks-micropython
+"""Parking coordinator brick: the robots with FLEET_ID set in robot/main.py connect to it, see fleet.py"""
+from pybricks.hubs import EV3Brick
+from pybricks.parameters import Color
+from pybricks.tools import wait, StopWatch
+from pybricks.messaging import BluetoothMailboxServer, TextMailbox
+from fleet import MAILBOX, Coordinator
+
+# Fleet definitions
+FLEET_SIZE = 2  # Robots, with ids 0 to FLEET_SIZE - 1
+BAYS = 2  # Parking bays on the track
+STEP_TIME = 20  # ms, between mailbox rounds
+REPORT_TIME = 60  # s, between statistics
+
+ev3 = EV3Brick()
+clock = StopWatch()  # ms
+coordinator = None  # Set up by main()
+
+
+def main():
+    """Waits for the fleet and coordinates it until stopped"""
+    global coordinator
+    ev3.light.on(Color.RED)
+    server = BluetoothMailboxServer()
+    coordinator = Coordinator([TextMailbox(MAILBOX % i, server) for i in range(FLEET_SIZE)], BAYS)
+    print("Waiting for", FLEET_SIZE, "robots..")
+    server.wait_for_connection(FLEET_SIZE)
+    ev3.light.on(Color.GREEN)
+    report = clock.time()
+    while True:
+        now = clock.time()
+        coordinator.step(now)
+        if now - report > 1000*REPORT_TIME:
+            report = now
+            coordinator.report()
+        wait(STEP_TIME)
+
+
+if __name__ == '__main__':
+    main()
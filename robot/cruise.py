@@ -0,0 +1,113 @@
+"""Cruise control from the ultrasonic distance and its rate of change, or the velocity the robot ahead shares"""
+from fastpath import SHIFT, ONE
+
+# Cruise definitions
+MM_PER_DEG = 0.4887  # Wheel travel per motor degree, 56 mm wheels
+STOP_GAP = 100  # mm, stand still at this distance
+HEADWAY = 1.0  # s, time gap kept to the robot ahead
+PLATOON_HEADWAY = 1.0  # s, time gap kept to a robot ahead that shares its velocity, at 0.4 s it stopped twice as often
+TTC_BRAKE = 0.5  # s, stop when the time to collision is shorter than this
+GAP_GAIN = 1.2  # 1/s, speed correction per mm of gap error
+MIN_VELOCITY = 30  # deg/s, slower commands stop the robot instead of creeping
+NO_TARGET = 2000  # mm, readings at or above this mean free track
+LOST_TIME = 0.3  # s, keep predicting the gap this long after losing the target
+PLATOON_LOST_TIME = 0.6  # s, as LOST_TIME for a robot ahead that shares its velocity, its velocity counts as long
+SAMPLE_TIME = 0.1  # s, the ultrasonic sensor refreshes about this often
+FILTER_ALPHA = 0.5
+FILTER_BETA = 0.1
+
+# Fixed point definitions, ONE is 1.0 and times are in ms
+MM_PER_DEG_Q = int(MM_PER_DEG*ONE)
+HEADWAY_MS = int(HEADWAY*1000)
+PLATOON_HEADWAY_MS = int(PLATOON_HEADWAY*1000)
+TTC_BRAKE_MS = int(TTC_BRAKE*1000)
+GAP_GAIN_Q = int(GAP_GAIN*ONE)
+LOST_MS = int(LOST_TIME*1000)
+PLATOON_LOST_MS = int(PLATOON_LOST_TIME*1000)
+SAMPLE_MS = int(SAMPLE_TIME*1000)
+FILTER_ALPHA_Q = int(FILTER_ALPHA*ONE)
+FILTER_BETA_Q = int(FILTER_BETA*ONE)
+
+
+class CruiseControl:
+    """Alpha-beta filter on the gap, commands speed from time to collision and a safe gap
+
+    The state is integer mm, mm/s and ms so that update_q() allocates nothing.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forgets the robot ahead, call after rotating or parking"""
+        self.gap = None
+        self.rate = 0
+        self.time = 0
+        self.seen = 0
+        self.velocity = 0
+        self.distance = 0  # mm, last sample
+
+    def track(self, distance, now, rate=None):
+        """Updates the filtered gap (mm) and closing rate (mm/s) from a sample at now (ms).
+        A rate known from the shared velocity replaces the filtered one
+        """
+        if rate is not None:
+            self.rate = rate
+        if self.gap is None:
+            if distance < NO_TARGET:
+                self.gap = distance
+                self.rate = 0
+                self.time = self.seen = now
+            return
+        dt = now - self.time
+        if dt < SAMPLE_MS:
+            return
+        self.time = now
+        predicted = self.gap + self.rate*dt//1000
+        if distance >= NO_TARGET:
+            if now - self.seen > (LOST_MS if rate is None else PLATOON_LOST_MS):
+                self.gap = None
+            else:
+                self.gap = predicted
+            return
+        residual = distance - predicted
+        self.gap = predicted + ((FILTER_ALPHA_Q*residual) >> SHIFT)
+        if rate is None:
+            self.rate += ((FILTER_BETA_Q*residual*1000) >> SHIFT)//dt
+        self.seen = now
+
+    def update(self, distance, max_velocity, now, leader=-1):
+        """Returns the velocity (deg/s) for a distance sample (mm) taken at now (s).
+        leader is the velocity (deg/s) the robot ahead shares, -1 if it shares none
+        """
+        return self.update_q(int(distance), int(max_velocity), int(now*1000), int(leader))
+
+    def update_q(self, distance, max_velocity, now, leader=-1):
+        """update() with integer deg/s and now in ms, allocates nothing"""
+        self.distance = distance
+        own = (self.velocity*MM_PER_DEG_Q) >> SHIFT
+        if leader >= 0 and self.gap is not None and now - self.seen <= PLATOON_LOST_MS:
+            # Its shared velocity instead of the estimate from the closing rate, only while the sensor has seen a
+            # robot ahead, as the robot that shares may be behind or out of sight
+            lead = (leader*MM_PER_DEG_Q) >> SHIFT
+            self.track(distance, now, lead - own)
+            headway = PLATOON_HEADWAY_MS
+        else:
+            self.track(distance, now)
+            lead = own + self.rate
+            headway = HEADWAY_MS
+        if self.gap is None:
+            self.velocity = max_velocity
+            return max_velocity
+        if lead < 0:
+            lead = 0
+        target = lead + ((GAP_GAIN_Q*(self.gap - STOP_GAP - headway*lead//1000)) >> SHIFT)
+        if self.gap <= STOP_GAP or (self.rate < 0 and (self.gap - STOP_GAP)*1000 < -self.rate*TTC_BRAKE_MS):
+            target = 0
+        velocity = (target << SHIFT)//MM_PER_DEG_Q
+        if velocity > max_velocity:
+            velocity = max_velocity
+        if velocity < MIN_VELOCITY or (self.velocity == 0 and velocity < 2*MIN_VELOCITY):
+            velocity = 0
+        self.velocity = velocity
+        return velocity
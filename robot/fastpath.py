@@ -0,0 +1,100 @@
+"""Line following hot path compiled by the MicroPython native and viper emitters
+
+Steering is fixed point with ONE as 1.0. Under CPython the emitter
+decorators do nothing and NATIVE is False, so main.py keeps the float
+reference functions there. sim/fastpath_check.py compares both over the
+whole reflection range.
+
+Nothing here allocates on the MicroPython heap: results are small ints or
+written into a caller's preallocated list. AllocCounter measures that on the
+brick, sim/alloc_check.py on the host.
+"""
+try:
+    import micropython
+    native = micropython.native
+    viper = micropython.viper
+    const = micropython.const
+    NATIVE = True
+except ImportError:
+    def native(fn):
+        return fn
+    viper = native
+
+    def const(value):
+        return value
+    NATIVE = False
+
+try:
+    from gc import mem_alloc
+except ImportError:  # CPython
+    mem_alloc = None
+
+# Fixed point definitions
+SHIFT = const(10)  # const() folds it into the viper code, which cannot read a global object as an int
+ONE = const(1 << SHIFT)
+
+
+@native
+def norm_q(color_left, color_right, color_current, gain_q):
+    """norm() with integer math, gain_q is NORM_GAIN*ONE, returns turn rate*ONE"""
+    t = ((2*color_current - color_left - color_right) << SHIFT)//(color_left - color_right)
+    t2 = (t*t) >> SHIFT
+    return (gain_q*(((t2 + ONE)*t) >> SHIFT)) >> (SHIFT + 1)
+
+
+@viper
+def velocity_q(x: int, velocity: int, steering_offset: int, out):
+    """velocity_fn() with x as turn rate*ONE and integer speeds, written to out[0] and out[1]"""
+    turn = (velocity*x) >> SHIFT
+    left = velocity + 2*turn
+    right = velocity - 2*turn
+    if left > velocity:
+        left = velocity
+    if right > velocity:
+        right = velocity
+    if steering_offset < 0:
+        left -= turn
+    elif steering_offset > 0:
+        right += turn
+    out[0] = left
+    out[1] = right
+
+
+@native
+def on_line(reflection, color_line, limit):
+    """Returns True if a reflection is within limit of the line, EMA filtered readings are floats"""
+    error = reflection - color_line
+    if error < 0:
+        error = -error
+    return error < limit
+
+
+class AllocCounter:
+    """Heap bytes allocated between start() and stop(), summed over ticks
+
+    Counts nothing where gc.mem_alloc() is missing. A collection between
+    start() and stop() shrinks the heap, so those ticks are skipped.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.ticks = 0
+        self.bytes = 0
+        self.worst = 0
+        self.before = 0
+
+    def start(self):
+        if mem_alloc is not None:
+            self.before = mem_alloc()
+
+    def stop(self):
+        if mem_alloc is None:
+            return
+        used = mem_alloc() - self.before
+        if used >= 0:
+            self.ticks += 1
+            self.bytes += used
+            if used > self.worst:
+                self.worst = used
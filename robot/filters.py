@@ -0,0 +1,98 @@
+"""Reflection filtering for line detection, one ring buffer per color sensor"""
+from pybricks.tools import StopWatch
+from fastpath import on_line
+
+# Filter definitions
+RAW = 0
+MEDIAN = 1
+EMA = 2
+FILTER_SIZE = 3  # Samples in the ring buffer, odd for the median
+FILTER_ALPHA = 0.5  # EMA weight of the latest sample
+HYSTERESIS = 4  # Reflection units a detected line may drift before it counts as left
+STALE_TIME = 50  # ms, a longer pause between readings restarts the filter
+
+
+def latency(mode, size=FILTER_SIZE, alpha=FILTER_ALPHA):
+    """Returns the delay a filter adds to a step change, in samples"""
+    if mode == MEDIAN:
+        return size//2
+    if mode == EMA:
+        return (1-alpha)/alpha
+    return 0
+
+
+class LineSensor:
+    """Color sensor whose reflection() is filtered over a ring buffer
+
+    Every reflection() reads the sensor once, so calling it once per loop
+    iteration filters once per tick. The buffers are allocated up front and
+    reused. Samples from before a pause, such as a wait() while parked, are
+    dropped. near() adds hysteresis to the line test. Steering reads raw,
+    the unfiltered sample of the last reflection(), as any filter delays it.
+    """
+
+    def __init__(self, sensor, mode=MEDIAN, size=FILTER_SIZE, alpha=FILTER_ALPHA, hysteresis=HYSTERESIS):
+        self.sensor = sensor
+        self.mode = mode
+        self.alpha = alpha
+        self.hysteresis = hysteresis
+        self.history = [0] * size
+        self.scratch = [0] * size
+        self.watch = StopWatch()
+        self.time = 0
+        self.reset()
+
+    def reset(self):
+        """Forgets old samples, the next reading fills the buffer"""
+        self.index = 0
+        self.count = 0
+        self.raw = 0
+        self.value = 0
+        self.target = None
+        self.on = False
+
+    def latency(self):
+        """Returns the delay the filter adds to a step change, in samples"""
+        return latency(self.mode, len(self.history), self.alpha)
+
+    def reflection(self):
+        """Reads the sensor and returns the filtered reflection"""
+        raw = self.sensor.reflection()
+        self.raw = raw
+        now = self.watch.time()
+        if now - self.time > STALE_TIME:
+            self.count = 0
+        self.time = now
+        history = self.history
+        size = len(history)
+        if self.count == 0:
+            for i in range(size):
+                history[i] = raw
+            self.value = raw
+        history[self.index] = raw
+        self.index = (self.index + 1) % size
+        self.count += 1
+
+        if self.mode == MEDIAN:
+            scratch = self.scratch
+            for i in range(size):  # Insertion sort, no allocation
+                v = history[i]
+                j = i
+                while j > 0 and scratch[j-1] > v:
+                    scratch[j] = scratch[j-1]
+                    j -= 1
+                scratch[j] = v
+            self.value = scratch[size//2]
+        elif self.mode == EMA:
+            self.value += self.alpha*(raw - self.value)
+        else:
+            self.value = raw
+        return self.value
+
+    def near(self, target, limit):
+        """Returns True while the filtered reflection is within limit of target, with hysteresis"""
+        if target != self.target:
+            self.target = target
+            self.on = False
+        self.on = on_line(self.reflection(), target, limit + self.hysteresis if self.on else limit)
+        return self.on
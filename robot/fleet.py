@@ -0,0 +1,256 @@
+"""Parking coordinator for any number of robots, and the client each robot asks it through
+
+The pair protocol has one robot tell the other when to park. With more
+robots one Coordinator, on a brick of its own (robot/coordinator.py) or on a
+host, owns the parking bays and a maneuver lock, and every robot asks it
+before a maneuver that leaves or crosses the line: PARK before scanning a
+stub, UNPARK before turning out of a bay and ROTATE before turning around.
+Only the lock holder maneuvers, the others wait in first come first served
+order, and PARK is refused when every bay is taken. The lock does not stop
+robots driving by, so a robot about to leave its bay asks CLEAR, answered
+WAIT while another robot has lately asked PARK and may stand at its stub.
+The robot ends each maneuver with PARKED, CANCEL (the spot was taken),
+UNPARKED or ROTATED.
+A lock not given back within HOLD_TIMEOUT is taken away, so a robot that
+stops talking cannot block the fleet.
+
+Each robot id has a text mailbox of its own, MAILBOX % id, both ways. A
+request is 'sequence verb' and its answer 'sequence answer bay', where
+the answer is GO, WAIT, NO or OK. Mailboxes keep only the latest message,
+so a new sequence number is what makes a resend a new message. Verbs are
+idempotent for the coordinator, a lost answer is fixed by asking again.
+"""
+from pybricks.tools import wait
+from handshake import IDLE, PENDING, DONE, FAILED, POLL_TIME
+
+# Fleet definitions
+MAILBOX = 'fleet%d'
+RETRY_TIME = 300  # ms, a request without an answer, or answered WAIT, is sent again
+REQUEST_TIMEOUT = 8  # s, a request is given up
+HOLD_TIMEOUT = 30  # s, the lock is taken from a robot that has not given it back
+QUEUE_TIMEOUT = 1000  # ms, a waiting robot that stopped asking leaves the queue
+STUB_TIME = 3000  # ms, a robot that asked PARK stands at a stub or drives past it this long
+
+# Requests
+PARK = 'park'  # Lock and a bay, to scan and park
+PARKED = 'parked'  # Gives back the lock, keeps the bay
+CANCEL = 'cancel'  # Gives back the lock and the bay
+UNPARK = 'unpark'  # Lock, to leave the bay
+UNPARKED = 'unparked'  # Gives back the lock and the bay
+ROTATE = 'rotate'  # Lock, to turn around
+ROTATED = 'rotated'  # Gives back the lock
+CLEAR = 'clear'  # Holding the lock, no other robot asked PARK within STUB_TIME
+
+# Answers
+GO = 'go'
+WAIT = 'wait'
+NO = 'no'
+OK = 'ok'
+
+# States, next to those of handshake.py
+DENIED = 4
+
+
+class FleetClient:
+    """One robot's requests to the coordinator, request() and poll() never block, call() waits for the answer"""
+
+    def __init__(self, mbox, timeout=REQUEST_TIMEOUT):
+        self.mbox = mbox
+        self.timeout = int(1000*timeout)  # ms
+        self.state = IDLE
+        self.verb = None
+        self.sequence = 0
+        self.prefix = None  # Of the answers to the last message sent
+        self.answered = False  # The last message sent was answered WAIT
+        self.bay = -1
+        self.deadline = 0
+        self.resend_time = 0
+        self.read_time = 0
+        self.requests = 0
+        self.resends = 0
+        self.waits = 0
+        self.denials = 0
+        self.failures = 0
+
+    def request(self, verb, now, timeout=None):
+        """Sends a request at now (ms), replacing any outstanding one"""
+        self.verb = verb
+        self.deadline = now + (self.timeout if timeout is None else int(1000*timeout))
+        self.state = PENDING
+        self.requests += 1
+        self.send(now)
+
+    def send(self, now):
+        """Sends the outstanding request under a new sequence number"""
+        self.sequence = (self.sequence + 1) & 0xff
+        self.prefix = '%d ' % self.sequence
+        self.answered = False
+        self.resend_time = now + RETRY_TIME
+        self.read_time = now - POLL_TIME
+        self.mbox.send(self.prefix + self.verb)
+
+    def poll(self, now):
+        """Checks for the answer at now (ms), asks again or gives up on timeout, returns the state"""
+        if self.state != PENDING:
+            return self.state
+        if now - self.read_time >= POLL_TIME:
+            self.read_time = now
+            answer = self.mbox.read()
+            if answer is not None and answer.startswith(self.prefix):
+                _, word, bay = answer.split()
+                if word == GO or word == OK:
+                    self.bay = int(bay)
+                    self.state = DONE
+                    return DONE
+                if word == NO:
+                    self.denials += 1
+                    self.state = DENIED
+                    return DENIED
+                if not self.answered:  # WAIT, asked again at resend_time unless the lock comes first
+                    self.answered = True
+                    self.waits += 1
+        if now >= self.deadline:
+            self.failures += 1
+            self.state = FAILED
+        elif now >= self.resend_time:
+            self.resends += 1
+            self.send(now)
+        return self.state
+
+    def call(self, verb, clock, timeout=None):
+        """Sends a request and blocks until it is answered or given up, clock() returns ms, returns the state"""
+        self.request(verb, clock(), timeout)
+        while self.poll(clock()) == PENDING:
+            wait(POLL_TIME)
+        return self.state
+
+    def report(self):
+        """Prints the request statistics"""
+        print("Fleet requests:", self.requests, "resends:", self.resends, "waits:", self.waits, "denied:",
+              self.denials, "failed:", self.failures)
+
+
+class Coordinator:
+    """Parking bays and the maneuver lock of a fleet, call step() every few ms with one mailbox per robot id"""
+
+    def __init__(self, mboxes, bays, hold_timeout=HOLD_TIMEOUT):
+        self.mboxes = mboxes
+        self.last = [None]*len(mboxes)  # Last message read from each robot
+        self.heard = [0]*len(mboxes)  # ms, when
+        self.bays = [-1]*bays  # Robot id in each bay, -1 when free
+        self.hold_timeout = int(1000*hold_timeout)
+        self.holder = -1  # Robot id with the lock
+        self.held = 0  # ms, when it got the lock
+        self.at_stub = [-STUB_TIME]*len(mboxes)  # ms, when each robot last asked PARK
+        self.queue = []  # Robot ids waiting for the lock
+        self.parks = 0
+        self.grants = 0
+        self.waits = 0
+        self.denials = 0
+        self.expired = 0
+        self.held_time = 0  # ms the lock was held in all
+
+    def bay(self, robot):
+        """Returns the bay of a robot, -1 if it has none"""
+        for i in range(len(self.bays)):
+            if self.bays[i] == robot:
+                return i
+        return -1
+
+    def near_stub(self, robot, now):
+        """Returns True if another robot asked PARK within STUB_TIME, it may stand where robot turns out"""
+        for other in range(len(self.at_stub)):
+            if other != robot and now - self.at_stub[other] < STUB_TIME:
+                return True
+        return False
+
+    def acquire(self, robot, now):
+        """Gives the lock to robot if it is free and robot is first in line, else queues robot. Returns True if it holds the lock"""
+        if self.holder == robot:
+            return True
+        queue = self.queue
+        while queue and now - self.heard[queue[0]] > QUEUE_TIMEOUT:
+            queue.pop(0)
+        if self.holder < 0 and (not queue or queue[0] == robot):
+            if queue:
+                queue.pop(0)
+            self.holder = robot
+            self.held = now
+            self.grants += 1
+            return True
+        if robot not in queue:
+            queue.append(robot)
+        self.waits += 1
+        return False
+
+    def release(self, robot, now):
+        """Takes the lock back from robot if it holds it, or takes robot out of the queue"""
+        if robot in self.queue:  # Gave up waiting and went on
+            self.queue.remove(robot)
+        if self.holder == robot:
+            self.holder = -1
+            self.held_time += now - self.held
+
+    def handle(self, robot, verb, now):
+        """Returns the answer and bay for a request of robot"""
+        bay = self.bay(robot)
+        if verb == PARK:
+            self.at_stub[robot] = now
+            if bay < 0:
+                if -1 not in self.bays:
+                    if robot in self.queue:
+                        self.queue.remove(robot)
+                    self.denials += 1
+                    return NO, -1
+                if not self.acquire(robot, now):
+                    return WAIT, -1
+                bay = self.bays.index(-1)
+                self.bays[bay] = robot
+                return GO, bay
+            return (GO if self.acquire(robot, now) else WAIT), bay
+        if verb == CLEAR:
+            return (WAIT if self.holder != robot or self.near_stub(robot, now) else GO), bay
+        if verb == UNPARK or verb == ROTATE:
+            return (GO if self.acquire(robot, now) else WAIT), bay
+        if verb == PARKED or verb == ROTATED:
+            self.release(robot, now)
+            return OK, bay
+        if verb == CANCEL or verb == UNPARKED:
+            self.release(robot, now)
+            if bay >= 0:
+                self.bays[bay] = -1
+                if verb == UNPARKED:
+                    self.parks += 1
+            return OK, bay
+        return NO, -1
+
+    def step(self, now):
+        """Reads every robot's mailbox once at now (ms) and answers new requests"""
+        if self.holder >= 0 and now - self.held > self.hold_timeout:
+            self.expired += 1
+            self.release(self.holder, now)
+        for robot in range(len(self.mboxes)):
+            msg = self.mboxes[robot].read()
+            if msg is None or msg == self.last[robot]:
+                continue
+            self.last[robot] = msg
+            self.heard[robot] = now
+            self.answer(robot, now)
+        queue = self.queue
+        while self.holder < 0 and queue:  # Hands the lock on at once instead of at the next resend
+            robot = queue[0]
+            if now - self.heard[robot] <= QUEUE_TIMEOUT:
+                self.answer(robot, now)
+            if queue and queue[0] == robot:  # Stopped asking, or was denied
+                queue.pop(0)
+
+    def answer(self, robot, now):
+        """Answers the last message read from robot"""
+        sequence, verb = self.last[robot].split()
+        answer, bay = self.handle(robot, verb, now)
+        self.mboxes[robot].send('%s %s %d' % (sequence, answer, bay))
+
+    def report(self):
+        """Prints the coordinator statistics"""
+        print("Fleet parks:", self.parks, "grants:", self.grants, "waits:", self.waits, "denied:", self.denials,
+              "expired:", self.expired, "bays:", self.bays)
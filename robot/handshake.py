@@ -0,0 +1,83 @@
+"""Request/acknowledge exchanges with the other robot that never block for long"""
+from pybricks.tools import wait
+
+# Handshake definitions
+ACK_TIMEOUT = 8  # s, resend a request that has not been acknowledged this long
+ACK_RETRIES = 2  # Resends before a request is given up
+POLL_TIME = 50  # ms, between mailbox reads, each read allocates the decoded message
+
+# States
+IDLE = 0
+PENDING = 1
+DONE = 2
+FAILED = 3
+
+
+class Handshake:
+    """One outstanding request on a text mailbox
+
+    request() sends a message and returns at once, poll() checks for the
+    acknowledgement and resends on timeout, so acks can be collected while
+    driving. wait() blocks only until the ack arrives or the retries run out.
+    Clock readings are integer ms. poll() allocates only the message it
+    reads, every POLL_TIME ms while a request is outstanding, so main.py
+    polls outside the ALLOC_CHECK window of a tick.
+    Acks must differ from the previous message the peer sent, which holds for
+    the alternating parked/unparked replies.
+    """
+
+    def __init__(self, mbox, timeout=ACK_TIMEOUT, retries=ACK_RETRIES):
+        self.mbox = mbox
+        self.timeout = timeout
+        self.retries = retries
+        self.state = IDLE
+        self.msg = None
+        self.ack = None
+        self.stage_timeout = int(1000*timeout)  # ms
+        self.deadline = 0
+        self.read_time = 0
+        self.tries = 0
+        self.resends = 0
+        self.failures = 0
+
+    def send(self, msg):
+        """Sends a message that needs no acknowledgement"""
+        self.mbox.send(msg)
+
+    def request(self, msg, ack, now, timeout=None):
+        """Sends msg at now (ms) and starts waiting for ack, replacing any outstanding request"""
+        self.msg = msg
+        self.ack = ack
+        self.stage_timeout = int(1000*(self.timeout if timeout is None else timeout))
+        self.deadline = now + self.stage_timeout
+        self.read_time = now - POLL_TIME
+        self.tries = 1
+        self.state = PENDING
+        self.mbox.send(msg)
+
+    def poll(self, now):
+        """Checks for the ack at now (ms), resends or gives up on timeout, returns the state"""
+        if self.state != PENDING:
+            return self.state
+        if now - self.read_time >= POLL_TIME:
+            self.read_time = now
+            msg = self.mbox.read()  # A new string on every read
+            if msg == self.ack:
+                self.state = DONE
+                return DONE
+        if now >= self.deadline:
+            if self.tries > self.retries:
+                self.state = FAILED
+                self.failures += 1
+            else:
+                self.tries += 1
+                self.resends += 1
+                self.deadline = now + self.stage_timeout
+                self.mbox.send(self.msg)
+        return self.state
+
+    def wait(self, clock):
+        """Blocks until the outstanding request is done or failed, clock() returns ms, returns True if done"""
+        while self.poll(clock()) == PENDING:
+            wait(POLL_TIME)
+        return self.state == DONE
@@ -0,0 +1,255 @@
+"""Lap-to-lap learning of a steering feedforward and a speed profile along the track
+
+Position is the mean wheel travel since the start of the lap, so a lap is
+LAP_LENGTH of driving, and the track is cut into BIN_LENGTH bins. During a
+lap the steering of the feedback, the residual, is summed per bin. At the end
+of the lap each bin's feedforward takes in GAMMA of the mean residual a few
+bins further on, where the robot feels the curve late, and is smoothed over
+its neighbours. The speed of a bin starts as the velocity factor the speed
+scheduler drove it at in the first lap, then goes up by SPEED_GAIN after
+every lap the robot tracked it with a small mean residual and backs off by
+SPEED_BACKOFF otherwise. The
+velocity factor is the lowest speed of the next LOOKAHEAD bins, so the robot
+slows before hard bins instead of in them.
+
+Without a LAP_LENGTH the lap is measured first. The parking stubs come back
+in the same pattern every lap, so once the gaps between the stubs of the
+last lap repeat those of the lap before, within MEASURE_TOLERANCE, the lap
+is the travel from the same stub a lap earlier. Learning starts at that
+stub, whose tick allocates the profiles.
+
+There is one profile per driving direction. After a reversal the robot is
+LAP_LENGTH minus its position along the other direction. The first parking
+stub of each direction anchors the position, later stubs near it take out
+the drift. A reversal before the lap is measured starts the measurement
+over. State is kept in preallocated arrays of integers times ONE, so a tick
+allocates nothing, but the tick that ends a lap runs learn().
+"""
+from array import array
+from fastpath import SHIFT, ONE
+from cruise import MM_PER_DEG
+
+# Learning definitions
+BIN_LENGTH = 50  # mm of track per bin
+GAMMA = 0.5  # Part of the mean residual added to the feedforward after each lap
+LEAD = 2  # Bins between a feedforward and the residual it learns from
+STEER_LIMIT = 1.5  # Largest feedforward turn rate
+TRACK_NORM = 0.3  # |Mean residual| of a bin that still counts as tracking the line
+SPEED_GAIN = 0.3  # Velocity factor added after a lap of tracking a bin
+SPEED_BACKOFF = 0.9  # Velocity factor kept after a lap of not tracking a bin
+MAX_FACTOR = 2.5
+MIN_FACTOR = 0.8
+LOOKAHEAD = 4  # Bins, the speed of a bin is the lowest of the bins ahead
+ANCHOR_WINDOW = 100  # mm, a parking stub this close to the anchor corrects the position, less than between stubs
+ENCODER_TIME = 50  # ms, between encoder reads, each read slows the sensor loop
+MEASURE_TOLERANCE = 60  # mm, a stub a lap later is this close to where the pattern puts it
+MIN_LAP_LENGTH = 2000  # mm, shorter periods are runs of evenly spaced stubs
+MAX_STUBS = 32  # Stubs remembered while measuring, a measurement with no period by then starts over
+
+# Fixed point definitions, ONE is 1.0
+GAMMA_Q = int(GAMMA*ONE)
+STEER_LIMIT_Q = int(STEER_LIMIT*ONE)
+TRACK_NORM_Q = int(TRACK_NORM*ONE)
+SPEED_GAIN_Q = int(SPEED_GAIN*ONE)
+SPEED_BACKOFF_Q = int(SPEED_BACKOFF*ONE)
+MAX_FACTOR_Q = int(MAX_FACTOR*ONE)
+MIN_FACTOR_Q = int(MIN_FACTOR*ONE)
+
+
+class LapProfile:
+    """Feedforward and speed factor per bin along one driving direction"""
+
+    def __init__(self, bins):
+        self.steer = array('h', bytearray(2*bins))  # Feedforward turn rate*ONE
+        self.speed = array('h', bytearray(2*bins))  # Velocity factor*ONE the bin can be driven at
+        self.factor = array('h', bytearray(2*bins))  # Velocity factor*ONE, the lowest speed ahead
+        self.residual = array('i', bytearray(4*bins))  # Summed feedback turn rate*ONE of this lap
+        self.driven = array('i', bytearray(4*bins))  # Summed velocity factor*ONE of the first lap
+        self.scratch = array('i', bytearray(4*bins))
+        self.count = array('i', bytearray(4*bins))  # Ticks in this lap
+        for i in range(bins):
+            self.speed[i] = ONE
+            self.factor[i] = ONE
+        self.laps = 0  # Completed laps
+        self.anchor = -1  # Position of the first parking stub, half deg
+
+    def learn(self):
+        """Refines the profile from the residuals of the lap just driven, then clears them"""
+        steer, speed, factor, residual, scratch, count = self.steer, self.speed, self.factor, self.residual, self.scratch, self.count
+        driven = self.driven
+        bins = len(steer)
+        for i in range(bins):  # Mean residual and speed, unchanged where the robot did not follow the line
+            if count[i]:
+                r = residual[i]//count[i]
+                residual[i] = r
+                s = speed[i] if self.laps else driven[i]//count[i]
+                if -TRACK_NORM_Q < r < TRACK_NORM_Q:
+                    s += SPEED_GAIN_Q
+                    speed[i] = s if s < MAX_FACTOR_Q else MAX_FACTOR_Q
+                else:
+                    s = (s*SPEED_BACKOFF_Q) >> SHIFT
+                    speed[i] = s if s > MIN_FACTOR_Q else MIN_FACTOR_Q
+        for i in range(bins):
+            s = steer[i] + ((GAMMA_Q*residual[(i + LEAD) % bins]) >> SHIFT)
+            if s > STEER_LIMIT_Q:
+                s = STEER_LIMIT_Q
+            elif s < -STEER_LIMIT_Q:
+                s = -STEER_LIMIT_Q
+            scratch[i] = s
+        first = previous = scratch[0]
+        for i in range(bins):  # [1 2 1]/4 smoothing, so noise in one bin does not steer
+            following = scratch[i + 1] if i + 1 < bins else first
+            steer[i] = (previous + 2*scratch[i] + following) >> 2
+            previous = scratch[i]
+
+        for i in range(bins):  # Lowest over the bins ahead
+            f = speed[i]
+            for j in range(1, LOOKAHEAD + 1):
+                ahead = speed[(i + j) % bins]
+                if ahead < f:
+                    f = ahead
+            factor[i] = f
+
+        for i in range(bins):
+            residual[i] = 0
+            driven[i] = 0
+            count[i] = 0
+        self.laps += 1
+
+
+class LapLearner:
+    """Position along the track and the feedforward and speed factor of the current bin
+
+    Call update_q() every line following tick, landmark() when the parking
+    sensor comes onto a stub, resume() after any maneuver so its travel does
+    not count, reverse() when the driving direction flips. steer is the
+    feedforward turn rate*ONE, factor the velocity factor*ONE. learned is
+    False until the current direction has a completed lap. lap_length is in
+    mm, None measures it, lap is 0 until then.
+    """
+
+    def __init__(self, clock, left_motor, right_motor, lap_length, mode):
+        self.clock = clock
+        self.left_motor = left_motor
+        self.right_motor = right_motor
+        self.bin_length = 2*int(BIN_LENGTH/MM_PER_DEG)  # Half deg, the sum of both wheel angles
+        self.window = 2*int(ANCHOR_WINDOW/MM_PER_DEG)
+        self.tolerance = 2*int(MEASURE_TOLERANCE/MM_PER_DEG)
+        self.min_lap = 2*int(MIN_LAP_LENGTH/MM_PER_DEG)
+        self.stubs = array('i', bytearray(4*MAX_STUBS))  # Positions of the stubs seen while measuring
+        self.seen = 0
+        self.direction = (mode + 1) >> 1
+        self.lap = 0
+        self.profiles = None
+        self.profile = None
+        if lap_length is not None:
+            self.start(max(1, int(lap_length/BIN_LENGTH))*self.bin_length)
+        self.position = 0  # Half deg along the lap, or since the measurement started
+        self.index = 0  # Current bin
+        self.angles = 0
+        self.next_read = 0
+        self.steer = 0
+        self.factor = ONE
+        self.learned = False
+
+    def start(self, lap):
+        """Allocates the profiles of a lap of lap half deg, rounded down to whole bins"""
+        bins = max(1, lap//self.bin_length)
+        self.lap = bins*self.bin_length
+        self.profiles = (LapProfile(bins), LapProfile(bins))
+        self.profile = self.profiles[self.direction]
+
+    def resume(self):
+        """Continues from the current encoder angles, call after a maneuver"""
+        self.angles = self.left_motor.angle() + self.right_motor.angle()
+        self.next_read = self.clock.time() + ENCODER_TIME
+
+    def reverse(self, mode):
+        """Switches to the profile of driving mode -1 or 1, the robot turned around where it is"""
+        self.direction = (mode + 1) >> 1
+        if not self.lap:  # The stubs come back in the opposite order
+            self.seen = 0
+            self.position = 0
+            self.resume()
+            return
+        self.profile = self.profiles[self.direction]
+        self.position = self.lap - 1 - self.position
+        self.move(0)
+        self.resume()
+
+    def landmark(self):
+        """Marks a parking stub under the parking sensor, anchors the position or corrects its drift"""
+        if not self.lap:
+            self.measure()
+            return
+        profile = self.profile
+        if profile.anchor < 0:
+            profile.anchor = self.position
+            return
+        error = self.position - profile.anchor
+        if error > self.lap >> 1:
+            error -= self.lap
+        elif error < -(self.lap >> 1):
+            error += self.lap
+        if -self.window < error < 0:  # Short of the anchor, a lap may end in the correction
+            self.move(-error)
+        elif 0 <= error < self.window:
+            self.position = (self.position - error) % self.lap
+            self.move(0)
+
+    def measure(self):
+        """Takes a stub into the measurement, starts learning at it once the stubs of a lap repeat"""
+        stubs = self.stubs
+        n = self.seen
+        if n == len(stubs):
+            n = 0
+        stubs[n] = self.position
+        self.seen = n + 1
+        for k in range(1, n):  # Stubs per lap, the gaps of the last k+1 stubs must repeat those a lap earlier
+            lap = stubs[n] - stubs[n - k]
+            if lap < self.min_lap:
+                continue
+            i = n - 1
+            while i >= k and i >= n - k:
+                error = stubs[i] - stubs[i - k] - lap
+                if error >= self.tolerance or error <= -self.tolerance:
+                    break
+                i -= 1
+            else:
+                self.start(lap)
+                self.position = 0
+                self.profile.anchor = 0
+                self.move(0)
+                return
+
+    def move(self, travel):
+        """Advances the position by travel half deg, learns at the end of a lap"""
+        if not self.lap:
+            self.position += travel
+            return
+        position = self.position + travel
+        if position >= self.lap:
+            position -= self.lap
+            self.profile.learn()
+        self.position = position
+        self.index = position//self.bin_length
+        profile = self.profile
+        self.learned = profile.laps > 0
+        self.steer = profile.steer[self.index]
+        self.factor = profile.factor[self.index]
+
+    def update_q(self, x_q, factor_q):
+        """Takes the feedback turn rate*ONE and velocity factor*ONE of a tick, reads the encoders every ENCODER_TIME ms"""
+        profile = self.profile
+        if profile is not None:
+            profile.residual[self.index] += x_q
+            profile.driven[self.index] += factor_q
+            profile.count[self.index] += 1
+        now = self.clock.time()
+        if now >= self.next_read:
+            self.next_read = now + ENCODER_TIME
+            angles = self.left_motor.angle() + self.right_motor.angle()
+            travel = angles - self.angles
+            self.angles = angles
+            if travel > 0:
+                self.move(travel)
@@ -1,11 +1,35 @@
 #!/usr/bin/env pybricks-micropython
+import gc
+import json
 import time
 import random
 from pybricks.hubs import EV3Brick
 from pybricks.ev3devices import Motor, ColorSensor, UltrasonicSensor
 from pybricks.parameters import Port, Color
-from pybricks.tools import wait
-from pybricks.messaging import BluetoothMailboxServer, TextMailbox
+from pybricks.tools import wait, StopWatch
+from pybricks.messaging import BluetoothMailboxServer, BluetoothMailboxClient, TextMailbox, Mailbox
+from cruise import CruiseControl
+from scheduler import SpeedScheduler
+from filters import LineSensor
+from maneuver import OK, RECOVERED, LOST, Budget, ManeuverStats
+from trajectory import Trajectory
+from fastpath import NATIVE, SHIFT, ONE, norm_q, velocity_q, AllocCounter
+from tracking import LineTracker
+from handshake import Handshake, DONE, FAILED
+from policy import load as load_policy
+from learning import LapLearner
+from platoon import SpeedLink, MAILBOX
+from tuning import Tuning
+from remote import RemoteBrain, SocketLink
+from stubs import StubClassifier
+import fleet
+from profiler import Profiler
+from recorder import Trace, CALIBRATE, CONNECT, DRIVING, SCAN, PARK, PARKED, UNPARK, ROTATE
+
+# I/O backend
+SYSFS_IO = False  # Open the ev3dev attribute files directly instead of going through the pybricks devices
+if SYSFS_IO:
+    from sysfs import Motor, ColorSensor, UltrasonicSensor
 
 # Robot definition
 ev3 = EV3Brick()
@@ -15,9 +39,38 @@ left_motor = Motor(Port.B)
 right_motor = Motor(Port.C)
 
 # Sensor definitions
-left_light = ColorSensor(Port.S3)  # S3
+left_light = LineSensor(ColorSensor(Port.S3))  # S3
 obstacle_sensor = UltrasonicSensor(Port.S4)  # S4
-right_light = ColorSensor(Port.S2)  # S2
+right_light = LineSensor(ColorSensor(Port.S2))  # S2
+CALIBRATION_SAMPLES = 20  # Filtered readings averaged per sensor
+
+# Speed control
+cruise = CruiseControl()
+scheduler = SpeedScheduler()
+tracker = LineTracker()
+policy = None  # Tabular steering, loaded by calibrate() when TABULAR_STEERING is set
+lap = None  # Lap-to-lap learning, started by main() when LAP_LEARNING is set
+platoon = None  # Speed sharing with the other robot, set up by connect() when PLATOONING is set
+tuning = None  # Parameter updates at runtime, set up by connect() when HOT_RELOAD is set
+remote = None  # Control loop on a host, set up by main() when REMOTE_HOST is set
+stubs = None  # Parking stub classifier, set up by main() when STUB_CLASSIFIER is set
+coordinator = None  # Requests to the parking coordinator, set up by connect() when FLEET_ID is set
+
+# Fixed point state, so that a driving tick allocates nothing
+clock = StopWatch()  # ms
+speeds = [0, 0]  # deg/s, written by velocity_q()
+steer_q = 0  # Turn rate*ONE of the last tick
+allocs = AllocCounter()
+NORM_GAIN_Q = ONE  # NORM_GAIN*ONE, set by calibrate()
+
+# Maneuver budgets
+budget = Budget(clock, left_motor, right_motor)
+maneuvers = ManeuverStats()
+trajectory = Trajectory(clock, left_motor, right_motor)
+
+# Trace and profiler
+trace = Trace()
+profiler = Profiler()
 
 # Messages
 MSG_PARK = 'park'
@@ -40,10 +93,80 @@ COLOR_REVERSED = Color.GREEN
 
 # Driving definitions
 DRIVING_MODE = -1
+FUSED_TRACKING = False  # Steer from both color sensors instead of one edge
+TABULAR_STEERING = False  # Steer from the table in POLICY_FILE instead of the cubic of norm()
+POLICY_FILE = 'policy.bin'
+LAP_LEARNING = False  # Learn a steering feedforward and speed profile lap by lap
+LAP_LENGTH = None  # mm of line in one lap, None measures it from the pattern of the parking stubs
+STUB_CLASSIFIER = False  # Only park at parking sensor runs the classifier takes for stubs, not at any tick on the line
+TRAJECTORY_PARKING = False  # Park and unpark along the encoder trajectories of trajectory.py instead of timed line following
+STUB_ODOMETRY = True  # The classifier measures runs in wheel travel from the encoders instead of ticks
+FLEET_ID = None  # Id of this robot under the parking coordinator of robot/coordinator.py, None pairs with the other robot
+FLEET_COORDINATOR = 'coordinator'  # Bluetooth name of the coordinator brick
+PLATOONING = False  # Share the commanded velocity with the other robot, the one behind brakes and speeds up with it
+REMOTE_HOST = None  # Address of a host running sim/brain.py, which then drives while its link is fast enough
+REMOTE_PORT = 5005
+HOT_RELOAD = False  # Take parameter updates from TUNING_FILE while parked or turned and from TUNING_MAILBOX
+TUNING_FILE = 'tuning.json'
+TUNING_MAILBOX = 'tune'
+TUNING_HOST = True  # With HOT_RELOAD, wait for a host as a second Bluetooth client, it sends on TUNING_MAILBOX
+ALLOC_CHECK = False  # Print the heap bytes allocated by driving ticks at each turn
+MANEUVER_REPORT = False  # Print the lines the maneuvers missed and their recoveries at each turn
+TRACE = False  # Record every driving tick, saved to TRACE_FILE while parked
+TRACE_FILE = 'trace.csv'
+PROFILER = False  # Time the functions in PROFILED, the summary saved to PROFILER_FILE while parked and at exit
+PROFILER_FILE = 'profiler.csv'
+PROFILED = ('follow_line', 'norm', 'norm_q', 'velocity_fn', 'velocity_q', 'drive_robot', 'sensor_on_line',
+            'left_light.reflection', 'right_light.reflection', 'obstacle_sensor.distance', 'cruise.update_q',
+            'cruise.update', 'scheduler.update_q', 'scheduler.update')
 BASE_VELOCITY = 200
+NORM_GAIN = 0.88
+LINE_LIMIT = 16
 PARK_LIMIT = 4
 UNPARK_LIMIT = 2.5
 
+# Parking definitions
+SCAN_SAMPLES = 22
+SCAN_FREE_DISTANCE = 200  # mm
+PARKING_COOLDOWN = 1.6  # s, between parking line detections
+REVERSE_DELAY = 5  # s, after parking
+PARKING_DELAY = 7  # s, before parking is enabled again
+
+# Maneuver definitions
+MANEUVER_TIME = 6  # s, budget of a line search before recovering
+MANEUVER_DISTANCE = 1080  # deg of mean wheel travel, budget of a line search
+RECOVERY_TIME = 8  # s, budget of the reverse-and-search sweep
+SWEEP_VELOCITY = 150  # deg/s, wheel speed while turning in place to find the line
+SWEEP_STEP = 600  # ms, each sweep turns this much longer than the last
+
+# Handshake definitions
+PARK_ACK_TIMEOUT = 8  # s, the other robot parks after MSG_PARK
+UNPARK_ACK_TIMEOUT = 5  # s, the other robot unparks after MSG_UNPARK
+PARK_GRANT_TIMEOUT = 0.5  # s, at a stub for the coordinator's lock, a robot standing there blocks the bay it waits for
+UNPARK_GRANT_TIMEOUT = 60  # s, waiting in the bay for the lock before leaving anyway
+ROTATE_GRANT_TIMEOUT = 10  # s, waiting for the lock before turning anyway
+CLEAR_DISTANCE = 400  # mm, the ultrasonic must read farther before a granted maneuver enters the track
+CLEAR_TIME = 1.0  # s, the reading stays clear this long, a robot driving by crosses the beam in less
+CLEAR_TIMEOUT = 15  # s, waiting for clear track before maneuvering anyway
+
+# Tuned parameters
+PROFILE = 'profile.json'
+
+
+def load_profile(path=PROFILE):
+    """Overrides definitions above with a tuned parameter profile if there is one"""
+    try:
+        with open(path) as f:
+            profile = json.load(f)
+    except OSError:
+        return
+    for name, value in profile.items():
+        if name.isupper() and name in globals():
+            globals()[name] = value
+
+
+load_profile()
+
 
 # Driving
 def driving_mode(color_line, color_base, mode):
@@ -58,8 +181,12 @@ def norm(color_left, color_right, color_current):
     """Returns a number between -1 and 1 indicating turn rate"""
     t = (color_current-min(color_left, color_right)-.5*abs(color_left-color_right))
     t = (2*t)/(color_left-color_right)
-    t = 0.88*(t**3+t)/2
-    return t
+    return steer(t)
+
+
+def steer(t):
+    """Returns the turn rate for an edge error t between -1 and 1"""
+    return NORM_GAIN*(t**3+t)/2
 
 
 def velocity_fn(x, velocity, steering_offset):
@@ -87,99 +214,253 @@ def rotate180():
 # Line Following
 def follow_line(color_left, color_right, driving_sensor, steering_offset, cc=True):
     """Robot follows the line with cc"""
+    global steer_q
+    driving_sensor.reflection()  # Keeps the filter current for the line tests of the maneuvers
+    reflection = driving_sensor.raw  # Steering takes the latest reading, a filter would delay it a tick
+    if NATIVE:  # Fixed point on the brick, allocates nothing
+        if policy is not None:
+            x_q = policy.steer_q(color_left, color_right, reflection, (speeds[0] + speeds[1]) >> 1)
+        else:
+            x_q = norm_q(color_left, color_right, reflection, NORM_GAIN_Q)
+        factor = scheduler.update_q(x_q) if cc else ONE
+        if cc and lap is not None:  # Feedback only corrects the residual of the learned feedforward
+            if lap.learned:
+                factor = lap.factor
+            lap.update_q(x_q, factor)
+            x_q += lap.steer
+        steer_q = x_q
+        velocity = BASE_VELOCITY
+        if cc:  # Parking maneuvers are timed and keep BASE_VELOCITY
+            now = clock.time()
+            leader = platoon.leader(steering_offset, now) if platoon is not None else -1
+            velocity = cruise.update_q(obstacle_sensor.distance(), (BASE_VELOCITY*factor) >> SHIFT, now, leader)
+            if platoon is not None:
+                platoon.share(velocity, trace.phase, steering_offset, now)
+        velocity_q(x_q, velocity, steering_offset, speeds)
+        drive_robot(speeds)
+        return
+    if policy is not None:
+        x = policy.steer_q(color_left, color_right, reflection, int(speeds[0] + speeds[1]) >> 1)/ONE
+    else:
+        x = norm(color_left, color_right, reflection)
+    factor = scheduler.update(x) if cc else 1
+    if cc and lap is not None:
+        if lap.learned:
+            factor = lap.factor/ONE
+        lap.update_q(int(x*ONE), int(factor*ONE))
+        x += lap.steer/ONE
+    steer_q = int(x*ONE)
     velocity = BASE_VELOCITY
-    if cc:
-        distance = obstacle_sensor.distance()
-        velocity = BASE_VELOCITY*min(1, max(0, ((distance-100)/200)))
-    drive_robot(velocity_fn(norm(color_left, color_right, driving_sensor.reflection()), velocity, steering_offset))
+    if cc:  # One clock reading per tick, as on the fixed point path
+        now = clock.time()
+        leader = platoon.leader(steering_offset, now) if platoon is not None else -1
+        velocity = cruise.update(obstacle_sensor.distance(), BASE_VELOCITY*factor, now/1000, leader)
+        if platoon is not None:
+            platoon.share(velocity, trace.phase, steering_offset, now)
+    speeds[0], speeds[1] = velocity_fn(x, velocity, steering_offset)
+    drive_robot(speeds)
+
+
+def follow_line_fused(color_line, color_base, driving_sensor, parking_sensor, steering_offset):
+    """Robot follows the line with cc, steering from both sensors. Returns True on a parking stub"""
+    on_line = sensor_on_line(color_line, parking_sensor)
+    global steer_q
+    driving_sensor.reflection()
+    x = steering_offset*steer(tracker.update(color_line, color_base, driving_sensor.raw, on_line, time.time()))
+    steer_q = int(x*ONE)
+    velocity = cruise.update(obstacle_sensor.distance(), BASE_VELOCITY*scheduler.update(x), time.time())
+    speeds[0], speeds[1] = velocity_fn(x, velocity, steering_offset)
+    drive_robot(speeds)
+    return tracker.stub
+
+
+def follow_line_remote(color_left, color_right, driving_sensor, other_sensor, steering_offset):
+    """Robot follows the line with the commands of the remote brain, or with follow_line() while its link is slow"""
+    global steer_q
+    driving_sensor.reflection()
+    healthy = remote.step(clock.time(), driving_sensor.raw, other_sensor.value, obstacle_sensor.distance(),
+                          left_motor.angle(), right_motor.angle(), color_left, color_right, steering_offset)
+    if not healthy:
+        if remote.changed:  # The filters missed the ticks the host drove
+            cruise.reset()
+            scheduler.reset()
+        follow_line(color_left, color_right, driving_sensor, steering_offset, True)
+        return
+    steer_q = remote.steer
+    speeds[0], speeds[1] = remote.speeds
+    drive_robot(speeds)
 
 
 def follow_line_straight(color_left, color_right, color_base, sensor, steering_offset, limit=2):
-    """Follows a line straight to the end of it"""
-    parking_timer = time.time()
+    """Follows a line straight to the end of it. Returns OK, RECOVERED or LOST"""
+    end = clock.time() + int(1000*limit)
 
-    while time.time() - parking_timer < limit:
+    while clock.time() < end:
         follow_line(color_left, color_right, sensor, steering_offset, False)
 
-    stop_on_line(color_base, sensor, (BASE_VELOCITY, BASE_VELOCITY))
+    return stop_on_line(color_base, sensor, (BASE_VELOCITY, BASE_VELOCITY))
 
 
 def stop_before_line(color_line, color_base, sensor, velocity):
-    """Drives robot and stops before the line"""
-    drive_robot(velocity)
-    while True:
+    """Drives robot and stops before the line. Returns OK, RECOVERED or LOST"""
+    def near_line():
         light_refl = sensor.reflection()
-        if abs(color_line-light_refl) < abs(color_base-light_refl):
-            drive_robot((0, 0))
-            return
+        return abs(color_line-light_refl) < abs(color_base-light_refl)
+    return search_line('stop_before_line', near_line, velocity)
 
 
 def stop_past_line(color_line, color_base, sensor, velocity):
-    """Drives robot and stops after the line"""
-    stop_on_line(color_line, sensor, velocity)
-    drive_robot(velocity)
-    while True:
+    """Drives robot and stops after the line. Returns OK, RECOVERED or LOST"""
+    result = stop_on_line(color_line, sensor, velocity)
+
+    def past_line():
         light_refl = sensor.reflection()
-        if abs(color_line-light_refl) > abs(color_base-light_refl):
-            drive_robot((0, 0))
-            return
+        return abs(color_line-light_refl) > abs(color_base-light_refl)
+    past = search_line('stop_past_line', past_line, velocity)
+    return result if past == OK else past
 
 
 def stop_on_line(color_line, sensor, velocity):
-    """Drives robot and stops on the line"""
+    """Drives robot and stops on the line. Returns OK, RECOVERED or LOST"""
+    return search_line('stop_on_line', lambda: sensor_on_line(color_line, sensor), velocity)
+
+
+def drive_until(condition, velocity, limit, distance=None):
+    """Drives until condition() holds or the budget of limit ms and distance deg runs out, then stops.
+    Returns OK, TIMEOUT or DISTANCE
+    """
+    budget.start(limit, distance)
     drive_robot(velocity)
-    while True:
-        if sensor_on_line(color_line, sensor):
+    result = OK
+    while not condition():
+        result = budget.check()
+        if result != OK:
             break
     drive_robot((0, 0))
+    return result
+
+
+def search_line(name, condition, velocity):
+    """Drives until condition() holds, recovers when the maneuver budget runs out. Returns OK, RECOVERED or LOST"""
+    if drive_until(condition, velocity, int(1000*MANEUVER_TIME), MANEUVER_DISTANCE) == OK:
+        return OK
+    start = clock.time()
+    result = recover(condition, velocity, budget.travelled())
+    maneuvers.record(name, result, clock.time() - start)
+    return result
+
+
+def recover(condition, velocity, travelled):
+    """Reverse-and-search sweep for a missed line: retraces the maneuver, then turns in place
+    further each way. Returns RECOVERED or LOST
+    """
+    end = clock.time() + int(1000*RECOVERY_TIME)
+    if drive_until(condition, (-velocity[0], -velocity[1]), end - clock.time(), travelled) == OK:
+        return RECOVERED
+    turn = 1
+    step = SWEEP_STEP
+    while clock.time() < end:
+        if drive_until(condition, (turn*SWEEP_VELOCITY, -turn*SWEEP_VELOCITY), min(step, end - clock.time())) == OK:
+            return RECOVERED
+        turn = -turn
+        step += SWEEP_STEP
+    return LOST
 
 
 # Sensors
 def calibrate():
-    """Calibrates the color sensor"""
-    color_left = left_light.reflection()
-    color_right = right_light.reflection()
+    """Calibrates the color sensor, scales NORM_GAIN for the fixed point path and loads the steering policy"""
+    global NORM_GAIN_Q, policy
+    color_left = color_right = 0
+    for i in range(CALIBRATION_SAMPLES):
+        color_left += left_light.reflection()
+        color_right += right_light.reflection()
+        wait(10)
+    color_left = round(color_left/CALIBRATION_SAMPLES)
+    color_right = round(color_right/CALIBRATION_SAMPLES)
+    NORM_GAIN_Q = int(NORM_GAIN*ONE)  # After load_profile() and any overrides
+    if TABULAR_STEERING and policy is None:
+        policy = load_policy(POLICY_FILE)
+        if policy is None:
+            print("No", POLICY_FILE)
     ev3.speaker.beep()
+    gc.collect()  # Idle, so the collector has no reason to run while driving
     wait(2000)
     return color_left, color_right
 
 
-def sensor_on_line(color_line, sensor, limit=16):
+def sensor_on_line(color_line, sensor, limit=None):
     """Returns true if sensor is on the line"""
-    return abs(sensor.reflection()-color_line) < limit
+    if limit is None:
+        limit = LINE_LIMIT
+    return sensor.near(color_line, limit)
 
 
-# Parking
-def wait_for_client(mbox, msg):
-    """Waits for a matching client message"""
-    while not mbox.read() == msg:
-        wait(1000)
+# Tuning
+def retune():
+    """Swaps in staged parameter updates and recomputes what derives from them, call between ticks.
+    Returns True if there were any
+    """
+    global NORM_GAIN_Q
+    if tuning is None or not tuning.apply():
+        return False
+    NORM_GAIN_Q = int(NORM_GAIN*ONE)
+    return True
+
 
+def delays():
+    """Returns the parking cooldown, reverse delay and parking delay in ms"""
+    return int(1000*PARKING_COOLDOWN), int(1000*REVERSE_DELAY), int(1000*PARKING_DELAY)
 
-def unpark(color_line, color_base, driving_sensor, mbox):
-    """Unparks the robots"""
-    mbox.send(MSG_UNPARK)
-    wait_for_client(mbox, REC_UNPARKED)
+
+# Parking
+def unpark(color_line, color_base, driving_sensor, link):
+    """Unparks the robots, turning out while the other robot unparks. Returns OK, RECOVERED or LOST"""
+    if coordinator is not None:  # Waits in the bay until no other robot maneuvers
+        ev3.light.on(COLOR_WAITING)
+        if coordinator.call(fleet.UNPARK, clock.time, UNPARK_GRANT_TIMEOUT) != DONE:
+            print("No unpark grant")
+        wait(int(1000*CLEAR_TIME))  # A robot that reached the stub meanwhile has asked to park by now
+        if coordinator.call(fleet.CLEAR, clock.time, CLEAR_TIMEOUT) != DONE:
+            print("No clear stub")
+    else:
+        link.request(MSG_UNPARK, REC_UNPARKED, clock.time(), UNPARK_ACK_TIMEOUT)
     ev3.light.on(COLOR_UNPARKING)
 
     color_left, color_right, steering_offset = color_line, color_base, -1
     if driving_sensor == right_light:
         color_left, color_right, steering_offset = color_base, color_line, 1
 
-    stop_before_line(color_line, color_base, driving_sensor, (BASE_VELOCITY*steering_offset, -BASE_VELOCITY*steering_offset))
-    follow_line_straight(color_left, color_right, color_base, driving_sensor, steering_offset, UNPARK_LIMIT)
-    stop_past_line(color_line, color_base, driving_sensor, (BASE_VELOCITY, BASE_VELOCITY))
+    if TRAJECTORY_PARKING:  # Backs out of the bay and turns back to the driving direction
+        gc.collect()
+        if coordinator is None and not link.wait(clock.time):
+            print("No REC_UNPARKED")
+        result = OK if trajectory.unpark(-steering_offset) == OK else LOST
+    else:
+        stop_before_line(color_line, color_base, driving_sensor, (BASE_VELOCITY*steering_offset, -BASE_VELOCITY*steering_offset))
+        gc.collect()  # Standing still until the other robot has unparked
+        if coordinator is None and not link.wait(clock.time):  # Leave anyway rather than block the track
+            print("No REC_UNPARKED")
+        if coordinator is not None and not clear_track(CLEAR_TIMEOUT):  # The lock does not stop robots driving by
+            print("No clear track")
+        follow_line_straight(color_left, color_right, color_base, driving_sensor, steering_offset, UNPARK_LIMIT)
+        result = stop_past_line(color_line, color_base, driving_sensor, (BASE_VELOCITY, BASE_VELOCITY))
+    if coordinator is not None:
+        coordinator.call(fleet.UNPARKED, clock.time)
+    return result
 
 
 def park(color_line, color_base, parking_sensor):
-    """Parks robot"""
+    """Parks robot. Returns OK, RECOVERED or LOST"""
     ev3.light.on(COLOR_PARKING)
     color_left, color_right, steering_offset = color_line, color_base, -1
     if parking_sensor == right_light:
         color_left, color_right, steering_offset = color_base, color_line, 1
 
-    stop_on_line(color_base, parking_sensor, (BASE_VELOCITY, BASE_VELOCITY))
-    follow_line_straight(color_left, color_right, color_base, parking_sensor, steering_offset, PARK_LIMIT)
+    stop_on_line(color_base, parking_sensor, (BASE_VELOCITY, BASE_VELOCITY))  # Past the stub line, where the trajectory starts
+    if TRAJECTORY_PARKING:
+        return OK if trajectory.park(steering_offset) == OK else LOST
+    return follow_line_straight(color_left, color_right, color_base, parking_sensor, steering_offset, PARK_LIMIT)
 
 
 def empty_parking_spot(color_line, driving_sensor):
@@ -190,53 +471,122 @@ def empty_parking_spot(color_line, driving_sensor):
 
     drive_robot(velocity)
     distances = []
-    for i in range(22):
+    for i in range(SCAN_SAMPLES):
         wait(30)
         distances.append(obstacle_sensor.distance())
 
     stop_on_line(color_line, driving_sensor, (velocity[1], velocity[0]))
-    return min(distances) > 200
+    return min(distances) > SCAN_FREE_DISTANCE
 
 
-def parking_mode(color_line, color_base, driving_sensor, parking_sensor, mbox):
+def parking_mode(color_line, color_base, driving_sensor, parking_sensor, link):
     """Attempts to park and unpark the robot. Returns False if parking spot is occupied"""
+    trace.enter(SCAN, clock.time())
+    if platoon is not None:  # The robot behind goes back to the ultrasonic gap at once
+        platoon.share(0, SCAN, 0, clock.time())
+    if coordinator is not None and not lock(fleet.PARK, PARK_GRANT_TIMEOUT):
+        if coordinator.state == FAILED:  # A late grant would hold the lock and a bay until they time out
+            coordinator.call(fleet.CANCEL, clock.time)
+        ev3.light.on(COLOR_PARKING_ENABLED)
+        return False
     if empty_parking_spot(color_line, driving_sensor):
+        trace.enter(PARK, clock.time())
         park(color_line, color_base, parking_sensor)
         ev3.light.on(COLOR_PARKED)
 
-        wait_for_client(mbox, REC_PARKED)
-        mbox.send(MSG_BOTH_PARKED)
-        ev3.light.on(COLOR_BOTH_PARKED)
-
-        wait(random.randint(1, 7)*1000)
-        unpark(color_line, color_base, driving_sensor, mbox)
+        trace.enter(PARKED, clock.time())
+        if TRACE:
+            trace.save(TRACE_FILE)
+        if PROFILER:
+            profiler.save(PROFILER_FILE)
+        if tuning is not None:
+            tuning.check_file()
+        gc.collect()  # Parked, the garbage of the maneuver goes before driving again
+        if coordinator is not None:
+            coordinator.call(fleet.PARKED, clock.time)
+            wait(random.randint(1, 7)*1000)
+        elif link.wait(clock.time):  # MSG_PARK went out when parking was enabled
+            link.send(MSG_BOTH_PARKED)
+            ev3.light.on(COLOR_BOTH_PARKED)
+            wait(random.randint(1, 7)*1000)
+        else:
+            print("No REC_PARKED")
+
+        trace.enter(UNPARK, clock.time())
+        unpark(color_line, color_base, driving_sensor, link)
         return True
+    if coordinator is not None:  # Someone else's spot, the bay goes back too
+        coordinator.call(fleet.CANCEL, clock.time)
+    return False
+
+
+# Fleet
+def lock(verb, timeout):
+    """Stops and asks the coordinator for the maneuver lock. Returns True if granted"""
+    drive_robot((0, 0))
+    ev3.light.on(COLOR_WAITING)
+    return coordinator.call(verb, clock.time, timeout) == DONE
+
+
+def clear_track(timeout):
+    """Stands until the ultrasonic has read no robot within CLEAR_DISTANCE for CLEAR_TIME. Returns False on timeout"""
+    drive_robot((0, 0))
+    end = clock.time() + int(1000*timeout)
+    clear = clock.time()
+    while clock.time() < end:
+        if obstacle_sensor.distance() < CLEAR_DISTANCE:
+            clear = clock.time()
+        elif clock.time() - clear >= int(1000*CLEAR_TIME):
+            return True
+        wait(50)
     return False
 
 
 # Bluetooth
 def connect():
-    """Connects to another robot via Bluetooth"""
+    """Connects to another robot via Bluetooth and returns the mailbox for it, or to the parking coordinator
+    when FLEET_ID is set and returns None
+    """
+    global platoon, tuning, coordinator
     ev3.light.on(COLOR_WAITING)
+    if FLEET_ID is not None:
+        client = BluetoothMailboxClient()
+        coordinator = fleet.FleetClient(TextMailbox(fleet.MAILBOX % FLEET_ID, client))
+        if HOT_RELOAD:  # A client hears only the coordinator, which sends no updates, so the file only
+            tuning = Tuning(globals(), TUNING_FILE)
+        print("Connecting to", FLEET_COORDINATOR, "..")
+        gc.collect()
+        client.connect(FLEET_COORDINATOR)
+        print("Connected..")
+        return None
     server = BluetoothMailboxServer()
     mbox = TextMailbox('greeting', server)
+    if PLATOONING:
+        platoon = SpeedLink(Mailbox(MAILBOX, server))
+    clients = 1
+    if HOT_RELOAD:
+        tuning = Tuning(globals(), TUNING_FILE, TextMailbox(TUNING_MAILBOX, server) if TUNING_HOST else None)
+        clients += TUNING_HOST  # The host connects on its own, the other robot does not relay
     print("Waiting for connection..")
-    server.wait_for_connection()
+    gc.collect()
+    server.wait_for_connection(clients)
     print("Connected..")
     return mbox
 
 
 # Reverse
-def reverse(mode, mbox):
+def reverse(mode, link):
     """Sets new values when reversing"""
     reversed_limit = random.randint(50, 70)
     reverse_mode = False
     if mode == DRIVING_MODE:
         ev3.light.on(COLOR_DRIVING)
-        mbox.send(MSG_UNROTATE)
+        if coordinator is None:
+            link.send(MSG_UNROTATE)
     else:
-        mbox.send(MSG_ROTATE)
-        print("MSG_ROTATE")
+        if coordinator is None:
+            link.send(MSG_ROTATE)
+            print("MSG_ROTATE")
         ev3.light.on(COLOR_REVERSED)
         reversed_limit = random.randint(6, 14)
         reverse_mode = True
@@ -245,29 +595,82 @@ def reverse(mode, mbox):
 
 def main():
     """Main Function"""
+    global lap, remote, stubs
     parking_enabled = False
     reverse_mode = False
+    if PROFILER:
+        profiler.instrument(globals(), PROFILED)
+    if TRACE:
+        trace.start()
+    trace.enter(CALIBRATE, clock.time())
     color_line, color_base = calibrate()  # Left on line, right on base
     mode = DRIVING_MODE
 
     driving_sensor, parking_sensor, color_left, color_right, steering_offset = driving_mode(color_line, color_base, mode)
-    mbox = connect()
+    trace.enter(CONNECT, clock.time())
+    link = Handshake(connect())
     ev3.light.on(COLOR_DRIVING)
+    trace.enter(DRIVING, clock.time())
 
     stop_on_line(color_line, driving_sensor, (BASE_VELOCITY, BASE_VELOCITY))
-
-    timer = time.time()
-    reversed_timer = time.time()
+    if STUB_CLASSIFIER:
+        stubs = StubClassifier(STUB_ODOMETRY)
+        stubs.calibrate(color_line, color_base)
+    if REMOTE_HOST is not None and remote is None:
+        remote = RemoteBrain(SocketLink(REMOTE_HOST, REMOTE_PORT))
+    if LAP_LEARNING:
+        lap = LapLearner(clock, left_motor, right_motor, LAP_LENGTH, mode)
+        lap.resume()
+
+    timer = clock.time()
+    reversed_timer = clock.time()
     reversed_limit = 1000
     has_parked = False
+    cooldown, reverse_delay, parking_delay = delays()  # ms, integer clock comparisons allocate nothing
+    was_on_stub = False
 
     while True:
-        follow_line(color_left, color_right, driving_sensor, steering_offset, True)
+        if ALLOC_CHECK:
+            allocs.start()
+        if FUSED_TRACKING:
+            on_stub = follow_line_fused(color_line, color_base, driving_sensor, parking_sensor, steering_offset)
+        elif remote is not None:
+            follow_line_remote(color_left, color_right, driving_sensor, parking_sensor, steering_offset)
+            on_stub = sensor_on_line(color_line, parking_sensor)
+        else:
+            follow_line(color_left, color_right, driving_sensor, steering_offset, True)
+            on_stub = sensor_on_line(color_line, parking_sensor)
+        now = clock.time()
+        if stubs is not None:
+            travel = (left_motor.angle() + right_motor.angle()) >> 1 if STUB_ODOMETRY else 0
+            on_stub = stubs.update(on_stub, driving_sensor.value, travel)
+        if lap is not None and on_stub and not was_on_stub:
+            lap.landmark()
+        was_on_stub = on_stub
+        if TRACE:
+            trace.row(now, driving_sensor.value, parking_sensor.value, cruise.distance, speeds[0], speeds[1], steer_q)
+        if ALLOC_CHECK:
+            allocs.stop()
+        link.poll(now)  # Collects acks and resends requests while driving, each mailbox read allocates
+        if tuning is not None:  # Between ticks, so a tick sees all of an update or none of it
+            tuning.poll(now)
+            if retune():
+                cooldown, reverse_delay, parking_delay = delays()
 
         # Parking
-        if sensor_on_line(color_line, parking_sensor) and parking_enabled and time.time()-timer > 1.6:
-            parking_enabled = not parking_mode(color_line, color_base, driving_sensor, parking_sensor, mbox)
-            timer = time.time()
+        if on_stub and parking_enabled and now-timer > cooldown:
+            parking_enabled = not parking_mode(color_line, color_base, driving_sensor, parking_sensor, link)
+            timer = clock.time()
+            trace.enter(DRIVING, timer)
+            cruise.reset()
+            scheduler.reset()
+            tracker.reset()
+            if policy is not None:
+                policy.reset()
+            if stubs is not None:
+                stubs.reset()
+            if lap is not None:
+                lap.resume()
             if not parking_enabled:
                 has_parked = True
             if reverse_mode and not parking_enabled:
@@ -276,26 +679,61 @@ def main():
                 ev3.light.on(COLOR_DRIVING)
 
         # Reverse
-        if has_parked and time.time()-timer > 5 or time.time()-reversed_timer > reversed_limit:
+        if has_parked and now-timer > reverse_delay or now-reversed_timer > 1000*reversed_limit:
+            if ALLOC_CHECK:
+                print("Driving ticks:", allocs.ticks, "allocated:", allocs.bytes, "B, worst tick:", allocs.worst, "B")
+                allocs.reset()
+            if MANEUVER_REPORT and maneuvers.failures():
+                maneuvers.report()
+            if remote is not None:
+                remote.report()
+            if coordinator is not None:
+                coordinator.report()
             mode *= -1
             driving_sensor, parking_sensor, color_left, color_right, steering_offset = driving_mode(color_line, color_base, mode)
-            p, reverse_mode = reverse(mode, mbox)
+            p, reverse_mode = reverse(mode, link)
             has_parked = False
             if reversed_limit == 1000:
                 reversed_limit = 8
             else:
                 reversed_limit = 1000
+            trace.enter(ROTATE, clock.time())
+            if platoon is not None:
+                platoon.share(0, ROTATE, 0, clock.time())
+            if coordinator is not None and not lock(fleet.ROTATE, ROTATE_GRANT_TIMEOUT):
+                print("No rotate grant")  # Turning anyway rather than standing on the track
+            if coordinator is not None and not clear_track(CLEAR_TIMEOUT):
+                print("No clear track")
             rotate180()
-            timer = time.time()
-            reversed_timer = time.time()
+            if coordinator is not None:
+                coordinator.call(fleet.ROTATED, clock.time)
+            if tuning is not None:
+                tuning.check_file()
+            trace.enter(DRIVING, clock.time())
+            cruise.reset()
+            scheduler.reset()
+            tracker.reset()
+            if policy is not None:
+                policy.reset()
+            if stubs is not None:
+                stubs.reset()
+            if lap is not None:
+                lap.reverse(mode)
+            timer = clock.time()
+            reversed_timer = clock.time()
             parking_enabled = False
 
         # Enable parking
-        if time.time() - timer > 7 and not parking_enabled and not reverse_mode:
-            mbox.send(MSG_PARK)
+        if now - timer > parking_delay and not parking_enabled and not reverse_mode:
+            if coordinator is None:
+                link.request(MSG_PARK, REC_PARKED, clock.time(), PARK_ACK_TIMEOUT)
             parking_enabled = True
             ev3.light.on(COLOR_PARKING_ENABLED)
 
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    finally:  # Also when the program is stopped from the brick
+        if PROFILER:
+            profiler.save(PROFILER_FILE)
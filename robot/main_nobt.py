@@ -1,10 +1,16 @@
 #!/usr/bin/env pybricks-micropython
+import gc
 import time
 import random
 from pybricks.hubs import EV3Brick
 from pybricks.ev3devices import Motor, ColorSensor, UltrasonicSensor
 from pybricks.parameters import Port, Color
-from pybricks.tools import wait
+from pybricks.tools import wait, StopWatch
+from cruise import CruiseControl
+from scheduler import SpeedScheduler
+from filters import LineSensor
+from maneuver import OK, RECOVERED, LOST, Budget, ManeuverStats
+from fastpath import NATIVE, SHIFT, ONE, norm_q, velocity_q
 
 # Robot definition
 ev3 = EV3Brick()
@@ -14,9 +20,22 @@ left_motor = Motor(Port.B)
 right_motor = Motor(Port.C)
 
 # Sensor definitions
-left_light = ColorSensor(Port.S3)  # S3
+left_light = LineSensor(ColorSensor(Port.S3))  # S3
 obstacle_sensor = UltrasonicSensor(Port.S4)  # S4
-right_light = ColorSensor(Port.S2)  # S2
+right_light = LineSensor(ColorSensor(Port.S2))  # S2
+CALIBRATION_SAMPLES = 20  # Filtered readings averaged per sensor
+
+# Speed control
+cruise = CruiseControl()
+scheduler = SpeedScheduler()
+
+# Fixed point state, so that a driving tick allocates nothing
+clock = StopWatch()  # ms
+speeds = [0, 0]  # deg/s, written by velocity_q()
+
+# Maneuver budgets
+budget = Budget(clock, left_motor, right_motor)
+maneuvers = ManeuverStats()
 
 # Messages
 MSG_PARK = 'park'
@@ -43,6 +62,13 @@ BASE_VELOCITY = 200
 PARK_LIMIT = 5
 UNPARK_LIMIT = 2.5
 
+# Maneuver definitions
+MANEUVER_TIME = 6  # s, budget of a line search before recovering
+MANEUVER_DISTANCE = 1080  # deg of mean wheel travel, budget of a line search
+RECOVERY_TIME = 8  # s, budget of the reverse-and-search sweep
+SWEEP_VELOCITY = 150  # deg/s, wheel speed while turning in place to find the line
+SWEEP_STEP = 600  # ms, each sweep turns this much longer than the last
+
 
 # Driving
 def driving_mode(color_line, color_base, mode):
@@ -86,15 +112,25 @@ def rotate180():
 # Line Following
 def follow_line(color_left, color_right, driving_sensor, steering_offset, cc = True):
     """Robot follows the line with cc"""
+    driving_sensor.reflection()  # Keeps the filter current for the line tests of the maneuvers
+    reflection = driving_sensor.raw  # Steering takes the latest reading, a filter would delay it a tick
+    if NATIVE:  # Fixed point on the brick, allocates nothing
+        x_q = norm_q(color_left, color_right, reflection, ONE)
+        velocity = BASE_VELOCITY
+        if cc:  # Parking maneuvers are timed and keep BASE_VELOCITY
+            velocity = cruise.update_q(obstacle_sensor.distance(), (BASE_VELOCITY*scheduler.update_q(x_q)) >> SHIFT, clock.time())
+        velocity_q(x_q, velocity, steering_offset, speeds)
+        drive_robot(speeds)
+        return
+    x = norm(color_left, color_right, reflection)
     velocity = BASE_VELOCITY
     if cc:
-        distance = obstacle_sensor.distance()
-        velocity = BASE_VELOCITY*min(1, max(0,((distance-100)/200)))
-    drive_robot(velocity_fn(norm(color_left, color_right, driving_sensor.reflection()), velocity, steering_offset))
+        velocity = cruise.update(obstacle_sensor.distance(), BASE_VELOCITY*scheduler.update(x), time.time())
+    drive_robot(velocity_fn(x, velocity, steering_offset))
 
 
 def follow_line_straight(color_left, color_right, color_base, sensor, steering_offset, limit=2):
-    """Follows a line straight to the end of it"""
+    """Follows a line straight to the end of it. Returns OK, RECOVERED or LOST"""
     parking_timer = time.time()
     
     while time.time() - parking_timer < limit:
@@ -103,57 +139,99 @@ def follow_line_straight(color_left, color_right, color_base, sensor, steering_o
     drive_robot((0,0))
     wait(1000)
 
-    stop_on_line(color_base, sensor, (BASE_VELOCITY,BASE_VELOCITY))
+    return stop_on_line(color_base, sensor, (BASE_VELOCITY,BASE_VELOCITY))
 
 
 def stop_before_line(color_line, color_base, sensor, velocity):
-    """Drives robot and stops before the line"""
-    drive_robot(velocity)
-    while True:
+    """Drives robot and stops before the line. Returns OK, RECOVERED or LOST"""
+    def near_line():
         light_refl = sensor.reflection()
-        if abs(color_line-light_refl) < abs(color_base-light_refl):
-            drive_robot((0, 0))
-            return
+        return abs(color_line-light_refl) < abs(color_base-light_refl)
+    return search_line('stop_before_line', near_line, velocity)
 
 
 def stop_past_line(color_line, color_base, sensor, velocity):
-    """Drives robot and stops after the line"""
-    stop_on_line(color_line, sensor, velocity)
-    drive_robot(velocity)
-    while True:
+    """Drives robot and stops after the line. Returns OK, RECOVERED or LOST"""
+    result = stop_on_line(color_line, sensor, velocity)
+
+    def past_line():
         light_refl = sensor.reflection()
-        if abs(color_line-light_refl) > abs(color_base-light_refl):
-            drive_robot((0, 0))
-            return
+        return abs(color_line-light_refl) > abs(color_base-light_refl)
+    past = search_line('stop_past_line', past_line, velocity)
+    return result if past == OK else past
 
 
 def stop_on_line(color_line, sensor, velocity):
-    """Drives robot and stops on the line"""
+    """Drives robot and stops on the line. Returns OK, RECOVERED or LOST"""
+    return search_line('stop_on_line', lambda: sensor_on_line(color_line, sensor), velocity)
+
+
+def drive_until(condition, velocity, limit, distance=None):
+    """Drives until condition() holds or the budget of limit ms and distance deg runs out, then stops.
+    Returns OK, TIMEOUT or DISTANCE
+    """
+    budget.start(limit, distance)
     drive_robot(velocity)
-    while True:
-        if sensor_on_line(color_line, sensor):
+    result = OK
+    while not condition():
+        result = budget.check()
+        if result != OK:
             break
     drive_robot((0, 0))
+    return result
+
+
+def search_line(name, condition, velocity):
+    """Drives until condition() holds, recovers when the maneuver budget runs out. Returns OK, RECOVERED or LOST"""
+    if drive_until(condition, velocity, int(1000*MANEUVER_TIME), MANEUVER_DISTANCE) == OK:
+        return OK
+    start = clock.time()
+    result = recover(condition, velocity, budget.travelled())
+    maneuvers.record(name, result, clock.time() - start)
+    return result
+
+
+def recover(condition, velocity, travelled):
+    """Reverse-and-search sweep for a missed line: retraces the maneuver, then turns in place
+    further each way. Returns RECOVERED or LOST
+    """
+    end = clock.time() + int(1000*RECOVERY_TIME)
+    if drive_until(condition, (-velocity[0], -velocity[1]), end - clock.time(), travelled) == OK:
+        return RECOVERED
+    turn = 1
+    step = SWEEP_STEP
+    while clock.time() < end:
+        if drive_until(condition, (turn*SWEEP_VELOCITY, -turn*SWEEP_VELOCITY), min(step, end - clock.time())) == OK:
+            return RECOVERED
+        turn = -turn
+        step += SWEEP_STEP
+    return LOST
 
 
 # Sensors
 def calibrate():
     """Calibrates the color sensor"""
-    color_left = left_light.reflection()
-    color_right = right_light.reflection()
+    color_left = color_right = 0
+    for i in range(CALIBRATION_SAMPLES):
+        color_left += left_light.reflection()
+        color_right += right_light.reflection()
+        wait(10)
+    color_left = round(color_left/CALIBRATION_SAMPLES)
+    color_right = round(color_right/CALIBRATION_SAMPLES)
     ev3.speaker.beep()
+    gc.collect()  # Idle, so the collector has no reason to run while driving
     wait(2000)
     return color_left, color_right
 
 
 def sensor_on_line(color_line, sensor, limit=15):
     """Returns true if sensor is on the line"""
-    return abs(sensor.reflection()-color_line) < limit
+    return sensor.near(color_line, limit)
 
 
 # Parking
 def unpark(color_line, color_base, driving_sensor):
-    """Unparks the robots"""
+    """Unparks the robots. Returns OK, RECOVERED or LOST"""
     ev3.light.on(COLOR_UNPARKING)
 
     color_left, color_right, steering_offset = color_line, color_base, -1
@@ -162,18 +240,18 @@ def unpark(color_line, color_base, driving_sensor):
 
     stop_before_line(color_line, color_base, driving_sensor, (BASE_VELOCITY*steering_offset, -BASE_VELOCITY*steering_offset))
     follow_line_straight(color_left, color_right, color_base, driving_sensor, steering_offset, UNPARK_LIMIT)
-    stop_past_line(color_line, color_base, driving_sensor, (BASE_VELOCITY, BASE_VELOCITY))
+    return stop_past_line(color_line, color_base, driving_sensor, (BASE_VELOCITY, BASE_VELOCITY))
 
 
 def park(color_line, color_base, parking_sensor):
-    """Parks robot"""
+    """Parks robot. Returns OK, RECOVERED or LOST"""
     ev3.light.on(COLOR_PARKING)
     color_left, color_right, steering_offset = color_line, color_base, -1
     if parking_sensor == right_light:
         color_left, color_right, steering_offset = color_base, color_line, 1
 
     stop_on_line(color_base, parking_sensor, (BASE_VELOCITY, BASE_VELOCITY))
-    follow_line_straight(color_left, color_right, color_base, parking_sensor, steering_offset, PARK_LIMIT)
+    return follow_line_straight(color_left, color_right, color_base, parking_sensor, steering_offset, PARK_LIMIT)
 
 
 def empty_parking_spot(color_line, driving_sensor):
@@ -269,6 +347,8 @@ def main():
         if sensor_on_line(color_line, parking_sensor) and parking_enabled and time.time()-timer > 1.6:
             parking_enabled = not parking_mode(color_line, color_base, driving_sensor, parking_sensor)
             timer = time.time()
+            cruise.reset()
+            scheduler.reset()
             if reverse_mode and not parking_enabled:
                 ev3.light.on(COLOR_REVERSED)
             elif not parking_enabled:
@@ -280,6 +360,8 @@ def main():
             driving_sensor, parking_sensor, color_left, color_right, steering_offset = driving_mode(color_line, color_base, mode)
             reversed_limit, reverse_mode = reverse(mode)
             rotate180()
+            cruise.reset()
+            scheduler.reset()
             reversed_timer = time.time()
             timer = time.time()
             parking_enabled = False
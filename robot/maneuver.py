@@ -0,0 +1,76 @@
+"""Budgets for the line search maneuvers, so a missed line ends in a result instead of a hang"""
+
+# Results
+OK = 0
+TIMEOUT = 1  # The time budget ran out before the line was found
+DISTANCE = 2  # The wheels travelled the distance budget before the line was found
+RECOVERED = 3  # Missed, then found by the recovery search
+LOST = 4  # Missed and not found again
+
+# Budget definitions
+ENCODER_TIME = 50  # ms, between encoder reads, each read slows the sensor loop
+
+
+class Budget:
+    """Time (ms) and wheel travel (deg) allowed for one maneuver"""
+
+    def __init__(self, clock, left_motor, right_motor):
+        self.clock = clock
+        self.left_motor = left_motor
+        self.right_motor = right_motor
+        self.end = self.next_read = 0
+        self.distance = None
+        self.left = self.right = 0
+
+    def start(self, limit, distance=None):
+        """Starts a budget of limit ms and, if given, distance deg of mean wheel travel"""
+        self.end = self.clock.time() + limit
+        self.distance = distance
+        self.next_read = self.clock.time() + ENCODER_TIME
+        self.left = self.left_motor.angle()
+        self.right = self.right_motor.angle()
+
+    def travelled(self):
+        """Returns the mean wheel travel since start() in deg"""
+        return (abs(self.left_motor.angle() - self.left) + abs(self.right_motor.angle() - self.right))//2
+
+    def check(self):
+        """Returns OK while the budget lasts, else TIMEOUT or DISTANCE"""
+        now = self.clock.time()
+        if now >= self.end:
+            return TIMEOUT
+        if self.distance is not None and now >= self.next_read:
+            self.next_read = now + ENCODER_TIME
+            if self.travelled() >= self.distance:
+                return DISTANCE
+        return OK
+
+
+class ManeuverStats:
+    """Missed lines per maneuver and the outcome of their recoveries"""
+
+    def __init__(self):
+        self.missed = {}  # Maneuver name -> missed lines
+        self.recoveries = 0
+        self.lost = 0
+        self.recovery_time = 0  # ms, summed over successful recoveries
+
+    def record(self, name, result, time):
+        """Counts a missed line and the result of recovering from it in time ms"""
+        self.missed[name] = self.missed.get(name, 0) + 1
+        if result == RECOVERED:
+            self.recoveries += 1
+            self.recovery_time += time
+        else:
+            self.lost += 1
+
+    def failures(self):
+        return sum(self.missed.values())
+
+    def mean_recovery(self):
+        """Returns the mean time to recover in s, 0 before the first recovery"""
+        return self.recovery_time/self.recoveries/1000 if self.recoveries else 0
+
+    def report(self):
+        print("Missed lines:", self.failures(), "recovered:", self.recoveries, "lost:", self.lost,
+              "mean recovery: %.1f s" % self.mean_recovery())
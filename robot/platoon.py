@@ -0,0 +1,78 @@
+"""Speed sharing with the other robot for platooning, over a mailbox of its own
+
+Each robot sends its commanded velocity, its main() phase and its driving
+direction every SEND_TIME ms in a MESSAGE_SIZE byte message: the velocity in
+deg/s as two bytes, the phase, the direction and a sequence number that
+tells a new message from the last one read. leader() returns the velocity of
+the other robot while it drives in the same direction and its messages are
+younger than STALE_TIME. The cruise control takes it as feedforward only
+while its ultrasonic sensor has seen a robot ahead within
+PLATOON_LOST_TIME, as the other robot may as well be behind.
+"""
+from recorder import DRIVING
+
+# Link definitions
+MAILBOX = 'speed'
+SEND_TIME = 100  # ms, between messages while the velocity or state stays the same
+POLL_TIME = 50  # ms, between mailbox reads, each read allocates the message
+STALE_TIME = 400  # ms, older shared velocities are ignored
+MESSAGE_SIZE = 5
+MAX_VELOCITY = 0xffff  # deg/s
+
+
+class SpeedLink:
+    """Shares the commanded velocity and state on a raw mailbox and keeps the other robot's"""
+
+    def __init__(self, mbox):
+        self.mbox = mbox
+        self.sent = -1  # Velocity of the last message sent
+        self.state = -1  # Phase and direction of the last message sent
+        self.send_time = 0
+        self.read_time = 0
+        self.sequence = 0
+        self.messages = 0
+
+        # The other robot
+        self.velocity = 0
+        self.phase = -1
+        self.direction = 0
+        self.received = 0  # ms, when its last new message was read
+        self.last = -1  # Its last sequence number
+
+    def share(self, velocity, phase, direction, now):
+        """Sends velocity (deg/s), phase and direction (-1 or 1) at now (ms) if they changed or SEND_TIME passed"""
+        velocity = int(velocity)
+        if velocity < 0:
+            velocity = 0
+        elif velocity > MAX_VELOCITY:
+            velocity = MAX_VELOCITY
+        state = (phase << 1) | (direction > 0)
+        if velocity == self.sent and state == self.state and now - self.send_time < SEND_TIME:
+            return
+        self.sent = velocity
+        self.state = state
+        self.send_time = now
+        self.sequence = (self.sequence + 1) & 0xff
+        self.messages += 1
+        self.mbox.send(bytes((velocity & 0xff, velocity >> 8, phase, direction > 0, self.sequence)))
+
+    def poll(self, now):
+        """Reads the other robot's latest message at most every POLL_TIME ms"""
+        if now - self.read_time < POLL_TIME:
+            return
+        self.read_time = now
+        msg = self.mbox.read()
+        if msg is None or len(msg) != MESSAGE_SIZE or msg[4] == self.last:
+            return
+        self.velocity = msg[0] | (msg[1] << 8)
+        self.phase = msg[2]
+        self.direction = 1 if msg[3] else -1
+        self.last = msg[4]
+        self.received = now
+
+    def leader(self, direction, now):
+        """Returns the other robot's velocity (deg/s) if it is driving in direction with a fresh message, else -1"""
+        self.poll(now)
+        if self.phase != DRIVING or self.direction != direction or now - self.received > STALE_TIME:
+            return -1
+        return self.velocity
@@ -0,0 +1,110 @@
+"""Tabular steering policy trained on the host and loaded as a bytes blob
+
+The state is the bucket of the edge error, the bucket of the previous tick's
+edge error and the bucket of the mean wheel speed commanded in the previous
+tick. The edge error is
+the t of norm(), ERROR_SCALE buckets per unit, and the outermost buckets take
+everything beyond. Each table entry is the turn rate as a signed byte,
+stored with BIAS added.
+
+The blob is MAGIC, ERROR_BINS, ERROR_SCALE, SPEED_BINS and SPEED_STEP as
+bytes, then the table with the speed bucket varying slowest and the error
+bucket fastest. sim/train_policy.py writes it, sim/policy_check.py compares
+it with the cubic of norm().
+"""
+from array import array
+from fastpath import native, SHIFT
+
+# Table definitions
+MAGIC = b'SP'
+HEADER = len(MAGIC) + 4
+ERROR_BINS = 18
+ERROR_SCALE = 6  # Buckets per unit of edge error, the table covers -1.5 to 1.5
+SPEED_BINS = 5
+SPEED_STEP = 80  # deg/s per speed bucket
+STEER_SHIFT = 6  # Turn rate*ONE is the entry shifted left by SHIFT-STEER_SHIFT, entries are 1/64
+BIAS = 128
+
+
+def encode(turn, steer_shift=STEER_SHIFT):
+    """Returns the table byte for a turn rate"""
+    return min(255, max(0, int(round(turn*(1 << steer_shift))) + BIAS))
+
+
+def decode(value, steer_shift=STEER_SHIFT):
+    """Returns the turn rate of a table byte"""
+    return (value - BIAS)/(1 << steer_shift)
+
+
+def pack(table, error_bins=ERROR_BINS, error_scale=ERROR_SCALE, speed_bins=SPEED_BINS, speed_step=SPEED_STEP):
+    """Returns the blob for a table of turn rates indexed [speed][previous][error]"""
+    data = bytearray(MAGIC + bytes((error_bins, error_scale, speed_bins, speed_step)))
+    for rows in table:
+        for row in rows:
+            for turn in row:
+                data.append(encode(turn))
+    return bytes(data)
+
+
+@native
+def error_bucket(color_left, color_right, color_current, scale, bins):
+    """Returns the bucket of the edge error t of norm(), clipped to the table, as SteeringPolicy.steer_q() does"""
+    b = ((2*color_current - color_left - color_right)*scale)//(color_left - color_right) + (bins >> 1)
+    if b < 0:
+        return 0
+    if b >= bins:
+        return bins - 1
+    return b
+
+
+class SteeringPolicy:
+    """Turn rates looked up from a table blob, allocates nothing per tick
+
+    The table is decoded to turn rates*ONE once, so a lookup is the bucket
+    math and one index.
+    """
+
+    def __init__(self, data):
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError('not a steering policy')
+        self.error_bins = data[2]
+        self.error_scale = data[3]
+        self.speed_bins = data[4]
+        self.speed_step = data[5]
+        self.center = self.error_bins >> 1
+        self.size = self.error_bins*self.error_bins
+        if len(data) != HEADER + self.size*self.speed_bins:
+            raise ValueError('truncated steering policy')
+        self.table = array('h', [(value - BIAS) << (SHIFT - STEER_SHIFT) for value in data[HEADER:]])
+        self.reset()
+
+    def reset(self):
+        """Assumes the robot is on the edge, call after maneuvers"""
+        self.row = self.center*self.error_bins  # Offset of the previous error bucket
+
+    @native
+    def steer_q(self, color_left, color_right, color_current, velocity):
+        """Returns the turn rate*ONE for a reading at the mean wheel speed of the last tick, like norm_q()"""
+        b = ((2*color_current - color_left - color_right)*self.error_scale)//(color_left - color_right) + self.center
+        bins = self.error_bins
+        if b < 0:
+            b = 0
+        elif b >= bins:
+            b = bins - 1
+        s = velocity//self.speed_step
+        if s < 0:
+            s = 0
+        elif s >= self.speed_bins:
+            s = self.speed_bins - 1
+        i = s*self.size + self.row + b
+        self.row = b*bins
+        return self.table[i]
+
+
+def load(path):
+    """Returns the policy in a blob file, or None if there is none"""
+    try:
+        with open(path, 'rb') as f:
+            return SteeringPolicy(f.read())
+    except OSError:
+        return None
@@ -0,0 +1,92 @@
+"""Function level profiler: call counts and time per function in preallocated arrays
+
+MicroPython has no cProfile, so instrument() replaces named functions with
+wrappers that count calls and sum their ticks_us durations. Nothing is
+wrapped unless main.py has PROFILER set, so the profiler costs nothing when
+off. Times are inclusive: a wrapped function called by another wrapped
+function counts in both. A wrapper takes the arguments as a tuple and the
+keyword arguments as a dict, which MicroPython allocates on each call, so
+profiling and ALLOC_CHECK do not mix.
+
+Under CPython the clock is time.perf_counter_ns(), so simulated runs write
+the same summary with host timings. sim/profile_check.py prints and
+compares the files.
+"""
+from array import array
+
+try:
+    from utime import ticks_us, ticks_diff
+except ImportError:  # CPython
+    from time import perf_counter_ns
+
+    def ticks_us():
+        return perf_counter_ns()//1000
+
+    def ticks_diff(end, start):
+        return end - start
+
+# Profiler definitions
+FIELDS = ('name', 'calls', 'total_ms', 'mean_us', 'worst_us')
+MAX_FUNCTIONS = 16
+
+
+class Profiler:
+    """Calls, time and worst call per wrapped function"""
+
+    def __init__(self, size=MAX_FUNCTIONS):
+        self.names = []
+        self.calls = array('i', bytearray(4*size))
+        self.ms = array('i', bytearray(4*size))  # Total time, ms and the us below a ms, so long runs do not overflow
+        self.us = array('i', bytearray(4*size))
+        self.worst = array('i', bytearray(4*size))  # us
+        self.size = size
+
+    def wrap(self, fn, name):
+        """Returns fn timed under name"""
+        if len(self.names) == self.size:
+            raise ValueError('More than %d profiled functions' % self.size)
+        i = len(self.names)
+        self.names.append(name)
+        calls, ms, us, worst = self.calls, self.ms, self.us, self.worst
+
+        def timed(*args, **kwargs):
+            start = ticks_us()
+            result = fn(*args, **kwargs)
+            dt = ticks_diff(ticks_us(), start)
+            calls[i] += 1
+            t = us[i] + dt
+            if t >= 1000:
+                ms[i] += t//1000
+                t %= 1000
+            us[i] = t
+            if dt > worst[i]:
+                worst[i] = dt
+            return result
+        return timed
+
+    def instrument(self, namespace, names):
+        """Wraps the functions of namespace, a module's globals(), by name.
+        'obj.method' wraps the method of the object of that name
+        """
+        for name in names:
+            if '.' in name:
+                obj, attr = name.split('.')
+                obj = namespace[obj]
+                try:
+                    setattr(obj, attr, self.wrap(getattr(obj, attr), name))
+                except (AttributeError, TypeError):  # Built-in pybricks types take no attributes
+                    print("Not profiled:", name)
+            else:
+                namespace[name] = self.wrap(namespace[name], name)
+
+    def save(self, path):
+        """Writes the summary as CSV, slowest in total first, call while idle"""
+        rows = []
+        for i, name in enumerate(self.names):
+            total = 1000*self.ms[i] + self.us[i]
+            rows.append((total, name, self.calls[i], self.worst[i]))
+        rows.sort(reverse=True)
+        with open(path, 'w') as f:
+            f.write(','.join(FIELDS) + '\n')
+            for total, name, calls, worst in rows:
+                f.write('%s,%d,%d,%d,%d\n' % (name, calls, total//1000, total//calls if calls else 0, worst))
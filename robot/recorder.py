@@ -0,0 +1,78 @@
+"""Control loop trace kept in a preallocated array and written out in idle phases
+
+Rows are integers: the clock in ms, the main() phase, both filtered
+reflections, the ultrasonic distance in mm, the commanded wheel speeds in
+deg/s and the steering as turn rate*ONE. sim/analysis.py reads the files.
+"""
+from array import array
+
+# Trace definitions
+FIELDS = ('time', 'phase', 'reflection', 'parking', 'distance', 'left', 'right', 'steer')
+WIDTH = len(FIELDS)
+TRACE_SIZE = 8000  # Rows kept between saves, over a minute of driving
+
+# Phases of main()
+PHASES = ('start', 'calibrate', 'connect', 'driving', 'scan', 'park', 'parked', 'unpark', 'rotate')
+START = 0
+CALIBRATE = 1
+CONNECT = 2
+DRIVING = 3
+SCAN = 4
+PARK = 5
+PARKED = 6
+UNPARK = 7
+ROTATE = 8
+
+
+class Trace:
+    """Rows of one run, recorded only after start()"""
+
+    def __init__(self):
+        self.rows = None
+        self.size = 0
+        self.count = 0
+        self.phase = START
+        self.dropped = 0  # Rows lost because the array was full
+        self.saved = False
+
+    def start(self, size=TRACE_SIZE):
+        """Allocates room for size rows"""
+        self.rows = array('i', bytearray(4*WIDTH*size))
+        self.size = size
+
+    def row(self, now, reflection, parking, distance, left, right, steer):
+        """Records one tick, allocates nothing"""
+        if self.rows is None:
+            return
+        if self.count == self.size:
+            self.dropped += 1
+            return
+        rows = self.rows
+        i = self.count*WIDTH
+        rows[i] = now
+        rows[i+1] = self.phase
+        rows[i+2] = int(reflection)
+        rows[i+3] = int(parking)
+        rows[i+4] = distance
+        rows[i+5] = int(left)
+        rows[i+6] = int(right)
+        rows[i+7] = steer
+        self.count += 1
+
+    def enter(self, phase, now):
+        """Starts a phase of main(), with a row that marks when"""
+        self.phase = phase
+        self.row(now, 0, 0, 0, 0, 0, 0)
+
+    def save(self, path):
+        """Appends the recorded rows to a CSV file and empties the array, call while idle"""
+        if self.rows is None:
+            return
+        with open(path, 'a' if self.saved else 'w') as f:
+            if not self.saved:
+                f.write(','.join(FIELDS) + '\n')
+            rows = self.rows
+            for i in range(self.count):
+                f.write(','.join(str(v) for v in rows[i*WIDTH:(i+1)*WIDTH]) + '\n')
+        self.saved = True
+        self.count = 0
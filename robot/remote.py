@@ -0,0 +1,158 @@
+"""Remote brain: the brick streams sensor frames to a host and drives with the motor commands it sends back
+
+A frame is FRAME_SIZE bytes: a sequence number, the clock in ms, the driving
+and the other reflection, the ultrasonic distance in mm, both encoder
+angles, the calibrated line and base reflections and the steering offset. A
+command is COMMAND_SIZE bytes: the sequence number of the frame it answers,
+both wheel speeds in deg/s and the turn rate*ONE, for the trace. Any link
+with send(bytes) and read() carries them, SocketLink over UDP by default.
+
+The brick keeps the send time of every sequence number, so each command
+gives a round trip time, and a frame that gets no command within
+REPLY_TIMEOUT counts as dropped. While commands are late or the filtered
+round trip is over MAX_RTT the brick follows the line itself, and hands
+back to the host after RECOVER_REPLIES good commands in a row.
+sim/brain.py is the host side.
+"""
+from array import array
+
+try:
+    import ustruct as struct
+except ImportError:  # CPython
+    import struct
+
+try:
+    import usocket as socket
+except ImportError:  # CPython
+    import socket
+
+# Link definitions
+PORT = 5005
+FRAME = '<BIBBHiiBBb'
+COMMAND = '<Bhhh'
+FRAME_SIZE = struct.calcsize(FRAME)
+COMMAND_SIZE = struct.calcsize(COMMAND)
+MAX_READS = 8  # Commands read per tick
+REPLY_TIMEOUT = 100  # ms, later commands count as dropped
+MAX_RTT = 50  # ms, a slower filtered round trip hands control back to the brick
+RECOVER_REPLIES = 10  # Good commands in a row before the host drives again
+RTT_SHIFT = 3  # Round trip filter, 1/8 of each new sample
+
+
+class SocketLink:
+    """UDP datagrams to and from a host, never blocks"""
+
+    def __init__(self, host, port=PORT):
+        self.address = socket.getaddrinfo(host, port)[0][-1]
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    def send(self, data):
+        try:
+            self.sock.sendto(data, self.address)
+        except OSError:  # Full buffer or no route, the frame is dropped
+            pass
+
+    def read(self):
+        """Returns the oldest datagram not read yet, None if there is none"""
+        try:
+            return self.sock.recv(64)
+        except OSError:
+            return None
+
+
+def clamp(value):
+    """Returns value as an int in the range of a command field"""
+    return max(-0x8000, min(0x7fff, int(value)))
+
+
+def decode_frame(data):
+    """Returns the fields of a frame, for the host"""
+    return struct.unpack(FRAME, data)
+
+
+def encode_command(sequence, left, right, steer):
+    """Returns a command answering frame sequence, for the host"""
+    return struct.pack(COMMAND, sequence, clamp(left), clamp(right), clamp(steer))
+
+
+class RemoteBrain:
+    """Sends frames, takes the latest command and decides whether the host drives"""
+
+    def __init__(self, link):
+        self.link = link
+        self.frame = bytearray(FRAME_SIZE)
+        self.sent_at = array('i', [-1]*256)  # Send time of each pending sequence number, -1 once answered
+        self.sequence = 0
+        self.speeds = [0, 0]  # deg/s, of the latest command
+        self.steer = 0
+        self.received = -REPLY_TIMEOUT  # ms, when the latest command came
+        self.rtt = 0  # ms, filtered
+        self.good = 0  # Good commands in a row
+        self.healthy = False  # The host drives
+        self.changed = False  # healthy flipped in the last step()
+
+        # Link statistics
+        self.sent = 0
+        self.replies = 0
+        self.dropped = 0
+        self.worst = 0  # ms, longest round trip
+        self.fallbacks = 0
+        self.remote_ticks = 0
+
+    def step(self, now, reflection, other, distance, left_angle, right_angle, color_left, color_right,
+             steering_offset):
+        """Sends a frame and reads commands. Returns True if the host drives this tick, with speeds set"""
+        sequence = self.sequence
+        if self.sent_at[sequence] >= 0:  # Still unanswered a whole sequence ago
+            self.dropped += 1
+        struct.pack_into(FRAME, self.frame, 0, sequence, now, int(reflection), int(other), distance, left_angle,
+                         right_angle, color_left, color_right, steering_offset)
+        self.sent_at[sequence] = now
+        self.link.send(self.frame)
+        self.sent += 1
+        self.sequence = (sequence + 1) & 0xff
+
+        for i in range(MAX_READS):
+            data = self.link.read()
+            if data is None:
+                break
+            if len(data) != COMMAND_SIZE:
+                continue
+            answered, left, right, steer = struct.unpack(COMMAND, data)
+            sent = self.sent_at[answered]
+            if sent < 0:  # Duplicate or answered before
+                continue
+            self.sent_at[answered] = -1
+            rtt = now - sent
+            if rtt > REPLY_TIMEOUT:
+                self.dropped += 1
+                self.good = 0
+                continue
+            self.replies += 1
+            if rtt > self.worst:
+                self.worst = rtt
+            self.rtt += (rtt - self.rtt) >> RTT_SHIFT
+            self.speeds[0] = left
+            self.speeds[1] = right
+            self.steer = steer
+            self.received = now
+            self.good += 1
+
+        healthy = now - self.received <= REPLY_TIMEOUT and self.rtt <= MAX_RTT
+        if not healthy:
+            self.good = 0
+        elif not self.healthy:
+            healthy = self.good >= RECOVER_REPLIES
+        self.changed = healthy != self.healthy
+        if self.changed and not healthy:
+            self.fallbacks += 1
+        self.healthy = healthy
+        if healthy:
+            self.remote_ticks += 1
+        return healthy
+
+    def report(self):
+        """Prints the link statistics"""
+        print("Remote frames:", self.sent, "commands:", self.replies, "dropped:", self.dropped, "rtt:", self.rtt,
+              "ms, worst:", self.worst, "ms, fallbacks:", self.fallbacks, "remote ticks:", self.remote_ticks)
@@ -0,0 +1,58 @@
+"""Speed scheduling from the recent steering history"""
+from fastpath import SHIFT, ONE
+
+# Scheduler definitions
+WINDOW = 60  # norm() outputs kept, about 0.6 s of driving
+TREND = 0.2  # EMA weight of the latest |norm()|, reacts before the window mean
+STRAIGHT_FACTOR = 1.5  # Velocity factor on sustained straights
+CURVE_FACTOR = 0.8  # Velocity factor in tight curves
+STRAIGHT_NORM = 0.1  # |norm()| treated as a straight
+CURVE_NORM = 0.6  # |norm()| treated as a tight curve
+
+# Fixed point definitions, ONE is 1.0
+TREND_Q = int(TREND*ONE)
+STRAIGHT_FACTOR_Q = int(STRAIGHT_FACTOR*ONE)
+CURVE_FACTOR_Q = int(CURVE_FACTOR*ONE)
+STRAIGHT_NORM_Q = int(STRAIGHT_NORM*ONE)
+CURVE_NORM_Q = int(CURVE_NORM*ONE)
+
+
+class SpeedScheduler:
+    """Ring buffer of |norm()| that scales the base velocity, kept in fixed point"""
+
+    def __init__(self, size=WINDOW):
+        self.history = [0] * size
+        self.reset()
+
+    def reset(self):
+        """Assumes a curve until the window has filled with straight driving"""
+        for i in range(len(self.history)):
+            self.history[i] = CURVE_NORM_Q
+        self.index = 0
+        self.total = CURVE_NORM_Q*len(self.history)
+        self.trend = CURVE_NORM_Q
+
+    def update(self, x):
+        """Adds a norm() output and returns the velocity factor"""
+        return self.update_q(int(x*ONE))/ONE
+
+    def update_q(self, x):
+        """Adds a norm() output times ONE and returns the velocity factor times ONE, allocates nothing"""
+        if x < 0:
+            x = -x
+        history = self.history
+        self.total += x - history[self.index]
+        history[self.index] = x
+        self.index += 1
+        if self.index == len(history):
+            self.index = 0
+        self.trend += (TREND_Q*(x-self.trend)) >> SHIFT
+        load = self.total//len(history)
+        if self.trend > load:
+            load = self.trend
+        load = ((load-STRAIGHT_NORM_Q) << SHIFT)//(CURVE_NORM_Q-STRAIGHT_NORM_Q)
+        if load < 0:
+            load = 0
+        elif load > ONE:
+            load = ONE
+        return STRAIGHT_FACTOR_Q - (((STRAIGHT_FACTOR_Q-CURVE_FACTOR_Q)*load) >> SHIFT)
@@ -0,0 +1,92 @@
+"""Parking stub classifier over the last ticks of both color sensors and, optionally, odometry
+
+A single tick of the parking sensor on the line also happens when it
+skims the line in a curve, swings over another part of the track, or reads
+a noisy sample. A real stub is crossed on a straight with the robot tracking
+its edge, and stays under the sensor for a while. So a run of the parking
+sensor on the line counts as a stub once it lasts MIN_TICKS ticks, or
+MIN_TRAVEL deg of mean wheel travel with odometry, read from the motor
+encoders, and if the driving
+sensor's mean edge error over the WINDOW ticks before the run was below
+EDGE_LIMIT. The edge error is |t| of norm(), 0 on the edge and 1 fully on
+the line or base. The window is a ring buffer with a running sum, so a tick
+costs the same for any WINDOW and allocates nothing. sim/stub_check.py
+reports precision and recall on traces.
+"""
+from array import array
+from fastpath import SHIFT, ONE
+
+# Classifier definitions
+WINDOW = 30  # Ticks of driving sensor history, about half a second
+EDGE_LIMIT = 0.8  # Mean edge error over the window, more is a curve or a swing
+MIN_TICKS = 3  # Ticks on the line before a run counts as a stub
+MIN_TRAVEL = 10  # deg of mean wheel travel on the line before a run counts as a stub, with odometry
+
+# Fixed point definitions, ONE is 1.0
+EDGE_LIMIT_Q = int(EDGE_LIMIT*ONE)
+MAX_ERROR_Q = 2*ONE  # Edge errors are cut to this, so one wild reading does not hold the window
+
+
+class StubClassifier:
+    """Tells parking stubs from curve swings and noise, call update() once per driving tick"""
+
+    def __init__(self, odometry=False, window=WINDOW):
+        self.odometry = odometry
+        self.limit = MIN_TRAVEL if odometry else MIN_TICKS
+        self.errors = array('i', bytearray(4*window))
+        self.color_line = 0
+        self.color_base = ONE
+        self.reset()
+
+    def calibrate(self, color_line, color_base):
+        """Sets the line and base reflections the edge error is measured between"""
+        self.color_line = color_line
+        self.color_base = color_base
+
+    def reset(self):
+        """Forgets the history, call after a maneuver"""
+        errors = self.errors
+        for i in range(len(errors)):
+            errors[i] = MAX_ERROR_Q  # No stub until a full window of tracking
+        self.total = MAX_ERROR_Q*len(errors)
+        self.index = 0
+        self.on = False  # The parking sensor is on the line
+        self.run = 0  # Ticks, or deg with odometry, of the parking sensor on the line
+        self.before = 0  # Mean edge error*ONE of the window before the run
+        self.travel = 0  # deg, mean wheel angle at the last tick on the line
+        self.stub = False
+
+    def update(self, on_line, reflection, travel=0):
+        """Takes the parking sensor line test and the driving sensor reflection of a tick, with the mean
+        encoder angle (deg) of the drive motors for odometry. Returns True while on an accepted stub
+        """
+        if on_line:
+            if not self.on:
+                self.on = True
+                self.before = self.total//len(self.errors)
+                self.run = 0
+            elif self.odometry:
+                moved = travel - self.travel
+                self.run += moved if moved > 0 else -moved
+            self.travel = travel
+            if not self.odometry:
+                self.run += 1
+            self.stub = self.run >= self.limit and self.before < EDGE_LIMIT_Q
+            return self.stub
+        self.on = False
+        self.stub = False
+
+        span = self.color_line - self.color_base
+        if span:
+            error = ((2*int(reflection) - self.color_line - self.color_base) << SHIFT)//span
+            if error < 0:
+                error = -error
+            if error > MAX_ERROR_Q:
+                error = MAX_ERROR_Q
+            errors = self.errors
+            self.total += error - errors[self.index]
+            errors[self.index] = error
+            self.index += 1
+            if self.index == len(errors):
+                self.index = 0
+        return False
@@ -0,0 +1,170 @@
+"""Direct ev3dev sysfs I/O for the color sensors, the ultrasonic sensor and the motors
+
+The classes stand in for the pybricks devices used by main.py. Attribute
+files are opened once and read again from offset 0 into a preallocated
+buffer, with os.preadv where the os module has it and seek/readinto on
+MicroPython. Integers are parsed from the buffer without making strings,
+and motor speeds are formatted into a preallocated buffer of fixed width.
+sim/sysfs_check.py runs all of it against a fake sysfs tree.
+"""
+import os
+from pybricks.parameters import Port
+
+try:
+    from os import preadv, pwrite
+    PREAD = True
+except ImportError:  # MicroPython
+    PREAD = False
+
+# Sysfs definitions
+SYSFS_ROOT = '/sys/class'
+SENSOR_CLASS = 'lego-sensor'
+MOTOR_CLASS = 'tacho-motor'
+PORT_PREFIX = 'ev3-ports:'
+ADDRESSES = {Port.S1: 'in1', Port.S2: 'in2', Port.S3: 'in3', Port.S4: 'in4',
+             Port.A: 'outA', Port.B: 'outB', Port.C: 'outC', Port.D: 'outD'}
+BUFFER_SIZE = 16  # bytes, longer than any integer attribute
+SPEED_DIGITS = 5  # Of speed_sp, written as a sign and zero padded digits, which the kernel parses
+MAX_COUNTS = 10**SPEED_DIGITS - 1  # counts/s
+MODE_REFLECT = b'COL-REFLECT'
+MODE_DISTANCE = b'US-DIST-CM'  # value0 is in mm
+RUN_FOREVER = b'run-forever'  # speed_sp changes apply while this runs
+STOP = b'stop'
+
+
+def write_once(path, data):
+    """Writes a setting that is not written again"""
+    attribute = Attribute(path, True)
+    attribute.write(data)
+    attribute.close()
+
+
+def find_device(cls, port, root=SYSFS_ROOT):
+    """Returns the sysfs directory of the device on a port"""
+    address = PORT_PREFIX + ADDRESSES[port]
+    base = root + '/' + cls
+    for name in os.listdir(base):
+        with open(base + '/' + name + '/address') as f:
+            if f.read().strip().startswith(address):
+                return base + '/' + name
+    raise OSError('No ' + cls + ' on ' + address)
+
+
+class Attribute:
+    """One sysfs attribute file, kept open"""
+
+    def __init__(self, path, writable=False):
+        self.buffer = bytearray(BUFFER_SIZE)
+        if PREAD:
+            self.fd = os.open(path, os.O_RDWR if writable else os.O_RDONLY)
+            self.views = [memoryview(self.buffer)]
+        else:
+            self.file = open(path, 'r+b' if writable else 'rb')
+
+    def read_int(self):
+        """Reads the attribute and returns it as an integer"""
+        if PREAD:
+            n = preadv(self.fd, self.views, 0)
+        else:
+            self.file.seek(0)
+            n = self.file.readinto(self.buffer)
+        buffer = self.buffer
+        value = 0
+        sign = 1
+        for i in range(n):
+            c = buffer[i]
+            if c == 45:  # -
+                sign = -1
+            elif 48 <= c <= 57:
+                value = value*10 + c - 48
+        return sign*value
+
+    def write(self, data):
+        """Writes bytes to the attribute in one call, as sysfs expects"""
+        if PREAD:
+            pwrite(self.fd, data, 0)
+        else:
+            self.file.seek(0)
+            self.file.write(data)
+
+    def close(self):
+        if PREAD:
+            os.close(self.fd)
+        else:
+            self.file.close()
+
+
+class ColorSensor:
+    """EV3 color sensor in reflection mode"""
+
+    def __init__(self, port, root=SYSFS_ROOT):
+        path = find_device(SENSOR_CLASS, port, root)
+        write_once(path + '/mode', MODE_REFLECT)
+        self.value = Attribute(path + '/value0')
+
+    def reflection(self):
+        """Returns the reflection, 0-100"""
+        return self.value.read_int()
+
+
+class UltrasonicSensor:
+    """EV3 ultrasonic sensor in continuous distance mode"""
+
+    def __init__(self, port, root=SYSFS_ROOT):
+        path = find_device(SENSOR_CLASS, port, root)
+        write_once(path + '/mode', MODE_DISTANCE)
+        self.value = Attribute(path + '/value0')
+
+    def distance(self):
+        """Returns the distance in mm"""
+        return self.value.read_int()
+
+
+class Motor:
+    """Tacho motor run at a speed, writes only when the speed changes"""
+
+    def __init__(self, port, root=SYSFS_ROOT):
+        path = find_device(MOTOR_CLASS, port, root)
+        counts = Attribute(path + '/count_per_rot')
+        self.counts = counts.read_int()
+        counts.close()
+        self.speed_sp = Attribute(path + '/speed_sp', True)
+        self.command = Attribute(path + '/command', True)
+        self.position = Attribute(path + '/position')
+        self.velocity = Attribute(path + '/speed')
+        self.encoded = bytearray(1 + SPEED_DIGITS)  # speed_sp as written, formatted in place
+        self.target = None
+        self.running = False
+
+    def run(self, speed):
+        """Runs at speed deg/s"""
+        counts = int(speed)*self.counts//360
+        if counts != self.target:
+            self.target = counts
+            encoded = self.encoded
+            encoded[0] = 45 if counts < 0 else 43  # - or +
+            if counts < 0:
+                counts = -counts
+            if counts > MAX_COUNTS:
+                counts = MAX_COUNTS
+            for i in range(SPEED_DIGITS, 0, -1):
+                encoded[i] = 48 + counts % 10
+                counts //= 10
+            self.speed_sp.write(encoded)
+        if not self.running:
+            self.command.write(RUN_FOREVER)
+            self.running = True
+
+    def stop(self):
+        self.command.write(STOP)
+        self.running = False
+        self.target = None
+
+    def angle(self):
+        """Returns the rotation in deg"""
+        return self.position.read_int()*360//self.counts
+
+    def speed(self):
+        """Returns the speed in deg/s"""
+        return self.velocity.read_int()*360//self.counts
+
@@ -0,0 +1,95 @@
+"""Line tracking from both color sensors, lateral offset and heading estimated every tick
+
+Offsets are in cm from the driving sensor to the line center, positive
+towards the parking sensor. The driving sensor follows the line edge, where
+half its spot covers the line. Its reading gives the offset inside the edge
+band and only bounds it elsewhere, so the estimate remembers which side the
+line was left on. The parking sensor finds the line when the robot has
+drifted a full sensor spacing off, and otherwise marks parking stubs: a line
+under the parking sensor while the driving sensor still tracks its edge.
+"""
+
+# Geometry definitions
+LINE_WIDTH = 1.8  # cm
+FOOTPRINT = 2.0  # cm, width of the color sensor spot
+SENSOR_SPACING = 14  # cm, between the color sensors
+EDGE_LOW = 0.25  # Line coverage of the spot below this means no line, above faint marks
+EDGE_HIGH = 0.9  # Line coverage above this means fully on the line
+EDGE = max(LINE_WIDTH, FOOTPRINT)/2  # cm, offset at half coverage
+BAND = min(LINE_WIDTH, FOOTPRINT)/2  # cm, half width of the edge band
+
+# Tracking definitions
+OFFSET_ALPHA = 0.6  # Weight of an edge measurement
+RATE_BETA = 0.05  # Weight of an edge measurement in the offset rate
+RATE_DECAY = 0.98  # Per tick, forgets the offset rate while no edge is seen
+RATE_GAIN = 0.02  # s, offset rate added to the offset error
+GATE = 2.0  # cm, edge measurements this far from a lost estimate are marks, not the line
+STUB_TRACKING = 1.5  # cm, offset error that still counts as tracking the edge
+STALE_TIME = 0.05  # s, a longer pause between updates restarts the tracker
+
+
+class LineTracker:
+    """Alpha-beta estimate of the line offset, steering and parking stubs from it"""
+
+    def __init__(self):
+        self.time = None
+        self.reset()
+
+    def reset(self):
+        """Assumes the driving sensor is on the edge, call after maneuvers"""
+        self.offset = EDGE
+        self.side = 1  # Side of the line the driving sensor is on
+        self.rate = 0
+        self.lost = False
+        self.stub = False
+
+    def coverage(self, color_line, color_base, reflection):
+        """Returns the fraction of the sensor spot on the line, 0 to 1"""
+        f = (color_base-reflection)/(color_base-color_line)
+        return min(1, max(0, f))
+
+    def update(self, color_line, color_base, driving, parking, now):
+        """Takes the driving sensor reflection and whether the parking sensor is on a line,
+        returns the offset error in edge band widths between -1 and 1, positive to increase the offset
+        """
+        dt = 0 if self.time is None else now - self.time
+        self.time = now
+        if dt > STALE_TIME:
+            self.reset()
+            dt = 0
+
+        predicted = self.offset + self.rate*dt
+        f = self.coverage(color_line, color_base, driving)
+        inner = EDGE + BAND - 2*BAND*EDGE_HIGH
+        outer = EDGE + BAND - 2*BAND*EDGE_LOW
+
+        measured = self.side*(EDGE + BAND - 2*BAND*f)
+        if EDGE_LOW < f < EDGE_HIGH and self.lost and abs(measured-predicted) > GATE:
+            f = 0  # Still lost
+
+        if f <= EDGE_LOW:  # Off the line, on the side it was left on
+            offset = predicted
+            if self.side*offset < outer:
+                offset = self.side*outer
+            if parking:  # Drifted so far that the parking sensor finds the line
+                offset = SENSOR_SPACING
+                self.side = 1
+            self.rate *= RATE_DECAY
+            self.lost = True
+        elif f >= EDGE_HIGH:  # Fully on the line, the only way to cross it
+            offset = min(inner, max(-inner, predicted))
+            self.side = 1 if offset >= 0 else -1
+            self.rate *= RATE_DECAY
+            self.lost = False
+        else:  # On the edge of the current side
+            offset = predicted + OFFSET_ALPHA*(measured-predicted)
+            if dt > 0:
+                self.rate += RATE_BETA*(measured-predicted)/dt
+            self.lost = False
+
+        self.offset = offset
+        self.stub = parking and not self.lost and abs(offset-EDGE) < STUB_TRACKING
+        if self.lost:  # Turn back towards the line as hard as the edge follower does
+            return -self.side
+        t = (EDGE - offset - RATE_GAIN*self.rate)/BAND
+        return min(1, max(-1, t))
@@ -0,0 +1,130 @@
+"""Parking maneuvers along encoder trajectories, straight runs and turns in place with trapezoidal speed profiles
+
+A segment is a distance of mean wheel travel in motor degrees with a
+direction for each wheel, both forward for a straight run, opposite for a
+turn in place. The wheel speed ramps up at ACCELERATION from MIN_VELOCITY,
+cruises and ramps down to stop on the distance, so a segment takes the
+same time at any BASE_VELOCITY and from any battery level. The faster wheel
+is slowed by SYNC_GAIN per degree it is ahead, which keeps straight runs
+straight and turns on the spot under motor mismatch.
+
+Bay geometry is in mm and deg of heading: the robot drives BAY_OFFSET past
+the far edge of the stub line, turns TURN_ANGLE towards the bay and drives
+BAY_DEPTH into it. Unparking backs out and turns back, and the line follower
+takes over. The line sensors only correct: the far edge of the stub line,
+where the parking sensor leaves it, is where the trajectory starts.
+"""
+from pybricks.tools import wait
+from cruise import MM_PER_DEG
+from maneuver import OK, TIMEOUT
+
+# Geometry definitions
+AXLE_TRACK = 152  # mm between the wheels
+TURN_ANGLE = 90  # deg of heading between the track and a bay
+BAY_OFFSET = 170  # mm past the far edge of the stub line to the turn
+BAY_DEPTH = 170  # mm from the track into the bay
+
+# Profile definitions
+VELOCITY = 500  # deg/s, cruise wheel speed of straight runs
+TURN_VELOCITY = 300  # deg/s, cruise wheel speed of turns
+MIN_VELOCITY = 60  # deg/s, at the ends of the ramps
+ACCELERATION = 1500  # deg/s^2
+SYNC_GAIN = 4  # deg/s taken off the wheel that is ahead, per deg
+STEP_TIME = 10  # ms, between speed updates
+SLACK = 2  # A segment that takes this many times its profile time has stalled
+
+
+def wheel_travel(mm):
+    """Returns the motor deg for mm of wheel travel"""
+    return int(mm/MM_PER_DEG)
+
+
+def turn_travel(angle):
+    """Returns the motor deg of each wheel for a turn in place of angle deg of heading"""
+    return wheel_travel(3.14159*AXLE_TRACK*angle/360)
+
+
+def profile_time(distance, velocity):
+    """Returns the ms a segment of distance deg takes at a cruise velocity in deg/s"""
+    ramp = (velocity*velocity - MIN_VELOCITY*MIN_VELOCITY)/(2*ACCELERATION)  # deg of one ramp
+    if 2*ramp > distance:  # Never reaches cruise
+        peak = (MIN_VELOCITY*MIN_VELOCITY + ACCELERATION*distance)**0.5
+        return int(2000*(peak - MIN_VELOCITY)/ACCELERATION)
+    return int(2000*(velocity - MIN_VELOCITY)/ACCELERATION + 1000*(distance - 2*ramp)/velocity)
+
+
+def park_time():
+    """Returns the ms Trajectory.park() takes on its profiles"""
+    return profile_time(wheel_travel(BAY_OFFSET), VELOCITY) + unpark_time()
+
+
+def unpark_time():
+    """Returns the ms Trajectory.unpark() takes on its profiles"""
+    return profile_time(wheel_travel(BAY_DEPTH), VELOCITY) + profile_time(turn_travel(TURN_ANGLE), TURN_VELOCITY)
+
+
+class Trajectory:
+    """Runs segments on the two drive motors, see segment()"""
+
+    def __init__(self, clock, left_motor, right_motor):
+        self.clock = clock
+        self.left_motor = left_motor
+        self.right_motor = right_motor
+        self.stalls = 0
+
+    def segment(self, left, right, distance, velocity):
+        """Drives distance deg of mean wheel travel with wheel directions left and right (1 or -1) at up to
+        velocity deg/s. Returns OK or TIMEOUT
+        """
+        left_motor, right_motor = self.left_motor, self.right_motor
+        left_start, right_start = left_motor.angle(), right_motor.angle()
+        end = self.clock.time() + SLACK*profile_time(distance, velocity) + 100*STEP_TIME
+        vv = velocity*velocity
+        floor = MIN_VELOCITY*MIN_VELOCITY
+        result = OK
+        while True:
+            left_travel = abs(left_motor.angle() - left_start)
+            right_travel = abs(right_motor.angle() - right_start)
+            travelled = (left_travel + right_travel)//2
+            if travelled >= distance:
+                break
+            if self.clock.time() > end:
+                self.stalls += 1
+                result = TIMEOUT
+                break
+            v = min(vv, floor + 2*ACCELERATION*travelled, floor + 2*ACCELERATION*(distance - travelled))**0.5
+            ahead = SYNC_GAIN*(left_travel - right_travel)
+            left_speed = v - max(ahead, 0)
+            right_speed = v - max(-ahead, 0)
+            left_motor.run(left*max(left_speed, 0))
+            right_motor.run(right*max(right_speed, 0))
+            wait(STEP_TIME)
+        left_motor.run(0)
+        right_motor.run(0)
+        return result
+
+    def straight(self, mm):
+        """Drives mm forward, backward if negative. Returns OK or TIMEOUT"""
+        sign = 1 if mm > 0 else -1
+        return self.segment(sign, sign, wheel_travel(abs(mm)), VELOCITY)
+
+    def turn(self, angle):
+        """Turns in place angle deg, positive to the right. Returns OK or TIMEOUT"""
+        sign = 1 if angle > 0 else -1
+        return self.segment(sign, -sign, turn_travel(abs(angle)), TURN_VELOCITY)
+
+    def park(self, side):
+        """Drives from the far edge of the stub line into the bay on side (1 right, -1 left). Returns OK or TIMEOUT"""
+        result = self.straight(BAY_OFFSET)
+        if result == OK:
+            result = self.turn(side*TURN_ANGLE)
+        if result == OK:
+            result = self.straight(BAY_DEPTH)
+        return result
+
+    def unpark(self, side):
+        """Backs out of the bay on side and turns back to the driving direction. Returns OK or TIMEOUT"""
+        result = self.straight(-BAY_DEPTH)
+        if result == OK:
+            result = self.turn(-side*TURN_ANGLE)
+        return result
@@ -0,0 +1,95 @@
+"""Parameter updates at runtime, from a file checked while idle or from a mailbox
+
+Updates name definitions of main.py like load_profile() does: a file holds a
+JSON object of names and values, a mailbox message holds NAME=value pairs
+separated by spaces. Numbers replace numbers, other values only values of
+their own type. Updates are only staged when they arrive. apply() swaps all
+of them in at once, and main.py calls it between ticks and then recomputes
+what it derives from the definitions, so no tick sees half an update.
+"""
+import json
+import os
+
+# Tuning definitions
+POLL_TIME = 250  # ms, between mailbox reads, each read allocates the message
+
+
+class Tuning:
+    """Staged updates of the definitions in namespace, a module's globals()"""
+
+    def __init__(self, namespace, path, mbox=None):
+        self.namespace = namespace
+        self.path = path
+        self.mbox = mbox
+        self.mtime = self.modified()  # The file as it is at start is load_profile()'s business
+        self.last = None  # Last mailbox message, read() keeps returning it
+        self.read_time = 0
+        self.pending = {}
+        self.updates = 0  # Updates applied
+
+    def modified(self):
+        """Returns the modification time of the file, None if there is none"""
+        try:
+            return os.stat(self.path)[8]
+        except OSError:
+            return None
+
+    def stage(self, name, value):
+        """Stages one update, returns False for unknown names and values of the wrong type"""
+        if not name.isupper() or name not in self.namespace:
+            print("Unknown parameter", name)
+            return False
+        current = self.namespace[name]
+        if isinstance(current, bool) or isinstance(value, bool) or not isinstance(current, (int, float)):
+            ok = type(value) == type(current)
+        else:
+            ok = isinstance(value, (int, float))  # An int definition may take a fraction, as profile.json can
+        if not ok:
+            print("Bad value for", name)
+            return False
+        self.pending[name] = value
+        return True
+
+    def check_file(self):
+        """Stages the file's updates if it changed since the last check, call while idle"""
+        mtime = self.modified()
+        if mtime is None or mtime == self.mtime:
+            return
+        self.mtime = mtime
+        try:
+            with open(self.path) as f:
+                updates = json.load(f)
+        except (OSError, ValueError):
+            print("Bad", self.path)
+            return
+        for name, value in updates.items():
+            self.stage(name, value)
+
+    def poll(self, now):
+        """Stages the updates of a new mailbox message, reads at most every POLL_TIME ms"""
+        if self.mbox is None or now - self.read_time < POLL_TIME:
+            return
+        self.read_time = now
+        msg = self.mbox.read()
+        if msg is None or msg == self.last:
+            return
+        self.last = msg
+        for pair in msg.split():
+            name, _, value = pair.partition('=')
+            try:
+                value = json.loads(value)
+            except ValueError:
+                print("Bad value for", name)
+                continue
+            self.stage(name, value)
+
+    def apply(self):
+        """Swaps in every staged update, call between ticks. Returns True if there were any"""
+        if not self.pending:
+            return False
+        for name, value in self.pending.items():
+            self.namespace[name] = value
+            print("Tuned", name, value)
+        self.updates += len(self.pending)
+        self.pending = {}
+        return True
@@ -0,0 +1,129 @@
+"""Heap allocations per driving tick of robot/main.py, counted as MicroPython would make them
+
+CPython allocates every int, so its own allocation counts say nothing about
+the brick. Instead a tracer follows the script's frames during a mission
+and counts the values that are heap objects under MicroPython: floats, ints
+beyond the 31 bit small int range, and strings, bytes, tuples, lists and
+dicts made during the tick. Temporaries that never reach a variable or a
+return value are not seen. The polls main() makes after the tick, of the
+handshake and tuning mailboxes, fall outside the ALLOC_CHECK window on the
+brick and are counted apart. On the brick, ALLOC_CHECK in robot/main.py
+reads gc.mem_alloc() instead.
+"""
+import collections
+import gc
+import numbers
+import os
+import threading
+
+import mission
+import world
+
+ROBOT_DIR = os.path.join(world.REPO_DIR, 'robot')
+
+# Check definitions
+DURATION = 60  # s, tracing every line is slow
+SMALL_INT = 1 << 30
+EVENTS = ('parking_mode', 'reverse', 'rotate180', 'request')  # Calls that make a tick a maneuver
+
+
+class Tracer:
+    """Counts heap values per main() loop iteration, split into driving ticks and maneuvers"""
+
+    def __init__(self):
+        self.old = None  # Ids of containers made before the first tick
+        self.values = None  # Heap values of the current tick, kept alive so ids stay unique
+        self.polled = []  # Heap values of main()'s mailbox polls in the current iteration
+        self.poll = None  # Frame of the poll in progress
+        self.seen = set()
+        self.event = False
+        self.driving = []
+        self.maneuvers = []
+        self.polls = []  # Heap values of the polls per driving iteration
+        self.kinds = collections.Counter()  # Type names over driving ticks
+
+    def heap(self, value):
+        """Returns True if MicroPython would hold value on the heap"""
+        if value is None or isinstance(value, bool):
+            return False
+        if isinstance(value, numbers.Integral):
+            return not -SMALL_INT <= value < SMALL_INT
+        if isinstance(value, numbers.Real):
+            return True
+        return isinstance(value, (str, bytes, bytearray, tuple, list, dict)) and id(value) not in self.old
+
+    def check(self, value, values):
+        if id(value) not in self.seen and self.heap(value):
+            self.seen.add(id(value))
+            values.append(value)
+
+    def tick(self):
+        """Closes the previous loop iteration and opens the next"""
+        if self.values is None:
+            self.old = {id(o) for o in gc.get_objects()}
+        elif self.event:
+            self.maneuvers.append(len(self.values))
+        else:
+            self.driving.append(len(self.values))
+            self.polls.append(len(self.polled))
+            self.kinds.update(type(v).__name__ for v in self.values)
+        self.values = []
+        self.polled = []
+        self.seen.clear()
+        self.event = False
+
+    def trace(self, frame, event, arg):
+        if event == 'call':
+            code = frame.f_code
+            if not code.co_filename.startswith(ROBOT_DIR):
+                return None
+            if code.co_name == 'follow_line' and frame.f_back.f_code.co_name == 'main':
+                self.tick()
+            elif code.co_name == 'poll' and frame.f_back.f_code.co_name == 'main':
+                self.poll = frame
+            elif code.co_name in EVENTS:
+                self.event = True
+            return self.trace
+        if self.values is not None and event in ('line', 'return'):
+            values = self.polled if frame is self.poll else self.values
+            for value in frame.f_locals.values():
+                self.check(value, values)
+            if event == 'return':
+                self.check(arg, values)
+                if frame is self.poll:
+                    self.poll = None
+        return self.trace
+
+
+def run(native):
+    """Returns the tracer after a traced mission on the fixed point or the float path"""
+    tracer = Tracer()
+
+    def setup(module):
+        module.NATIVE = native
+        threading.settrace(tracer.trace)  # The robot threads start with the mission
+
+    try:
+        metrics = mission.run_mission(duration=DURATION, setup=setup)
+    finally:
+        threading.settrace(None)
+    if metrics['error']:
+        raise RuntimeError(metrics['error'])
+    return tracer
+
+
+def main():
+    """Prints heap values per driving tick for both control paths, and those of the polls after the ticks"""
+    print('%-12s %8s %12s %10s %10s %12s  %s' % ('path', 'ticks', 'values/tick', 'worst', 'maneuvers', 'poll values',
+                                                 'types'))
+    for name, native in (('fixed point', True), ('float', False)):
+        tracer = run(native)
+        ticks = max(1, len(tracer.driving))
+        kinds = ', '.join('%s %.1f' % (kind, count/ticks) for kind, count in tracer.kinds.most_common())
+        print('%-12s %8d %12.2f %10d %10d %12d  %s' % (name, len(tracer.driving), sum(tracer.driving)/ticks,
+                                                       max(tracer.driving, default=0), len(tracer.maneuvers),
+                                                       sum(tracer.polls), kinds or '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""Trace analytics: lap time, steering oscillation, overshoot after curves, main() phases and parking cycles
+
+Traces are the CSV files robot/main.py writes with TRACE on, from the robot
+or from simulated missions. Run from the repository root:
+
+    python sim/analysis.py record runs/base --seeds 4
+    python sim/analysis.py record runs/fast --seeds 4 --param BASE_VELOCITY=300
+    python sim/analysis.py compare runs/base runs/fast
+
+record runs missions into a directory of traces, compare analyzes every
+trace of the given directories on a process pool and prints one row per
+directory.
+"""
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import mission
+import world
+
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+from cruise import MM_PER_DEG  # noqa: E402
+from fastpath import ONE  # noqa: E402
+from recorder import FIELDS, PHASES, DRIVING, SCAN, PARK, PARKED, UNPARK  # noqa: E402
+
+# Analysis definitions
+GAP_TIME = 0.1  # s, a longer pause between driving rows splits a segment
+SMOOTH_TIME = 0.4  # s, moving average window that separates oscillation from curves
+CURVE_STEER = 0.2  # Smoothed turn rate that counts as a curve
+CURVE_TIME = 0.5  # s, shorter turns are not curves
+OVERSHOOT_TIME = 1.0  # s after a curve searched for steering the other way
+CYCLE_PHASES = (SCAN, PARK, PARKED, UNPARK)
+
+
+def load(path):
+    """Returns the trace columns by name with time in s and steer as turn rate, and the poses if there are any"""
+    data = np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+    trace = {name: data[:, i] for i, name in enumerate(FIELDS)}
+    trace['time'] = trace['time']/1000
+    trace['phase'] = trace['phase'].astype(int)
+    trace['steer'] = trace['steer']/ONE
+    poses = None
+    if os.path.exists(mission.pose_path(path)):
+        poses = np.loadtxt(mission.pose_path(path), delimiter=',', skiprows=1, ndmin=2)
+        poses[:, 0] /= 1000
+    return trace, poses
+
+
+def phase_times(trace):
+    """Returns the time spent in each main() phase in s"""
+    dt = np.diff(trace['time'], append=trace['time'][-1])
+    return np.bincount(trace['phase'], weights=dt, minlength=len(PHASES))
+
+
+def segments(trace):
+    """Returns (start, end) row slices of uninterrupted driving"""
+    driving = trace['phase'] == DRIVING
+    breaks = np.diff(trace['time']) > GAP_TIME
+    edges = np.flatnonzero((np.diff(driving.astype(int)) != 0) | breaks) + 1
+    bounds = np.concatenate(([0], edges, [len(driving)]))
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if driving[a] and b - a > 2]
+
+
+def smooth(t, x, window):
+    """Returns the centered moving average of x over window s, for irregular sample times"""
+    total = np.concatenate(([0], np.cumsum(x)))
+    lo = np.searchsorted(t, t - window/2)
+    hi = np.searchsorted(t, t + window/2, side='right')
+    return (total[hi] - total[lo])/(hi - lo)
+
+
+def oscillation(t, steer):
+    """Returns zero crossings, duration and sum of squares of the steering around its moving average"""
+    wobble = steer - smooth(t, steer, SMOOTH_TIME)
+    crossings = np.count_nonzero(np.diff(np.signbit(wobble)))
+    return crossings, t[-1] - t[0], float(wobble @ wobble), len(wobble)
+
+
+def overshoots(t, steer):
+    """Returns the opposite steering peak after each curve relative to the mean steering in the curve"""
+    trend = smooth(t, steer, SMOOTH_TIME)
+    curve = np.abs(trend) > CURVE_STEER
+    edges = np.flatnonzero(np.diff(curve.astype(int))) + 1
+    bounds = np.concatenate(([0], edges, [len(curve)]))
+    ratios = []
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        if not curve[a] or b == len(curve) or t[b-1] - t[a] < CURVE_TIME:
+            continue
+        level = trend[a:b].mean()
+        after = trend[b:np.searchsorted(t, t[b-1] + OVERSHOOT_TIME)]
+        ratios.append(max(0.0, float((-np.sign(level)*after).max(initial=0)))/abs(level))
+    return ratios
+
+
+def driven(trace, poses, parts):
+    """Returns the distance driven in cm over the driving segments, from poses when the trace has them"""
+    if poses is not None:
+        step = np.hypot(np.diff(poses[:, 1]), np.diff(poses[:, 2]))
+        inside = np.zeros(len(step), dtype=bool)
+        for a, b in parts:
+            inside |= (poses[1:, 0] > trace['time'][a]) & (poses[1:, 0] <= trace['time'][b-1])
+        return float(step[inside].sum())
+    distance = 0.0
+    for a, b in parts:
+        t = trace['time'][a:b]
+        speed = (trace['left'][a:b] + trace['right'][a:b])/2*MM_PER_DEG/10
+        distance += float(speed[:-1] @ np.diff(t))
+    return distance
+
+
+def cycles(trace):
+    """Returns the durations of the scan, park, parked and unpark phases of every parking cycle"""
+    changes = np.flatnonzero(np.diff(trace['phase'], prepend=-1))
+    phases = trace['phase'][changes]
+    durations = np.diff(trace['time'][changes], append=trace['time'][-1])
+    result = []
+    for i in np.flatnonzero(phases == SCAN):
+        parts = dict.fromkeys(CYCLE_PHASES, 0.0)
+        j = i
+        while j < len(phases) and phases[j] in CYCLE_PHASES:
+            parts[phases[j]] += durations[j]
+            j += 1
+        if j < len(phases):  # Finished
+            result.append([parts[phase] for phase in CYCLE_PHASES])
+    return result
+
+
+def analyze(job):
+    """Returns the metrics of one trace"""
+    path, track_length = job
+    trace, poses = load(path)
+    parts = segments(trace)
+    crossings, duration, squares, samples = 0, 0.0, 0.0, 0
+    ratios = []
+    for a, b in parts:
+        t, steer = trace['time'][a:b], trace['steer'][a:b]
+        c, d, s, n = oscillation(t, steer)
+        crossings, duration, squares, samples = crossings + c, duration + d, squares + s, samples + n
+        ratios += overshoots(t, steer)
+    distance = driven(trace, poses, parts)
+    finished = cycles(trace)
+    return {
+        'lap_time': track_length*duration/distance if distance > 0 else np.inf,
+        'frequency': crossings/2/duration if duration > 0 else 0.0,
+        'amplitude': np.sqrt(2*squares/samples) if samples else 0.0,  # Peak of a sine with the same RMS
+        'overshoot': float(np.mean(ratios)) if ratios else 0.0,
+        'curves': len(ratios),
+        'phases': phase_times(trace),
+        'cycles': finished,
+    }
+
+
+def traces(directory):
+    """Returns the trace files in a directory"""
+    return sorted(p for p in glob.glob(os.path.join(directory, '*.csv')) if not p.endswith('.pose.csv'))
+
+
+def compare(directories, track_length, workers):
+    """Prints the mean metrics of the traces in each directory"""
+    jobs = [(path, track_length) for directory in directories for path in traces(directory)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = dict(zip((path for path, _ in jobs), pool.map(analyze, jobs)))
+
+    print('%-20s %4s %8s %8s %9s %9s %6s' % ('runs', 'n', 'lap s', 'osc Hz', 'amplitude', 'overshoot', 'curves'))
+    for directory in directories:
+        runs = [results[path] for path in traces(directory)]
+        print('%-20s %4d %8.1f %8.2f %9.3f %8.0f%% %6d' % (
+            os.path.basename(directory.rstrip('/')), len(runs), np.mean([m['lap_time'] for m in runs]),
+            np.mean([m['frequency'] for m in runs]), np.mean([m['amplitude'] for m in runs]),
+            100*np.mean([m['overshoot'] for m in runs]), sum(m['curves'] for m in runs)))
+
+    print()
+    print('%-20s ' % 'time per run, s' + ' '.join('%9s' % name for name in PHASES[1:]))
+    for directory in directories:
+        phases = np.mean([results[path]['phases'] for path in traces(directory)], axis=0)
+        print('%-20s ' % os.path.basename(directory.rstrip('/')) + ' '.join('%9.1f' % t for t in phases[1:]))
+
+    print()
+    print('%-20s %6s %9s' % ('parking cycles, s', 'cycles', 'total') + ''.join(' %7s' % PHASES[p] for p in CYCLE_PHASES))
+    for directory in directories:
+        finished = np.array([c for path in traces(directory) for c in results[path]['cycles']]).reshape(-1, len(CYCLE_PHASES))
+        parked = finished[finished[:, 1] > 0]  # Cycles with an empty spot
+        means = parked.mean(axis=0) if len(parked) else np.zeros(len(CYCLE_PHASES))
+        print('%-20s %6d %9.1f' % (os.path.basename(directory.rstrip('/')), len(finished), means.sum()) +
+              ''.join(' %7.1f' % t for t in means))
+
+
+def record_job(job):
+    """Runs one traced mission in a worker process"""
+    params, seed, map_name, duration, path = job
+    return mission.run_mission(params, seed=seed, map_name=map_name, duration=duration, trace=path)
+
+
+def record(directory, params, seeds, map_name, duration, workers):
+    """Runs missions that write their traces to directory"""
+    os.makedirs(directory, exist_ok=True)
+    jobs = [(params, seed, map_name, duration, os.path.join(directory, 'seed%d.csv' % seed)) for seed in range(seeds)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (_, seed, _, _, path), metrics in zip(jobs, pool.map(record_job, jobs)):
+            print('%s  parks %d  failed %s' % (path, metrics['parks'], metrics['failed']))
+
+
+def parameter(text):
+    """Parses NAME=VALUE with a number value"""
+    name, value = text.split('=')
+    value = float(value)
+    return name, int(value) if value.is_integer() else value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    commands = parser.add_subparsers(dest='command', required=True)
+    recorder = commands.add_parser('record', help='run missions and write their traces')
+    recorder.add_argument('directory')
+    recorder.add_argument('--seeds', type=int, default=4)
+    recorder.add_argument('--map', default='map')
+    recorder.add_argument('--duration', type=float, default=mission.DURATION)
+    recorder.add_argument('--param', type=parameter, action='append', default=[], help='NAME=VALUE for robot/main.py')
+    comparer = commands.add_parser('compare', help='print metrics per directory of traces')
+    comparer.add_argument('directories', nargs='+')
+    comparer.add_argument('--track-length', type=float, default=mission.TRACK_LENGTH['map'], help='cm')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.directory, dict(args.param), args.seeds, args.map, args.duration, args.workers)
+    else:
+        compare(args.directories, args.track_length, args.workers)
+
+
+if __name__ == '__main__':
+    main()
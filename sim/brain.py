@@ -0,0 +1,85 @@
+"""Host side of the remote brain: answers the brick's sensor frames with motor commands
+
+Brain runs the line follower of robot/main.py on the host, the cubic
+steering, speed scheduling and cruise control, and is where heavier
+controllers go. serve() answers frames on a UDP port, so a brick with
+REMOTE_HOST set to this machine drives from it:
+
+    python sim/brain.py --port 5005
+"""
+import argparse
+import os
+import socket
+import sys
+
+import world
+
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+from cruise import CruiseControl  # noqa: E402
+from fastpath import ONE  # noqa: E402
+from remote import PORT, decode_frame, encode_command  # noqa: E402
+from scheduler import SpeedScheduler  # noqa: E402
+
+# Brain definitions
+BASE_VELOCITY = 200
+NORM_GAIN = 0.88
+GAP_TIME = 500  # ms without frames that resets the filters, the brick parked or turned
+
+
+class Brain:
+    """Line follower for frames from the brick, with the speed scheduler and cruise control of the brick"""
+
+    def __init__(self, base_velocity=BASE_VELOCITY, norm_gain=NORM_GAIN):
+        self.base_velocity = base_velocity
+        self.norm_gain = norm_gain
+        self.cruise = CruiseControl()
+        self.scheduler = SpeedScheduler()
+        self.last = None  # ms, brick clock of the last frame
+        self.frames = 0
+
+    def command(self, data):
+        """Returns the command answering a frame"""
+        sequence, now, reflection, _, distance, _, _, color_left, color_right, steering_offset = decode_frame(data)
+        if self.last is not None and now - self.last > GAP_TIME:
+            self.cruise.reset()
+            self.scheduler.reset()
+        self.last = now
+        self.frames += 1
+        t = (2*reflection - color_left - color_right)/(color_left - color_right)
+        x = self.norm_gain*(t**3 + t)/2
+        velocity = self.cruise.update_q(distance, int(self.base_velocity*self.scheduler.update(x)), now)
+        left = min(velocity, velocity + 2*velocity*x) + x*velocity*min(steering_offset, 0)
+        right = min(velocity, velocity - 2*velocity*x) + x*velocity*max(steering_offset, 0)
+        return encode_command(sequence, left, right, x*ONE)
+
+
+def answer(sock, brain):
+    """Answers every frame that arrives on a bound UDP socket"""
+    while True:
+        data, address = sock.recvfrom(64)
+        sock.sendto(brain.command(data), address)
+
+
+def serve(port=PORT, brain=None):
+    """Answers frames on a UDP port until interrupted"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('', port))
+    print('Brain on port %d' % port)
+    try:
+        answer(sock, brain or Brain())
+    finally:
+        sock.close()
+
+
+def main():
+    """Serves the brick"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--velocity', type=int, default=BASE_VELOCITY)
+    parser.add_argument('--gain', type=float, default=NORM_GAIN)
+    args = parser.parse_args()
+    serve(args.port, Brain(args.velocity, args.gain))
+
+
+if __name__ == '__main__':
+    main()
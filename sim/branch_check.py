@@ -0,0 +1,187 @@
+"""What-if branches of a robot/main.py mission forked from one checkpoint, against replays from the start
+
+The robot drives alone, with the other robot answering from a mailbox
+without a thread of its own, so that World.branch() can fork it. At its
+first parking cycle the mission forks: one branch scans the stub as it
+would, one skips it, and then a sweep of BASE_VELOCITY values each drives
+on from the same point. Every branch is scored HORIZON s later. The scan
+and skip branches are replayed from the start with the same choice, which
+must give the same scores, and the time per branch is set against the time
+per replay. The snapshot of the world at the checkpoint is restored into a
+fresh world and must come out the same.
+"""
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+
+import mission
+import world
+
+# Check definitions
+SEED = 0
+HORIZON = 60  # s of mission after the checkpoint
+CHOICES = ('scan', 'skip')
+VELOCITIES = (120, 400)  # BASE_VELOCITY range of the sweep
+BRANCHES = 64  # Of the sweep
+SAMPLE_TIME = 0.1  # s, between cross-track error samples
+
+
+class Loopback:
+    """The other robot as a text mailbox, answers MSG_PARK and MSG_UNPARK as mission.peer() does"""
+
+    def __init__(self, w, module):
+        self.world = w
+        self.module = module
+        self.replies = []  # (delivery time, message)
+
+    def send(self, msg, brick=None):
+        m = self.module
+        if msg == m.MSG_PARK:
+            self.replies.append((self.world.clock + mission.PEER_PARK_TIME, m.REC_PARKED))
+        elif msg == m.MSG_UNPARK:
+            self.replies.append((self.world.clock + mission.PEER_UNPARK_TIME, m.REC_UNPARKED))
+
+    def read(self):
+        delivered = [msg for t, msg in self.replies if t <= self.world.clock]
+        return delivered[-1] if delivered else None
+
+
+def mission_world(decide):
+    """Returns a world with robot/main.py on its own and its scores so far.
+    decide() runs at the first parking cycle and returns a choice of CHOICES, 'skip' drives past the stub
+    """
+    w = world.World(seed=SEED)
+    robot = w.add_robot(script=mission.SCRIPT)
+    module = robot.module
+    module.connect = lambda: Loopback(w, module)
+    scores = {'checkpoint': None, 'start': 0.0, 'parks': 0, 'errors': [], 'maneuvering': False, 'sampled': 0.0}
+    parking_mode = module.parking_mode
+
+    def cycle(*args):
+        if scores['checkpoint'] is None:
+            scores['checkpoint'] = w.clock
+            scores['start'] = robot.distance_driven
+            if decide() == 'skip':
+                return False
+        scores['maneuvering'] = True
+        parked = parking_mode(*args)
+        scores['maneuvering'] = False
+        scores['parks'] += scores['checkpoint'] is not None and parked
+        return parked
+    module.parking_mode = cycle
+
+    def observe(w):
+        if scores['checkpoint'] is None or scores['maneuvering']:
+            return
+        if w.clock - scores['sampled'] >= SAMPLE_TIME:
+            scores['sampled'] = w.clock
+            scores['errors'].append(float(w.tracking_errors([robot])[0]))
+    w.observers.append(observe)
+    return w, scores
+
+
+def measure(w, scores):
+    """Returns the scores of a mission since its checkpoint"""
+    robot = w.robots[0]
+    errors = scores['errors']
+    return {
+        'parks': scores['parks'],
+        'distance': robot.distance_driven - scores['start'],
+        'rms_error': math.sqrt(sum(e*e for e in errors)/len(errors)) if errors else 0.0,
+        'pose': (robot.x, robot.y, robot.heading),
+        'error': robot.error,
+    }
+
+
+def fork(branches, processes):
+    """Runs the mission to its checkpoint and branches there, returns the checkpoint, snapshot and branch scores"""
+    found = {}
+
+    def decide():
+        w = found['world']
+        found['checkpoint_time'] = time.perf_counter() - found['start']
+        start = time.perf_counter()
+        found['snapshot'] = w.snapshot()
+        found['snapshot_time'] = time.perf_counter() - start
+        duration = w.clock + HORIZON
+        start = time.perf_counter()
+        index, results = w.branch(len(CHOICES), duration, lambda w: measure(w, scores), processes)
+        if index is not None:
+            return CHOICES[index]
+        found['choices'] = results
+        found['choice_time'] = time.perf_counter() - start
+        velocities = np.linspace(VELOCITIES[0], VELOCITIES[1], branches)
+        start = time.perf_counter()
+        index, results = w.branch(len(velocities), duration, lambda w: measure(w, scores), processes)
+        if index is not None:
+            w.robots[0].module.BASE_VELOCITY = int(velocities[index])
+            return 'scan'
+        found['sweep'] = list(zip(velocities.astype(int), results))
+        found['sweep_time'] = time.perf_counter() - start
+        raise world.SimulationEnd()  # The checkpoint itself goes no further
+
+    w, scores = mission_world(decide)
+    found['world'] = w
+    found['start'] = time.perf_counter()
+    w.run(mission.DURATION)
+    found['checkpoint'] = scores['checkpoint']
+    if w.robots[0].error:
+        raise RuntimeError(w.robots[0].error)
+    return found
+
+
+def replay(choice, duration):
+    """Returns the scores and wall time of the mission run from the start with choice at its first parking cycle"""
+    w, scores = mission_world(lambda: choice)
+    start = time.perf_counter()
+    w.run(duration)
+    return measure(w, scores), time.perf_counter() - start
+
+
+def main():
+    """Prints the branch scores, whether replays match them and the time per branch against per replay"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--branches', type=int, default=BRANCHES, help='BASE_VELOCITY values in the sweep')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='branches running at a time')
+    args = parser.parse_args()
+    found = fork(args.branches, args.processes)
+    if 'choices' not in found:
+        print('no parking cycle in %d s' % mission.DURATION)
+        return
+    checkpoint = found['checkpoint']
+    data = found['snapshot']
+    fresh, _ = mission_world(lambda: 'scan')
+    fresh.restore(data)
+    print('checkpoint at %.1f s of mission, reached in %.2f s' % (checkpoint, found['checkpoint_time']))
+    print('snapshot %d bytes in %.2f ms, restored into a fresh world: %s' % (
+        len(data), 1000*found['snapshot_time'], 'same' if fresh.snapshot() == data else 'DIFFERENT'))
+
+    print('%-6s %6s %11s %9s %8s %9s' % ('choice', 'parks', 'distance cm', 'error cm', 'replay', 'replay s'))
+    replay_time = 0.0
+    for choice, scores in zip(CHOICES, found['choices']):
+        replayed, seconds = replay(choice, checkpoint + HORIZON)
+        replay_time += seconds
+        print('%-6s %6d %11.1f %9.2f %8s %9.2f' % (choice, scores['parks'], scores['distance'], scores['rms_error'],
+                                                   'same' if replayed == scores else 'DIFFERENT', seconds))
+        if scores['error']:
+            print(scores['error'])
+
+    sweep = found['sweep']
+    print('%d BASE_VELOCITY branches from the checkpoint, %d s each' % (len(sweep), HORIZON))
+    print('%9s %6s %11s %9s' % ('velocity', 'parks', 'distance cm', 'error cm'))
+    for velocity, scores in sweep[::max(1, len(sweep)//8)]:
+        print('%9d %6d %11.1f %9.2f' % (velocity, scores['parks'], scores['distance'], scores['rms_error']))
+    velocity, best = max(sweep, key=lambda item: (item[1]['parks'], item[1]['distance']))
+    print('most parks, then distance: BASE_VELOCITY %d, %d parks, %.1f cm' % (velocity, best['parks'],
+                                                                           best['distance']))
+    per_branch = (found['choice_time'] + found['sweep_time'])/(len(CHOICES) + len(sweep))
+    per_replay = replay_time/len(CHOICES)
+    print('%.3f s per branch on %d processes, %.2f s per replay from the start, %.0fx' % (
+        per_branch, args.processes, per_replay, per_replay/per_branch))
+
+
+if __name__ == '__main__':
+    main()
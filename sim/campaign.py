@@ -0,0 +1,155 @@
+"""Monte-Carlo robustness campaigns: missions of every script variant under randomized production conditions
+
+Each mission draws its own map, sensor noise, ambient light gradient, motor
+gain mismatch, wheel slip and Bluetooth latency. Every variant runs the same
+draws, so differences between variants come from the scripts. Run from the
+repository root:
+
+    python sim/campaign.py --runs 1000
+    python sim/campaign.py --runs 200 --variant main --variant main_line2
+
+The report has the success rate with its 95% interval and the failure modes
+per variant, then the failure rate in the mild and the harsh half of every
+randomized condition, which shows the conditions a variant does not survive.
+"""
+import argparse
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import mission
+import world
+
+# Script variants, name -> (script, overrides)
+MAIN = mission.SCRIPT
+MAIN_NO_BT = os.path.join(world.REPO_DIR, 'main_no_bt.py')
+GEARSBOT_BT = os.path.join(world.MAPS_DIR, 'gearsBot_bt.py')
+GEARSBOT_NO_BT = os.path.join(world.MAPS_DIR, 'gearsBot_no_bt.py')
+VARIANTS = {
+    'main': (MAIN, {}),
+    'main_line2': (MAIN, {'LINE_LIMIT': 2}),  # The sensor_on_line limit of main_no_bt.py
+    'main_free21': (MAIN, {'SCAN_FREE_DISTANCE': 21}),  # The GearsBot free spot distance
+    'main_no_bt': (MAIN_NO_BT, {}),
+    'gearsbot_bt': (GEARSBOT_BT, {}),
+    'gearsbot_no_bt': (GEARSBOT_NO_BT, {}),
+}
+
+# Condition definitions, name -> (mild, harsh) bounds of a uniform draw
+CONDITIONS = {
+    'noise': (0.0, 4.0),  # Reflection units, standard deviation of each reading
+    'gradient': (0.0, 0.06),  # Reflection units per cm across the map, in a random direction
+    'gain': (0.0, 0.08),  # Difference between the motor gains, split between the wheels
+    'slip': (0.0, 0.1),  # Mean part of the wheel rotation lost to slip
+    'latency': (0.02, 0.5),  # s, Bluetooth message latency
+}
+MAPS = ('map', 'map_2', 'map_3')
+DURATION = 180  # s
+Z = 1.96  # 95% interval
+
+# Failure modes, the first that applies is reported
+MODES = ('error', 'stalled', 'lost', 'no park')
+
+
+def draw(index, maps):
+    """Returns the randomized conditions of mission index"""
+    rng = random.Random(index)
+    conditions = {name: rng.uniform(low, high) for name, (low, high) in CONDITIONS.items()}
+    conditions['map'] = rng.choice(maps)
+    conditions['direction'] = rng.uniform(0, 2*math.pi)
+    conditions['side'] = rng.choice((-1, 1))  # The faster motor
+    conditions['balance'] = rng.uniform(0, 1)  # Left share of the slip
+    return conditions
+
+
+def evaluate(job):
+    """Runs one mission in a worker process, returns its metrics"""
+    variant, index, maps, duration = job
+    script, params = VARIANTS[variant]
+    c = draw(index, maps)
+    gain = c['side']*c['gain']/2
+    metrics = mission.run_mission(
+        params, seed=index, map_name=c['map'], duration=duration, script=script, noise=c['noise'],
+        gradient=(c['gradient']*math.cos(c['direction']), c['gradient']*math.sin(c['direction'])),
+        gain=(1 + gain, 1 - gain), slip=(2*c['slip']*c['balance'], 2*c['slip']*(1 - c['balance'])),
+        bt_latency=c['latency'])
+    return {key: metrics[key] for key in ('parks', 'scans', 'lost', 'lost_in', 'lost_stretch', 'error', 'stalled',
+                                          'failed')}
+
+
+def mode(metrics):
+    """Returns the failure mode of a failed mission"""
+    if metrics['error']:
+        return 'error'
+    if metrics['stalled']:
+        return 'stalled'
+    if metrics['lost_stretch'] > mission.LOST_LIMIT:
+        return 'lost'
+    return 'no park'
+
+
+def interval(successes, n):
+    """Returns the Wilson score interval of a success rate"""
+    if n == 0:
+        return 0.0, 1.0
+    p = successes/n
+    center = (p + Z*Z/(2*n))/(1 + Z*Z/n)
+    half = Z*math.sqrt(p*(1 - p)/n + Z*Z/(4*n*n))/(1 + Z*Z/n)
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def report(variants, runs, maps, results):
+    """Prints success rates, failure modes and failure rates per condition half"""
+    print('%-15s %5s %8s %13s' % ('variant', 'runs', 'success', '95% interval') +
+          ''.join(' %8s' % m for m in MODES) + '  %s' % 'lost in')
+    for variant in variants:
+        rows = results[variant]
+        ok = sum(not m['failed'] for m in rows)
+        low, high = interval(ok, len(rows))
+        failures = [mode(m) for m in rows if m['failed']]
+        places = {}
+        for m in rows:
+            if m['failed'] and mode(m) == 'lost':
+                places[m['lost_in']] = places.get(m['lost_in'], 0) + 1
+        print('%-15s %5d %7.1f%% %5.1f-%5.1f%%' % (variant, len(rows), 100*ok/len(rows), 100*low, 100*high) +
+              ''.join(' %8d' % failures.count(m) for m in MODES) + '  ' +
+              ', '.join('%s %d' % item for item in sorted(places.items(), key=lambda item: -item[1])))
+
+    draws = [draw(index, maps) for index in range(runs)]
+    print()
+    print('failure rate, mild/harsh half')
+    print('%-15s' % 'variant' + ''.join(' %13s' % name for name in CONDITIONS) + ''.join(' %9s' % m for m in maps))
+    for variant in variants:
+        rows = results[variant]
+        line = '%-15s' % variant
+        for name, (low, high) in CONDITIONS.items():
+            middle = (low + high)/2
+            halves = [[m['failed'] for m, c in zip(rows, draws) if (c[name] > middle) == harsh] for harsh in (False, True)]
+            line += ' %6s/%-6s' % tuple('%.0f%%' % (100*sum(h)/len(h)) if h else '-' for h in halves)
+        for name in maps:
+            on_map = [m['failed'] for m, c in zip(rows, draws) if c['map'] == name]
+            line += ' %9s' % ('%.0f%%' % (100*sum(on_map)/len(on_map)) if on_map else '-')
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=1000, help='missions per variant')
+    parser.add_argument('--variant', action='append', choices=list(VARIANTS), help='default: all')
+    parser.add_argument('--map', action='append', choices=MAPS, help='default: all')
+    parser.add_argument('--duration', type=float, default=DURATION)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    variants = args.variant or list(VARIANTS)
+    maps = tuple(args.map or MAPS)
+
+    jobs = [(variant, index, maps, args.duration) for variant in variants for index in range(args.runs)]
+    results = {variant: [] for variant in variants}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for (variant, _, _, _), metrics in zip(jobs, pool.map(evaluate, jobs, chunksize=4)):
+            results[variant].append(metrics)
+    report(variants, args.runs, maps, results)
+
+
+if __name__ == '__main__':
+    main()
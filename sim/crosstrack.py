@@ -0,0 +1,145 @@
+"""Cross-track error from a signed distance transform of the map, cached as memory-mapped arrays
+
+The field holds, for every map pixel, the distance in cm to the nearest edge
+of the line: positive on the base, negative on the line. It is an exact
+Euclidean distance transform up to MAX_ERROR, computed separably with
+NumPy, a column pass for the nearest line pixel in each column and a row
+pass over the offsets within MAX_ERROR. Fields are saved next to this file
+under CACHE_DIR and memory-mapped afterwards, so a query is one lookup for
+any number of points. The robots follow an edge with one color sensor, so
+the cross-track error of a robot is the distance of that sensor from the
+edge; the other one watches for stubs and may sit anywhere.
+Run this file to compare against brute force.
+"""
+import math
+import os
+import time
+
+import numpy as np
+
+# Cross-track definitions
+MAX_ERROR = 20.0  # cm, larger distances are cut to this
+LINE_LEVEL = 128  # Darker pixels are line
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+
+
+def distance_transform(mask, limit):
+    """Returns the distance in pixels from every pixel to the nearest True pixel of mask, cut to limit"""
+    h, w = mask.shape
+    big = limit + 1
+    rows = np.arange(h, dtype=np.int32)[:, None]
+    above = np.where(mask, rows, -2*big)
+    np.maximum.accumulate(above, axis=0, out=above)
+    below = np.where(mask, rows, h + 2*big)
+    below = np.minimum.accumulate(below[::-1], axis=0)[::-1]
+    column = np.minimum(np.minimum(rows - above, below - rows), big)
+    column *= column
+    squared = column.copy()
+    for dx in range(1, big):
+        shifted = column[:, :-dx] + dx*dx
+        np.minimum(squared[:, dx:], shifted, out=squared[:, dx:])
+        shifted = column[:, dx:] + dx*dx
+        np.minimum(squared[:, :-dx], shifted, out=squared[:, :-dx])
+    return np.minimum(np.sqrt(squared, dtype=np.float32), limit)
+
+
+def signed_distance(image, scale):
+    """Returns the signed distance in cm from pixel centers to the line edge, negative on the line"""
+    line = np.asarray(image) < LINE_LEVEL
+    limit = int(MAX_ERROR*scale)
+    outside = distance_transform(line, limit)
+    inside = distance_transform(~line, limit)
+    field = np.where(line, 0.5 - inside, outside - 0.5)/scale
+    return field.astype(np.float16)
+
+
+def cache_path(name):
+    """Returns the cache file of a map's field"""
+    return os.path.join(CACHE_DIR, name + '.crosstrack.npy')
+
+
+_fields = {}
+
+
+def load_field(name, image, source, scale):
+    """Returns the field of a map, memory-mapped from the cache unless source (the map file) is newer"""
+    if name not in _fields:
+        path = cache_path(name)
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source):
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            partial = path + '.%d.npy' % os.getpid()  # Pool workers may build the same map at once
+            np.save(partial, signed_distance(image, scale))
+            os.replace(partial, path)
+        _fields[name] = np.load(path, mmap_mode='r')
+    return _fields[name]
+
+
+class CrossTrack:
+    """Signed distance to the line edge at points in cm"""
+
+    def __init__(self, field, scale):
+        self.field = field
+        self.scale = scale
+
+    def distance(self, x, y):
+        """Returns signed distances in cm at points in cm, MAX_ERROR off the map"""
+        h, w = self.field.shape
+        if np.isscalar(x) and np.isscalar(y):
+            px, py = math.floor(x*self.scale), math.floor(y*self.scale)
+            if 0 <= px < w and 0 <= py < h:
+                return float(self.field[py, px])
+            return MAX_ERROR
+        px = np.floor(np.asarray(x)*self.scale).astype(np.int64)
+        py = np.floor(np.asarray(y)*self.scale).astype(np.int64)
+        inside = (px >= 0) & (px < w) & (py >= 0) & (py < h)
+        values = self.field[np.clip(py, 0, h-1), np.clip(px, 0, w-1)].astype(np.float64)
+        return np.where(inside, values, MAX_ERROR)
+
+    def error(self, points):
+        """Returns the cross-track error in cm of robots steering on color sensors at points, (x, y) arrays in cm"""
+        return np.abs(self.distance(*points))
+
+
+def main():
+    """Prints the build and query times and the largest difference from brute force"""
+    import world
+
+    image = world.load_map('map')
+    scale = world.MAP_SCALE
+    start = time.perf_counter()
+    field = signed_distance(image, scale)
+    print('field built in %.2f s' % (time.perf_counter()-start))
+    model = CrossTrack(field, scale)
+
+    rng = np.random.default_rng(0)
+    edge = np.argwhere((image < LINE_LEVEL) != (np.roll(image, 1, axis=1) < LINE_LEVEL))
+    ys, xs = edge[rng.integers(0, len(edge), 2000)].T
+    xs = (xs + rng.uniform(-100, 100, len(xs)))/scale  # Near the line, where the error matters
+    ys = (ys + rng.uniform(-100, 100, len(ys)))/scale
+    line = np.argwhere(image < LINE_LEVEL)
+    base = np.argwhere(image >= LINE_LEVEL)
+    brute = []
+    for x, y in zip(xs, ys):
+        px, py = math.floor(x*scale), math.floor(y*scale)
+        on_line = image[py, px] < LINE_LEVEL
+        others = base if on_line else line
+        near = others[(np.abs(others[:, 0] - py) <= 210) & (np.abs(others[:, 1] - px) <= 210)]
+        d = np.sqrt(((near - (py, px))**2).sum(axis=1)).min() if len(near) else np.inf
+        d = min(d, MAX_ERROR*scale) - 0.5
+        brute.append(-d/scale if on_line else d/scale)
+
+    start = time.perf_counter()
+    single = [model.distance(x, y) for x, y in zip(xs, ys)]
+    single_us = (time.perf_counter()-start)/len(xs)*1e6
+    start = time.perf_counter()
+    batch = model.distance(xs, ys)
+    batch_us = (time.perf_counter()-start)/len(xs)*1e6
+
+    print('%-22s %8.2f us' % ('one query', single_us))
+    print('%-22s %8.2f us' % ('%d at once' % len(xs), batch_us))
+    print('max difference from brute force %.3g cm' % max(np.abs(np.array(brute)-batch).max(),
+                                                         np.abs(np.array(single)-batch).max()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""Many robots with cruise control on one track, for stress tests of the simulator"""
+import time
+
+import world
+from cruise_check import SCRIPT, follower
+
+# Scenario definitions
+SPACING = 4  # s between robots entering the track at the start pose
+DURATION = 60  # s
+ROBOT_COUNTS = (2, 5, 10, 20)
+
+
+def run(count, map_name='map'):
+    """Returns collisions and the wall time for one crowded run"""
+    w = world.World(map_name)
+    for i in range(count):
+        w.add_robot(script=SCRIPT, target=follower, start_time=i*SPACING, BASE_VELOCITY=300)
+    start = time.perf_counter()
+    w.run(DURATION)
+    wall = time.perf_counter() - start
+
+    for robot in w.robots:
+        if robot.error:
+            raise RuntimeError(robot.error)
+    return {'collisions': sum(r.collisions for r in w.robots)//2, 'wall': wall}
+
+
+def main():
+    """Prints collisions and simulated seconds per wall second as the crowd grows"""
+    print('%7s %10s %10s %12s' % ('robots', 'collisions', 'wall s', 'sim s/wall s'))
+    for count in ROBOT_COUNTS:
+        m = run(count)
+        print('%7d %10d %10.1f %12.1f' % (count, m['collisions'], m['wall'], DURATION/m['wall']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Two-robot check of the cruise control behind a slower, stop-and-go robot"""
+import math
+import os
+
+import world
+
+SCRIPT = os.path.join(world.REPO_DIR, 'robot', 'main.py')
+
+# Scenario definitions
+LEADER_VELOCITY = 100
+LEADER_DRIVE = 10  # s
+LEADER_STOP = 4  # s
+FOLLOWER_DELAY = 30  # s
+DURATION = 120  # s
+FOLLOWER_VELOCITIES = (200, 400, 600, 800)
+
+
+class RampCruise:
+    """The previous static ramp, BASE_VELOCITY*min(1, max(0, (distance-100)/200))"""
+
+    def reset(self):
+        pass
+
+    def update(self, distance, max_velocity, now, leader=-1):
+        return max_velocity*min(1, max(0, ((distance-100)/200)))
+
+
+def start_on_line(module):
+    """Calibrates and drives onto the line like main() does"""
+    color_line, color_base = module.calibrate()
+    driving_sensor, _, color_left, color_right, steering_offset = module.driving_mode(color_line, color_base, module.DRIVING_MODE)
+    module.stop_on_line(color_line, driving_sensor, (module.BASE_VELOCITY, module.BASE_VELOCITY))
+    return color_left, color_right, driving_sensor, steering_offset
+
+
+def leader(module):
+    """Follows the line slowly and stops now and then"""
+    args = start_on_line(module)
+    timer = module.time.time()
+    while True:
+        module.follow_line(*args, False)
+        if module.time.time() - timer > LEADER_DRIVE:
+            module.drive_robot((0, 0))
+            module.wait(LEADER_STOP*1000)
+            timer = module.time.time()
+
+
+def follower(module):
+    """Follows the line with cruise control"""
+    args = start_on_line(module)
+    while True:
+        module.follow_line(*args, True)
+
+
+def run(cruise, velocity, map_name='map'):
+    """Returns follower metrics for one cruise controller and base velocity"""
+    w = world.World(map_name)
+    front = w.add_robot(script=SCRIPT, target=leader, BASE_VELOCITY=LEADER_VELOCITY, name='leader')
+    back = w.add_robot(script=SCRIPT, target=follower, start_time=FOLLOWER_DELAY, BASE_VELOCITY=velocity, name='follower')
+    if cruise is not None:
+        back.module.cruise = cruise
+
+    gaps = []
+    stops = [0, False]
+
+    def observe(w):
+        if back.present():
+            gaps.append(math.hypot(front.x-back.x, front.y-back.y) - back.config['body_length'])
+            stopped = back.command == [0, 0]
+            if stopped and not stops[1]:
+                stops[0] += 1
+            stops[1] = stopped
+    w.observers.append(observe)
+    w.run(DURATION)
+
+    for robot in w.robots:
+        if robot.error:
+            raise RuntimeError(robot.error)
+    return {
+        'collisions': back.collisions,
+        'min_gap': min(gaps),
+        'mean_speed': back.distance_driven/(DURATION-FOLLOWER_DELAY),
+        'stops': stops[0],
+        'leader_speed': front.distance_driven/DURATION,
+    }
+
+
+def main():
+    """Prints follower metrics for the old ramp and the new cruise control"""
+    print('%-6s %8s %10s %10s %6s %15s' % ('cc', 'velocity', 'collisions', 'min gap cm', 'stops', 'mean speed cm/s'))
+    for name, make in (('ramp', RampCruise), ('ttc', None)):
+        for velocity in FOLLOWER_VELOCITIES:
+            m = run(make() if make else None, velocity)
+            print('%-6s %8d %10d %10.1f %6d %15.1f' % (name, velocity, m['collisions'], m['min_gap'], m['stops'], m['mean_speed']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Equivalence of robot/fastpath.py with the reference functions in robot/main.py, and timings
+
+Every calibration and reading in the 0-100 reflection range is checked. The
+emitters need pybricks-micropython, so the timings here compare the same
+code paths under CPython only.
+"""
+import os
+import sys
+import time
+
+import world
+
+SCRIPT = os.path.join(world.REPO_DIR, 'robot', 'main.py')
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+import fastpath  # noqa: E402
+
+# Check definitions
+REFLECTIONS = range(101)
+VELOCITIES = range(0, 1001, 50)
+LIMITS = range(1, 31)
+NORM_TOLERANCE = 4/fastpath.ONE  # For |norm()| <= 1, where the robot steers
+VELOCITY_TOLERANCE = 2  # deg/s
+BENCH_CALLS = 200000
+
+
+def check_norm(module):
+    """Returns the largest norm() error where |norm()| <= 1 and the largest relative error elsewhere"""
+    gain_q = int(module.NORM_GAIN*fastpath.ONE)
+    module.NORM_GAIN = gain_q/fastpath.ONE  # Compare the same gain
+    worst, worst_relative = 0, 0
+    for left in REFLECTIONS:
+        for right in REFLECTIONS:
+            if left == right:
+                continue
+            for current in REFLECTIONS:
+                expected = module.norm(left, right, current)
+                error = abs(fastpath.norm_q(left, right, current, gain_q)/fastpath.ONE - expected)
+                if abs(expected) <= 1:
+                    worst = max(worst, error)
+                else:
+                    worst_relative = max(worst_relative, error/abs(expected))
+    return worst, worst_relative
+
+
+def check_velocity(module):
+    """Returns the largest wheel speed difference from velocity_fn()"""
+    worst = 0
+    actual = [0, 0]
+    for x_q in range(-2*fastpath.ONE, 2*fastpath.ONE + 1, 7):
+        x = x_q/fastpath.ONE
+        for velocity in VELOCITIES:
+            for steering_offset in (-1, 1):
+                expected = module.velocity_fn(x, velocity, steering_offset)
+                fastpath.velocity_q(x_q, velocity, steering_offset, actual)
+                worst = max(worst, abs(actual[0]-expected[0]), abs(actual[1]-expected[1]))
+    return worst
+
+
+def check_on_line():
+    """Returns the number of line tests that differ from abs(reflection-color_line) < limit"""
+    return sum(fastpath.on_line(reflection, line, limit) != (abs(reflection-line) < limit)
+               for reflection in REFLECTIONS for line in REFLECTIONS for limit in LIMITS)
+
+
+def bench(fn, *args):
+    """Returns the time per call in us"""
+    start = time.perf_counter()
+    for _ in range(BENCH_CALLS):
+        fn(*args)
+    return (time.perf_counter()-start)/BENCH_CALLS*1e6
+
+
+def main():
+    """Prints the equivalence checks and CPython timings per tick"""
+    w = world.World()
+    module = w.add_robot(script=SCRIPT).module
+
+    norm_error, norm_relative = check_norm(module)
+    velocity_error = check_velocity(module)
+    on_line_errors = check_on_line()
+    print('emitters %s' % ('native/viper' if fastpath.NATIVE else 'not available, plain Python'))
+    print('%-12s %-32s %s' % ('function', 'largest difference', 'ok'))
+    print('%-12s %-32s %s' % ('norm', '%.5f, %.2f%% beyond |x| > 1' % (norm_error, 100*norm_relative),
+                              norm_error <= NORM_TOLERANCE))
+    print('%-12s %-32s %s' % ('velocity_fn', '%.2f deg/s' % velocity_error, velocity_error <= VELOCITY_TOLERANCE))
+    print('%-12s %-32s %s' % ('on_line', '%d mismatches' % on_line_errors, on_line_errors == 0))
+
+    def reference(reflection):
+        module.velocity_fn(module.norm(22, 80, reflection), 200.0, 1)
+
+    speeds = [0, 0]
+
+    def fixed(reflection):
+        fastpath.velocity_q(fastpath.norm_q(22, 80, reflection, 901), 200, 1, speeds)
+
+    ref_us, fixed_us = bench(reference, 47), bench(fixed, 47)
+    print('per tick under CPython: reference %.2f us, fixed point %.2f us' % (ref_us, fixed_us))
+
+
+if __name__ == '__main__':
+    main()
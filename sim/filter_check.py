@@ -0,0 +1,67 @@
+"""Missions with noisy color sensors for each reflection filter of the line tests, and the latency each filter adds
+
+Steering reads the raw reflection whatever the filter, so the filter only
+changes when a line or stub is detected.
+"""
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import mission
+import world
+
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+from filters import RAW, MEDIAN, EMA, latency  # noqa: E402
+
+# Scenario definitions
+SEEDS = range(3)
+NOISE = (0, 8)  # Reflection units, standard deviation
+VELOCITIES = (250, 400)
+DURATION = 180  # s
+MODES = {'raw': RAW, 'median': MEDIAN, 'ema': EMA}
+
+
+def evaluate(job):
+    """Runs one mission in a worker process, returns its metrics and the line following loop period"""
+    name, noise, velocity, seed = job
+    ticks = [0, 0.0, None]  # Count, total interval, last call
+
+    def setup(module):
+        module.left_light.mode = module.right_light.mode = MODES[name]
+        follow_line = module.follow_line
+
+        def timed(*args):
+            now = module.time.time()
+            if ticks[2] is not None and now - ticks[2] < 0.05:
+                ticks[0] += 1
+                ticks[1] += now - ticks[2]
+            ticks[2] = now
+            return follow_line(*args)
+        module.follow_line = timed
+
+    metrics = mission.run_mission({'BASE_VELOCITY': velocity}, seed=seed, duration=DURATION, setup=setup, noise=noise)
+    metrics['tick'] = ticks[1]/max(1, ticks[0])
+    return metrics
+
+
+def main():
+    """Prints failed missions, parks and time off the track per filter, noise and velocity"""
+    jobs = [(name, noise, velocity, seed) for name in MODES for noise in NOISE for velocity in VELOCITIES for seed in SEEDS]
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+        results = list(pool.map(evaluate, jobs))
+
+    tick = sum(m['tick'] for m in results)/len(results)
+    print('line following loop period %.1f ms' % (tick*1000))
+    print('%-7s %7s %6s %9s %8s %6s %7s' % ('filter', 'latency', 'noise', 'velocity', 'failed', 'parks', 'lost s'))
+    for name in MODES:
+        delay = latency(MODES[name])*tick*1000
+        for noise in NOISE:
+            for velocity in VELOCITIES:
+                runs = [m for (n, s, v, _), m in zip(jobs, results) if (n, s, v) == (name, noise, velocity)]
+                print('%-7s %4.1f ms %6d %9d %5d/%d %6.1f %7.1f' % (
+                    name, delay, noise, velocity, sum(m['failed'] for m in runs), len(runs),
+                    sum(m['parks'] for m in runs)/len(runs), sum(m['lost'] for m in runs)/len(runs)))
+
+
+if __name__ == '__main__':
+    main()
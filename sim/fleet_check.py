@@ -0,0 +1,213 @@
+"""Parking coordinator checks: parks per minute as the fleet grows, with stand-in robots and with robot/main.py
+
+The protocol part runs robot/coordinator.py against robots that only talk
+to it, each a FleetClient that drives to a stub, asks for the lock, scans,
+parks, waits, unparks and now and then turns around, with the maneuver times
+of robot/main.py. They count conflicts, two robots maneuvering at once, next
+to robots that maneuver without asking. The mission part runs robot/main.py
+with FLEET_ID set on the track, one robot after another entering at the
+start pose, against the same coordinator.
+
+One lock for the whole track keeps maneuvers apart, but lets only one robot
+maneuver at a time, so parks per minute level off once the lock is busy
+all the time. The lock does not keep robots that drive on apart from those
+that maneuver. So a robot about to leave its bay asks again after
+CLEAR_TIME, and the coordinator waits while another robot has just asked to
+park at a stub. The ultrasonic sensor must read clear track before a robot
+drives out onto the line or turns around. The missions run MISSION_SEEDS
+times and count collisions as 'bay' when a robot in a bay, parked or
+leaving it, is one of the two, as 'rotate' when a turning robot is, and as
+'driving' otherwise. Bay collisions remain most of them: the bays of this
+map are about 17 cm from the robots passing their stub, which touch a
+parked robot as well. A robot passing by neither asks the lock nor sees the
+bay with its ultrasonic sensor.
+"""
+import os
+import random
+import sys
+
+import world
+from pybricks.messaging import BluetoothMailboxClient, TextMailbox
+
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+import fleet  # noqa: E402
+from handshake import DONE, FAILED  # noqa: E402
+import recorder  # noqa: E402
+
+fleet.print = lambda *args, **kwargs: None  # The robots report at every turn, load_script() only silences the scripts
+
+COORDINATOR = os.path.join(world.REPO_DIR, 'robot', 'coordinator.py')
+SCRIPT = os.path.join(world.REPO_DIR, 'robot', 'main.py')
+
+# Protocol definitions
+FLEET_SIZES = (1, 2, 4, 8, 16, 32)
+BAYS = 4
+DURATION = 600  # s
+DRIVE_TIME = (4, 12)  # s between stubs
+SCAN_TIME = 2.5  # s, the ultrasonic scan
+PARK_TIME = 2.0  # s, into the bay
+UNPARK_TIME = 4.0  # s, out of the bay and back on the line
+ROTATE_TIME = 3.45  # s, as rotate180()
+DWELL_TIME = (1, 7)  # s parked, as robot/main.py
+OCCUPIED = 0.2  # Part of the scans that find someone else's spot
+ROTATE_CHANCE = 0.1  # Of turning around after a park
+BT_LOSS = 0.05
+
+# Mission definitions
+MISSION_SIZES = (1, 2, 3)
+MISSION_BAYS = 2
+MISSION_DURATION = 300  # s
+MISSION_SEEDS = 4  # Runs per fleet size, one run is too few to compare collisions
+SPACING = 8  # s between robots entering the track
+
+
+def coordinator_peer(w, size, bays):
+    """Adds robot/coordinator.py as a bodiless robot and returns it, its module holds the coordinator"""
+    peer = w.add_peer(lambda robot: robot.module.main(), name='coordinator')
+    peer.module = w.load_script(COORDINATOR, peer, {'FLEET_SIZE': size, 'BAYS': bays,
+                                                     'REPORT_TIME': float('inf')})
+    return peer
+
+
+class Fleet:
+    """Who maneuvers and who holds a bay, shared by the stand-in robots"""
+
+    def __init__(self, bays):
+        self.bays = [None]*bays
+        self.maneuvering = 0
+        self.conflicts = 0
+        self.parks = 0
+
+    def maneuver(self, robot, seconds):
+        """Maneuvers robot for seconds, counting another robot maneuvering at the same time as a conflict"""
+        self.maneuvering += 1
+        if self.maneuvering > 1:
+            self.conflicts += 1
+        robot.world.sleep(robot, seconds)
+        self.maneuvering -= 1
+
+
+def stand_in(index, shared, coordinated):
+    """Returns a peer target that parks at stubs like robot/main.py, asking the coordinator if coordinated"""
+    def run(robot):
+        rng = random.Random(robot.world.seed*1000 + index)
+        clock = lambda: int(1000*robot.world.clock)  # noqa: E731
+        client = None
+        if coordinated:
+            connection = BluetoothMailboxClient()
+            client = fleet.FleetClient(TextMailbox(fleet.MAILBOX % index, connection))
+            connection.connect('coordinator')
+        while True:
+            robot.world.sleep(robot, rng.uniform(*DRIVE_TIME))
+            if client is not None:
+                if client.call(fleet.PARK, clock, 3) != DONE:
+                    if client.state == FAILED:
+                        client.call(fleet.CANCEL, clock)
+                    continue
+            elif None not in shared.bays:
+                continue
+            shared.maneuver(robot, SCAN_TIME)
+            if rng.random() < OCCUPIED:
+                if client is not None:
+                    client.call(fleet.CANCEL, clock)
+                continue
+            if None not in shared.bays:  # Taken during the scan, only without the coordinator
+                continue
+            bay = shared.bays.index(None)  # The coordinator's bay is one of these, any will do here
+            shared.bays[bay] = index
+            shared.maneuver(robot, PARK_TIME)
+            if client is not None:
+                client.call(fleet.PARKED, clock)
+            robot.world.sleep(robot, rng.randint(*DWELL_TIME))
+            if client is not None:
+                client.call(fleet.UNPARK, clock, 60)
+            shared.maneuver(robot, UNPARK_TIME)
+            shared.bays[bay] = None
+            shared.parks += 1
+            if client is not None:
+                client.call(fleet.UNPARKED, clock)
+            if rng.random() < ROTATE_CHANCE:
+                if client is not None:
+                    client.call(fleet.ROTATE, clock, 10)
+                shared.maneuver(robot, ROTATE_TIME)
+                if client is not None:
+                    client.call(fleet.ROTATED, clock)
+    return run
+
+
+def protocol(size, coordinated=True, seed=0):
+    """Returns parks per minute, conflicts and the coordinator (None if not coordinated) of a stand-in fleet"""
+    w = world.World(seed=seed, bt_loss=BT_LOSS)
+    peer = coordinator_peer(w, size, BAYS) if coordinated else None
+    shared = Fleet(BAYS)
+    for i in range(size):
+        w.add_peer(stand_in(i, shared, coordinated), name='robot%d' % i)
+    w.run(DURATION)
+    for robot in w.robots:
+        if robot.error:
+            raise RuntimeError(robot.error)
+    return 60*shared.parks/DURATION, shared.conflicts, peer.module.coordinator if coordinated else None
+
+
+def mission(size, seed=0):
+    """Returns parks per minute, collisions by kind and the coordinator of robot/main.py robots on the track"""
+    w = world.World(seed=seed)
+    peer = coordinator_peer(w, size, MISSION_BAYS)
+    robots = [w.add_robot(script=SCRIPT, start_time=i*SPACING, FLEET_ID=i) for i in range(size)]
+    collisions = {'bay': 0, 'rotate': 0, 'driving': 0}
+    counts = [0]*size
+
+    def observe(w):
+        phases = []
+        for i, robot in enumerate(robots):
+            if robot.collisions != counts[i]:
+                counts[i] = robot.collisions
+                phases.append(robot.module.trace.phase)
+        if phases:
+            if recorder.PARKED in phases or recorder.UNPARK in phases:
+                collisions['bay'] += 1
+            elif recorder.ROTATE in phases:
+                collisions['rotate'] += 1
+            else:
+                collisions['driving'] += 1
+    w.observers.append(observe)
+    w.run(MISSION_DURATION)
+    for robot in w.robots:
+        if robot.error:
+            raise RuntimeError(robot.error)
+    coordinator = peer.module.coordinator
+    return 60*coordinator.parks/MISSION_DURATION, collisions, coordinator
+
+
+def main():
+    """Prints parks per minute as the stand-in fleet grows, then for robot/main.py missions"""
+    print('%d bays, %.0f%% of messages lost' % (BAYS, 100*BT_LOSS))
+    print('%7s %10s %10s %8s %8s %8s %8s %10s %10s' % ('robots', 'parks/min', 'conflicts', 'grants', 'waits',
+                                                        'denied', 'lock %', 'free park', 'conflicts'))
+    for size in FLEET_SIZES:
+        rate, conflicts, c = protocol(size)
+        free, free_conflicts, _ = protocol(size, coordinated=False)
+        print('%7d %10.2f %10d %8d %8d %8d %8.0f %10.2f %10d' % (
+            size, rate, conflicts, c.grants, c.waits, c.denials, 100*c.held_time/(1000*DURATION), free,
+            free_conflicts))
+
+    print('robot/main.py, %d bays, %d runs each' % (MISSION_BAYS, MISSION_SEEDS))
+    print('%7s %10s %10s %8s %8s %8s %8s %8s %8s %8s' % ('robots', 'parks/min', 'collisions', 'bay', 'rotate',
+                                                        'driving', 'grants', 'waits', 'denied', 'expired'))
+    for size in MISSION_SIZES:
+        rate = 0
+        total = {'bay': 0, 'rotate': 0, 'driving': 0, 'grants': 0, 'waits': 0, 'denials': 0, 'expired': 0}
+        for seed in range(MISSION_SEEDS):
+            r, collisions, c = mission(size, seed)
+            rate += r/MISSION_SEEDS
+            for kind in collisions:
+                total[kind] += collisions[kind]
+            for key in ('grants', 'waits', 'denials', 'expired'):
+                total[key] += getattr(c, key)
+        print('%7d %10.2f %10d %8d %8d %8d %8d %8d %8d %8d' % (
+            size, rate, total['bay'] + total['rotate'] + total['driving'], total['bay'], total['rotate'],
+            total['driving'], total['grants'], total['waits'], total['denials'], total['expired']))
+
+
+if __name__ == '__main__':
+    main()
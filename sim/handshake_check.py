@@ -0,0 +1,72 @@
+"""Park cycle time and stalls of the pipelined handshake against the previous blocking one"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import mission
+
+# Scenario definitions
+SEEDS = range(4)
+LOSS_RATES = (0.0, 0.1, 0.3)
+DURATION = 240  # s
+
+
+def blocking(module):
+    """Restores the previous handshake, waiting for each reply in 1 s polls and never resending"""
+    module.PARK_ACK_TIMEOUT = 1e9
+
+    def wait_for_client(mbox, msg):
+        while not mbox.read() == msg:
+            module.wait(1000)
+
+    def unpark(color_line, color_base, driving_sensor, link):
+        link.mbox.send(module.MSG_UNPARK)
+        wait_for_client(link.mbox, module.REC_UNPARKED)
+        color_left, color_right, steering_offset = color_line, color_base, -1
+        if driving_sensor == module.right_light:
+            color_left, color_right, steering_offset = color_base, color_line, 1
+        velocity = module.BASE_VELOCITY
+        module.stop_before_line(color_line, color_base, driving_sensor, (velocity*steering_offset, -velocity*steering_offset))
+        module.follow_line_straight(color_left, color_right, color_base, driving_sensor, steering_offset, module.UNPARK_LIMIT)
+        module.stop_past_line(color_line, color_base, driving_sensor, (velocity, velocity))
+
+    def parking_mode(color_line, color_base, driving_sensor, parking_sensor, link):
+        if module.empty_parking_spot(color_line, driving_sensor):
+            module.park(color_line, color_base, parking_sensor)
+            wait_for_client(link.mbox, module.REC_PARKED)
+            link.mbox.send(module.MSG_BOTH_PARKED)
+            module.wait(module.random.randint(1, 7)*1000)
+            unpark(color_line, color_base, driving_sensor, link)
+            return True
+        return False
+
+    module.parking_mode = parking_mode
+
+
+def evaluate(job):
+    """Runs one mission in a worker process"""
+    name, loss, seed = job
+    return mission.run_mission(seed=seed, duration=DURATION, bt_loss=loss, setup=HANDSHAKES[name])
+
+
+HANDSHAKES = {'blocking': blocking, 'pipelined': None}
+
+
+def main():
+    """Prints park cycle time, parks per mission and stalled missions per handshake and loss rate"""
+    jobs = [(name, loss, seed) for name in HANDSHAKES for loss in LOSS_RATES for seed in SEEDS]
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+        results = list(pool.map(evaluate, jobs))
+
+    print('%-10s %6s %14s %8s %8s' % ('handshake', 'loss', 'park cycle s', 'parks', 'stalled'))
+    for name in HANDSHAKES:
+        for loss in LOSS_RATES:
+            runs = [m for (n, l, _), m in zip(jobs, results) if n == name and l == loss]
+            cycles = [m['park_time'] for m in runs if m['park_time'] is not None]
+            stalled = sum(m['stalled'] for m in runs)
+            print('%-10s %6.1f %14s %8.1f %8d' % (
+                name, loss, '%.1f' % (sum(cycles)/len(cycles)) if cycles else '-',
+                sum(m['parks'] for m in runs)/len(runs), stalled))
+
+
+if __name__ == '__main__':
+    main()
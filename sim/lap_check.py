@@ -0,0 +1,105 @@
+"""Single-robot check of lap-to-lap learning: lap times with and without the learned feedforward
+
+The robot measures the lap length itself, from the pattern of the parking
+stubs, as main() does with LAP_LENGTH None. The check measures it too, as
+the travel of a robot without learning until it is back at its start, and
+prints both. The start is where the robot has followed the line for
+START_DISTANCE, a lap ends whenever the robot passes it again.
+"""
+import math
+import os
+import sys
+
+import world
+from cruise_check import start_on_line
+
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+from cruise import MM_PER_DEG  # noqa: E402
+
+SCRIPT = os.path.join(world.REPO_DIR, 'robot', 'main.py')
+
+# Scenario definitions
+MAP = 'map_3'
+DURATION = 500  # s
+START_DISTANCE = 30  # cm
+TRACK_RADIUS = 12  # cm, the robot is lost when no line is this close to its center
+START_RADIUS = 5  # cm, passing this close to the start ends a lap
+SAMPLE_TIME = 0.1  # s
+BASE_VELOCITIES = (200, 300)
+
+
+def driver(learning):
+    """Returns a target that follows the line like main() does between parking attempts"""
+    def run(module):
+        args = start_on_line(module)
+        if learning:
+            module.lap = module.LapLearner(module.clock, module.left_motor, module.right_motor, module.LAP_LENGTH,
+                                           module.DRIVING_MODE)
+            module.lap.resume()
+        color_line = args[0] if module.DRIVING_MODE == -1 else args[1]
+        parking_sensor = module.left_light if args[2] is module.right_light else module.right_light
+        was_on_stub = False
+        while True:
+            module.follow_line(*args, True)
+            on_stub = module.sensor_on_line(color_line, parking_sensor)
+            if module.lap is not None and on_stub and not was_on_stub:
+                module.lap.landmark()
+            was_on_stub = on_stub
+    return run
+
+
+def run(learning, velocity, lap_length=None, duration=DURATION, map_name=MAP):
+    """Returns the lap times, distance per lap, time off the track and the robot's lap length in mm of one run,
+    None before it measured it
+    """
+    w = world.World(map_name)
+    overrides = {'BASE_VELOCITY': velocity}
+    if lap_length is not None:
+        overrides['LAP_LENGTH'] = lap_length
+    robot = w.add_robot(script=SCRIPT, target=driver(learning), **overrides)
+
+    state = {'start': None, 'away': False, 'times': [], 'distances': [], 'lost': 0, 'sample': 0.0}
+
+    def observe(w):
+        if w.clock - state['sample'] < SAMPLE_TIME:
+            return
+        state['sample'] = w.clock
+        if w.luminance(robot.x, robot.y, TRACK_RADIUS) > 254:
+            state['lost'] += 1
+        if state['start'] is None:
+            if robot.distance_driven > START_DISTANCE:
+                state['start'] = (robot.x, robot.y, w.clock, robot.distance_driven)
+            return
+        x, y, start, distance = state['start']
+        near = math.hypot(robot.x - x, robot.y - y) < START_RADIUS
+        if not near and robot.distance_driven - distance > 10*START_RADIUS:
+            state['away'] = True
+        elif near and state['away']:
+            state['away'] = False
+            state['times'].append(w.clock - start)
+            state['distances'].append(robot.distance_driven - distance)
+            state['start'] = (x, y, w.clock, robot.distance_driven)
+    w.observers.append(observe)
+    w.run(duration)
+
+    if robot.error:
+        raise RuntimeError(robot.error)
+    lap = robot.module.lap
+    measured = round(lap.lap/2*MM_PER_DEG) if lap is not None and lap.lap else None
+    return state['times'], state['distances'], state['lost']*SAMPLE_TIME, measured
+
+
+def main():
+    """Prints lap times with and without learning, and the lap length the robot measured"""
+    _, distances, _, _ = run(False, BASE_VELOCITIES[0])
+    print('%s lap length %d mm' % (MAP, int(10*distances[0])))
+    print('%-10s %8s %-40s %8s %10s' % ('mode', 'velocity', 'lap times s', 'lost s', 'lap mm'))
+    for velocity in BASE_VELOCITIES:
+        for name, learning in (('reactive', False), ('learning', True)):
+            times, _, lost, measured = run(learning, velocity)
+            print('%-10s %8d %-40s %8.1f %10s' % (name, velocity, ' '.join('%.1f' % t for t in times), lost,
+                                                  measured or '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Missions with missed lines during maneuvers, budgeted primitives with recovery against the unbounded ones
+
+A missed line is simulated by freezing both color sensors at their reading
+when a maneuver starts, so the line passes by unseen. The sensors stay
+blind for BLIND_TIME, longer than mission.LOST_LIMIT, so a recovered miss
+still fails the mission when the robot left the track while blind. The
+misses no budget catches are those of a primitive that ends late but
+still ends: frozen on the stub while it looks for the base past the
+stub's end, stop_on_line() returns once the robot has crossed the main
+line, and the next search retraces only its own path and is lost.
+"""
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import mission
+
+# Scenario definitions
+SEEDS = range(8)
+MISS_RATES = (0.0, 0.2, 0.5)  # Chance that a maneuver misses its line
+BLIND_TIME = 3  # s, the sensors stay frozen this long
+DURATION = 180  # s
+HANG_TIME = 30  # s, a maneuver running this long never ends
+
+
+def unbounded(module):
+    """Restores the primitives that loop until the line is seen"""
+    def stop_before_line(color_line, color_base, sensor, velocity):
+        module.drive_robot(velocity)
+        while True:
+            light_refl = sensor.reflection()
+            if abs(color_line-light_refl) < abs(color_base-light_refl):
+                module.drive_robot((0, 0))
+                return
+
+    def stop_past_line(color_line, color_base, sensor, velocity):
+        module.stop_on_line(color_line, sensor, velocity)
+        module.drive_robot(velocity)
+        while True:
+            light_refl = sensor.reflection()
+            if abs(color_line-light_refl) > abs(color_base-light_refl):
+                module.drive_robot((0, 0))
+                return
+
+    def stop_on_line(color_line, sensor, velocity):
+        module.drive_robot(velocity)
+        while not module.sensor_on_line(color_line, sensor):
+            pass
+        module.drive_robot((0, 0))
+
+    module.stop_before_line = stop_before_line
+    module.stop_past_line = stop_past_line
+    module.stop_on_line = stop_on_line
+
+
+PRIMITIVES = {'budgeted': None, 'unbounded': unbounded}
+
+
+class FrozenSensor:
+    """Color sensor that repeats one reading while frozen"""
+
+    def __init__(self, sensor, clock):
+        self.sensor = sensor
+        self.clock = clock
+        self.until = -1
+        self.value = 0
+
+    def freeze(self):
+        self.value = self.sensor.reflection()
+        self.until = self.clock() + BLIND_TIME
+
+    def reflection(self):
+        value = self.sensor.reflection()  # Reading advances the simulated clock
+        return self.value if self.clock() < self.until else value
+
+
+def evaluate(job):
+    """Runs one mission in a worker process, returns its metrics and the maneuver counts"""
+    name, miss, seed = job
+    inside = [None]  # Start of the maneuver in progress
+
+    def setup(module):
+        if PRIMITIVES[name] is not None:
+            PRIMITIVES[name](module)
+        clock = module.time.time
+        sensors = []
+        for light in (module.left_light, module.right_light):
+            light.sensor = FrozenSensor(light.sensor, clock)
+            sensors.append(light.sensor)
+        rng = random.Random(seed)
+
+        def faulty(fn):
+            def wrapper(*args):
+                if rng.random() < miss:
+                    for sensor in sensors:
+                        sensor.freeze()
+                if inside[0] is not None:  # Nested in another primitive
+                    return fn(*args)
+                inside[0] = clock()
+                result = fn(*args)
+                inside[0] = None
+                return result
+            return wrapper
+        for primitive in ('stop_on_line', 'stop_before_line', 'stop_past_line'):
+            setattr(module, primitive, faulty(getattr(module, primitive)))
+        setup.module = module
+
+    metrics = mission.run_mission(seed=seed, duration=DURATION, setup=setup)
+    module = setup.module
+    metrics['hung'] = inside[0] is not None and module.time.time() - inside[0] > HANG_TIME
+    stats = getattr(module, 'maneuvers', None)
+    metrics['missed'] = stats.failures() if stats else 0
+    metrics['recovered'] = stats.recoveries if stats else 0
+    metrics['lost_lines'] = stats.lost if stats else 0
+    metrics['recovery'] = stats.mean_recovery() if stats else 0
+    return metrics
+
+
+def main():
+    """Prints hung missions, parks and recoveries per primitive set and miss rate, with the longest stretch off the
+    track
+    """
+    jobs = [(name, miss, seed) for name in PRIMITIVES for miss in MISS_RATES for seed in SEEDS]
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+        results = list(pool.map(evaluate, jobs))
+
+    print('%-10s %5s %6s %6s %6s %7s %10s %5s %11s %9s' % (
+        'primitives', 'miss', 'hung', 'failed', 'parks', 'missed', 'recovered', 'lost', 'recovery s', 'off s'))
+    for name in PRIMITIVES:
+        for miss in MISS_RATES:
+            runs = [m for (n, r, _), m in zip(jobs, results) if (n, r) == (name, miss)]
+            recovered = sum(m['recovered'] for m in runs)
+            recovery = sum(m['recovery']*m['recovered'] for m in runs)/recovered if recovered else 0
+            print('%-10s %5.1f %3d/%d %3d/%d %6.1f %7d %10d %5d %11.1f %9.1f' % (
+                name, miss, sum(m['hung'] for m in runs), len(runs), sum(m['failed'] for m in runs), len(runs),
+                sum(m['parks'] for m in runs)/len(runs), sum(m['missed'] for m in runs), recovered,
+                sum(m['lost_lines'] for m in runs), recovery, max(m['lost_stretch'] for m in runs)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""Simulated missions of robot/main.py against a Bluetooth peer, scored for tuning
+
+The other robot scripts run too, without a peer when they have no connect().
+"""
+import math
+import os
+
+import world
+from pybricks.messaging import BluetoothMailboxClient, TextMailbox
+from pybricks.tools import wait
+
+SCRIPT = os.path.join(world.REPO_DIR, 'robot', 'main.py')
+
+# Mission definitions
+DURATION = 180  # s
+PEER_PARK_TIME = 6  # s, the peer reports parked this long after MSG_PARK
+PEER_UNPARK_TIME = 3  # s, the peer reports unparked this long after MSG_UNPARK
+TRACK_LENGTH = {'map': 1950, 'map_2': 1950, 'map_3': 700}  # cm, one lap along the line, estimated
+TRACK_RADIUS = 12  # cm, the robot is lost when no line is this close to its center
+SAMPLE_TIME = 0.1  # s
+LOST_LIMIT = 2  # s off the track in one stretch fails the mission, a parking turn leaves it for under 1 s
+RECENT_TIME = 2  # s, leaving the track this soon after a maneuver is blamed on it
+STALL_LIMIT = 60  # s in one parking cycle fails the mission
+
+# Objective definitions
+PARK_WEIGHT = 1.0
+TRACKING_WEIGHT = 10.0  # s per cm of RMS cross-track error
+FAILURE_PENALTY = 600  # s
+
+# Tunables in robot/main.py, name -> (low, high, integer)
+PARAMETERS = {
+    'BASE_VELOCITY': (120, 400, True),
+    'NORM_GAIN': (0.5, 1.2, False),
+    'LINE_LIMIT': (4, 30, True),
+    'PARK_LIMIT': (2, 6, False),
+    'UNPARK_LIMIT': (1, 4, False),
+    'SCAN_SAMPLES': (10, 40, True),
+    'SCAN_FREE_DISTANCE': (120, 400, True),
+    'PARKING_COOLDOWN': (0.5, 3, False),
+    'REVERSE_DELAY': (2, 8, False),
+    'PARKING_DELAY': (3, 12, False),
+}
+
+
+def peer(module):
+    """Returns a Bluetooth client target that answers the server like the other robot"""
+    def run(robot):
+        client = BluetoothMailboxClient()
+        client.connect('server')
+        mbox = TextMailbox('greeting', client)
+        while True:
+            mbox.wait()
+            msg = mbox.read()
+            if msg == module.MSG_PARK:
+                wait(PEER_PARK_TIME*1000)
+                mbox.send(module.REC_PARKED)
+            elif msg == module.MSG_UNPARK:
+                wait(PEER_UNPARK_TIME*1000)
+                mbox.send(module.REC_UNPARKED)
+    return run
+
+
+def pose_path(trace):
+    """Returns the file next to a trace that holds the simulated poses"""
+    return os.path.splitext(trace)[0] + '.pose.csv'
+
+
+def run_mission(params=None, seed=0, map_name='map', duration=DURATION, script=SCRIPT, bt_loss=0.0, setup=None, noise=0.0,
+                trace=None, bt_latency=0.05, gradient=(0.0, 0.0), gain=(1.0, 1.0), slip=(0.0, 0.0), profile=None,
+                observers=()):
+    """Runs one mission and returns its metrics, setup(module) may replace script functions first.
+    With a trace path, the script records its control loop there and the poses go to pose_path(trace).
+    With a profile path, the script's profiler summary goes there.
+    observers are called with the world and the robot after every physics step.
+    gain and slip are per wheel (left, right), see world.SimRobot
+    """
+    w = world.World(map_name, seed=seed, bt_latency=bt_latency, bt_loss=bt_loss, noise=noise, gradient=gradient)
+    robot = w.add_robot(script=script, **(params or {}))
+    robot.gain = list(gain)
+    robot.slip = list(slip)
+    module = robot.module
+    if trace is not None:
+        module.TRACE = True
+        module.TRACE_FILE = trace
+    if profile is not None:
+        module.PROFILER = True
+        module.PROFILER_FILE = profile
+    if setup is not None:
+        setup(module)
+    if hasattr(module, 'connect'):
+        w.add_peer(peer(module), name='peer')
+
+    cycles = []  # (start, end, parked)
+    busy = [0.0, 0.0]  # Time and distance outside line following
+    active = [None]  # Start of an unfinished parking cycle
+    running = [None, None, 0.0]  # Function in progress, last finished function and its end
+
+    def timed(fn, name, record=None):
+        def wrapper(*args):
+            start, distance = w.clock, robot.distance_driven
+            if record is not None:
+                active[0] = start
+            running[0] = name
+            result = fn(*args)
+            running[:] = [None, name, w.clock]
+            active[0] = None
+            busy[0] += w.clock - start
+            busy[1] += robot.distance_driven - distance
+            if record is not None:
+                record.append((start, w.clock, result))
+            return result
+        return wrapper
+
+    for name in ('calibrate', 'connect', 'rotate180'):
+        if hasattr(module, name):
+            setattr(module, name, timed(getattr(module, name), name))
+    module.parking_mode = timed(module.parking_mode, 'parking_mode', cycles)
+
+    lost = [0, 0.0, None, 0, 0]  # Samples off the track, last sample time, where the robot first left the track,
+    # samples of the current and of the longest stretch off it
+    errors = []  # Cross-track error samples while following the line, cm
+
+    def observe(w):
+        if w.clock - lost[1] >= SAMPLE_TIME:
+            lost[1] = w.clock
+            if running[0] is None:
+                errors.append(w.tracking_errors([robot])[0])
+            if w.luminance(robot.x, robot.y, TRACK_RADIUS) > 254:
+                lost[0] += 1
+                lost[3] += 1
+                lost[4] = max(lost[4], lost[3])
+                if lost[2] is None:
+                    if running[0] is None and running[1] is not None and w.clock - running[2] < RECENT_TIME:
+                        lost[2] = running[1]
+                    else:
+                        lost[2] = running[0] or 'follow_line'
+            else:
+                lost[3] = 0
+    w.observers.append(observe)
+    for observer in observers:
+        w.observers.append(lambda w, observer=observer: observer(w, robot))
+    poses = []  # (ms on the script clock, x, y)
+    if trace is not None:
+        def record(w):
+            if not poses or module.clock.time() - poses[-1][0] >= SAMPLE_TIME*1000:
+                poses.append((module.clock.time(), robot.x, robot.y))
+        w.observers.append(record)
+    w.run(duration)
+    if trace is not None:
+        module.trace.save(trace)
+        with open(pose_path(trace), 'w') as f:
+            f.write('time,x,y\n')
+            f.writelines('%d,%.2f,%.2f\n' % pose for pose in poses)
+    if profile is not None:
+        module.profiler.save(profile)
+
+    driving_time = max(1e-9, duration - busy[0])
+    speed = (robot.distance_driven - busy[1])/driving_time
+    parked = [end-start for start, end, result in cycles if result]
+    metrics = {
+        'speed': speed,
+        'lap_time': TRACK_LENGTH[map_name]/speed if speed > 0 else math.inf,
+        'park_time': sum(parked)/len(parked) if parked else None,
+        'parks': len(parked),
+        'scans': len(cycles),
+        'lost': lost[0]*SAMPLE_TIME,
+        'lost_in': lost[2],
+        'lost_stretch': lost[4]*SAMPLE_TIME,
+        'rms_error': math.sqrt(sum(e*e for e in errors)/len(errors)) if errors else 0.0,
+        'max_error': max(errors, default=0.0),
+        'error': robot.error,
+        'stalled': active[0] is not None and w.clock - active[0] > STALL_LIMIT,
+    }
+    metrics['failed'] = bool(robot.error) or metrics['lost_stretch'] > LOST_LIMIT or not parked or metrics['stalled']
+    return metrics
+
+
+def objective(metrics):
+    """Returns the cost of a mission, estimated lap time plus parking cycle time in s and the weighted RMS cross-track error"""
+    cost = min(metrics['lap_time'], FAILURE_PENALTY) + PARK_WEIGHT*(metrics['park_time'] or 0)
+    cost += TRACKING_WEIGHT*metrics['rms_error']
+    if metrics['failed']:
+        cost += FAILURE_PENALTY
+    return cost
+
+
+def main():
+    """Runs the current parameters once and prints the metrics"""
+    metrics = run_mission()
+    for key, value in metrics.items():
+        print('%-10s %s' % (key, value))
+    print('%-10s %s' % ('cost', objective(metrics)))
+
+
+if __name__ == '__main__':
+    main()
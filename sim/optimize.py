@@ -0,0 +1,201 @@
+"""Parallel CMA-ES over the robot/main.py tunables, scored by simulated missions
+
+Run from the repository root, e.g. python sim/optimize.py --generations 20.
+Progress is checkpointed after every generation and the best parameters are
+written as a profile that robot/main.py loads at startup.
+"""
+import argparse
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import mission
+import world
+
+# Optimizer definitions
+POPULATION = 8
+GENERATIONS = 20
+SEEDS = (0, 1)
+SIGMA = 0.2  # Initial step size in the normalized [0, 1] parameter box
+BOUND_PENALTY = 1000  # Cost per squared distance outside the box
+CHECKPOINT = os.path.join(world.SIM_DIR, 'optimize_checkpoint.json')
+PROFILE = os.path.join(world.REPO_DIR, 'robot', 'profile.json')
+
+NAMES = sorted(mission.PARAMETERS)
+
+
+def decode(z):
+    """Returns script parameters for a point in the normalized box"""
+    params = {}
+    for name, value in zip(NAMES, np.clip(z, 0, 1)):
+        low, high, integer = mission.PARAMETERS[name]
+        value = low + (high-low)*float(value)
+        params[name] = int(round(value)) if integer else round(value, 3)
+    return params
+
+
+def encode(params):
+    """Returns the normalized point for script parameters"""
+    z = []
+    for name in NAMES:
+        low, high, _ = mission.PARAMETERS[name]
+        z.append((params[name]-low)/(high-low))
+    return np.array(z)
+
+
+def current_parameters(script=mission.SCRIPT):
+    """Returns the tunables as currently defined in the script"""
+    w = world.World()
+    module = w.add_robot(script=script).module
+    return {name: getattr(module, name) for name in NAMES}
+
+
+class CMAES:
+    """Covariance matrix adaptation evolution strategy, (mu/mu_w, lambda)"""
+
+    def __init__(self, mean, sigma, population, seed=0):
+        n = len(mean)
+        self.n = n
+        self.population = population
+        self.mu = population//2
+        weights = np.log(self.mu+0.5) - np.log(np.arange(1, self.mu+1))
+        self.weights = weights/weights.sum()
+        self.mueff = 1/np.sum(self.weights**2)
+
+        self.cc = (4+self.mueff/n)/(n+4+2*self.mueff/n)
+        self.cs = (self.mueff+2)/(n+self.mueff+5)
+        self.c1 = 2/((n+1.3)**2+self.mueff)
+        self.cmu = min(1-self.c1, 2*(self.mueff-2+1/self.mueff)/((n+2)**2+self.mueff))
+        self.damps = 1 + 2*max(0, math.sqrt((self.mueff-1)/(n+1))-1) + self.cs
+        self.chi_n = math.sqrt(n)*(1-1/(4*n)+1/(21*n**2))
+
+        self.mean = np.array(mean, dtype=float)
+        self.sigma = sigma
+        self.cov = np.eye(n)
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.generation = 0
+        self.rng = np.random.default_rng(seed)
+
+    def ask(self):
+        """Returns a population of candidate points"""
+        eigenvalues, basis = np.linalg.eigh(self.cov)
+        scale = np.sqrt(np.maximum(eigenvalues, 1e-20))
+        steps = self.rng.standard_normal((self.population, self.n))
+        return self.mean + self.sigma*(steps*scale) @ basis.T
+
+    def tell(self, points, costs):
+        """Updates the distribution from evaluated points"""
+        order = np.argsort(costs)
+        y = (np.asarray(points)[order[:self.mu]] - self.mean)/self.sigma
+        y_w = self.weights @ y
+        self.mean = self.mean + self.sigma*y_w
+
+        eigenvalues, basis = np.linalg.eigh(self.cov)
+        inv_sqrt = basis @ np.diag(1/np.sqrt(np.maximum(eigenvalues, 1e-20))) @ basis.T
+        self.ps = (1-self.cs)*self.ps + math.sqrt(self.cs*(2-self.cs)*self.mueff)*(inv_sqrt @ y_w)
+        self.generation += 1
+        norm_ps = np.linalg.norm(self.ps)
+        hsig = norm_ps/math.sqrt(1-(1-self.cs)**(2*self.generation)) < (1.4+2/(self.n+1))*self.chi_n
+        self.pc = (1-self.cc)*self.pc + hsig*math.sqrt(self.cc*(2-self.cc)*self.mueff)*y_w
+
+        rank_mu = (y.T*self.weights) @ y
+        self.cov = ((1-self.c1-self.cmu)*self.cov
+                    + self.c1*(np.outer(self.pc, self.pc) + (1-hsig)*self.cc*(2-self.cc)*self.cov)
+                    + self.cmu*rank_mu)
+        self.sigma *= math.exp((self.cs/self.damps)*(norm_ps/self.chi_n-1))
+
+    def state(self):
+        """Returns the optimizer state as JSON-compatible data"""
+        return {
+            'mean': self.mean.tolist(), 'sigma': self.sigma, 'cov': self.cov.tolist(),
+            'pc': self.pc.tolist(), 'ps': self.ps.tolist(), 'generation': self.generation,
+            'rng': self.rng.bit_generator.state,
+        }
+
+    def restore(self, state):
+        """Restores a state returned by state()"""
+        self.mean = np.array(state['mean'])
+        self.sigma = state['sigma']
+        self.cov = np.array(state['cov'])
+        self.pc = np.array(state['pc'])
+        self.ps = np.array(state['ps'])
+        self.generation = state['generation']
+        self.rng.bit_generator.state = state['rng']
+
+
+def evaluate(job):
+    """Runs one mission for a candidate, in a worker process"""
+    params, seed, map_name, duration = job
+    metrics = mission.run_mission(params, seed, map_name, duration)
+    return mission.objective(metrics), metrics
+
+
+def summarize(results):
+    """Returns mean cost and metrics over the seeds of one candidate"""
+    cost = sum(c for c, _ in results)/len(results)
+    park_times = [m['park_time'] for _, m in results if m['park_time'] is not None]
+    return cost, {
+        'lap_time': sum(m['lap_time'] for _, m in results)/len(results),
+        'park_time': sum(park_times)/len(park_times) if park_times else None,
+        'failure_rate': sum(m['failed'] for _, m in results)/len(results),
+    }
+
+
+def save_json(path, data):
+    """Writes JSON atomically so an interrupted run leaves a valid file"""
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--generations', type=int, default=GENERATIONS)
+    parser.add_argument('--population', type=int, default=POPULATION)
+    parser.add_argument('--seeds', type=int, default=len(SEEDS))
+    parser.add_argument('--map', default='map')
+    parser.add_argument('--duration', type=float, default=mission.DURATION)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--checkpoint', default=CHECKPOINT)
+    parser.add_argument('--profile', default=PROFILE)
+    args = parser.parse_args()
+
+    start = current_parameters()
+    es = CMAES(encode(start), SIGMA, args.population)
+    best = {'cost': math.inf, 'params': start, 'metrics': None}
+    if os.path.exists(args.checkpoint):
+        with open(args.checkpoint) as f:
+            checkpoint = json.load(f)
+        es.restore(checkpoint['es'])
+        best = checkpoint['best']
+        print('Resumed at generation %d' % es.generation)
+
+    seeds = range(args.seeds)
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        while es.generation < args.generations:
+            points = es.ask()
+            candidates = [decode(z) for z in points]
+            jobs = [(params, seed, args.map, args.duration) for params in candidates for seed in seeds]
+            results = list(pool.map(evaluate, jobs))
+
+            costs = []
+            for i, params in enumerate(candidates):
+                cost, metrics = summarize(results[i*len(seeds):(i+1)*len(seeds)])
+                outside = points[i] - np.clip(points[i], 0, 1)
+                costs.append(cost + BOUND_PENALTY*float(outside @ outside))
+                if cost < best['cost']:
+                    best = {'cost': cost, 'params': params, 'metrics': metrics}
+            es.tell(points, costs)
+
+            save_json(args.checkpoint, {'es': es.state(), 'best': best})
+            save_json(args.profile, best['params'])
+            print('generation %3d  best %8.1f  median %8.1f  sigma %.3f  %s' % (
+                es.generation, best['cost'], float(np.median(costs)), es.sigma, best['metrics']))
+
+
+if __name__ == '__main__':
+    main()
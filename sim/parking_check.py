@@ -0,0 +1,157 @@
+"""Parking and unparking times and where the robot ends up, timed line following against encoder trajectories
+
+Each run starts robot/main.py's functions at the mission start pose,
+follows the line to the first stub of the parking place on the straight,
+scans, parks, unparks and follows the line again, the way parking_mode()
+does, but without the other robot to wait for. The bay is the space
+between the first two stub lines. A run reports the park and unpark times,
+how far along the track the parked robot's center is off the bay center, its
+heading off square to the track, how close the parked body comes to the
+track line, and the cross-track error after following the line on.
+Conditions vary the speed, motor gains, wheel slip and sensor noise.
+"""
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import mission
+import stub_check
+import world
+
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+from maneuver import LOST  # noqa: E402
+from trajectory import park_time, unpark_time  # noqa: E402
+
+# Check definitions
+SEEDS = range(4)
+CONDITIONS = {  # name -> overrides, world options
+    'nominal': ({}, {}),
+    'slow': ({'BASE_VELOCITY': 140}, {}),
+    'fast': ({'BASE_VELOCITY': 300}, {}),
+    'gain 0.85': ({}, {'gain': (0.85, 1.0)}),
+    'slip 0.1': ({}, {'slip': (0.1, 0.0)}),
+    'noise 3': ({}, {'noise': 3.0}),
+}
+METHODS = (('line following', False), ('trajectory', True))
+PLACE = (150, 210)  # cm, y range of the parking place on the straight of map
+FOLLOW_TIME = 3  # s of line following after unparking
+TIMEOUT = 60  # s, a run that takes longer failed
+
+
+class Link:
+    """The other robot, always parked and unparked already"""
+
+    def request(self, msg, ack, now, timeout=None):
+        pass
+
+    def wait(self, clock):
+        return True
+
+    def send(self, msg):
+        pass
+
+
+def bay():
+    """Returns the center (x, y) in cm of the bay between the first two stub lines in PLACE, and the track mask"""
+    mask = stub_check.stub_mask('map')
+    low, high = int(PLACE[0]*world.MAP_SCALE), int(PLACE[1]*world.MAP_SCALE)
+    rows = low + np.nonzero(mask[low:high].any(axis=1))[0]
+    lines = np.split(rows, np.nonzero(np.diff(rows) > 1)[0] + 1)
+    xs = np.nonzero(mask[lines[0]].any(axis=0))[0]
+    center = ((xs.min() + xs.max())/2, (lines[0].mean() + lines[1].mean())/2)
+    track = (world.load_map('map') < stub_check.crosstrack.LINE_LEVEL) & ~mask
+    return (center[0]/world.MAP_SCALE, center[1]/world.MAP_SCALE), track
+
+
+def clearance(robot, track):
+    """Returns the distance in cm from the robot's footprint to the nearest track pixel"""
+    corners = np.array(robot.footprint())
+    x0, y0 = (corners.min(axis=0) - 30)*world.MAP_SCALE
+    x1, y1 = (corners.max(axis=0) + 30)*world.MAP_SCALE
+    ys, xs = np.nonzero(track[int(y0):int(y1), int(x0):int(x1)])
+    points = np.stack([(xs + x0)/world.MAP_SCALE, (ys + y0)/world.MAP_SCALE], axis=1)
+    if not len(points):
+        return 30.0
+    best = np.inf
+    for a, b in zip(corners, np.roll(corners, -1, axis=0)):  # Distance to the outline, 0 inside is not possible here
+        ab = b - a
+        t = np.clip(((points - a) @ ab)/(ab @ ab), 0, 1)
+        best = min(best, np.min(np.hypot(*(a + t[:, None]*ab - points).T)))
+    return float(best)
+
+
+def run(job):
+    """Returns the metrics of one park and unpark in a worker process"""
+    condition, trajectory, seed = job
+    overrides, options = CONDITIONS[condition]
+    center, track = bay()
+    w = world.World('map', seed=seed, noise=options.get('noise', 0.0))
+    result = {}
+
+    def target(module):
+        module.TRAJECTORY_PARKING = trajectory
+        robot = w.robots[0]
+        color_line, color_base = module.calibrate()
+        driving_sensor, parking_sensor, color_left, color_right, steering_offset = module.driving_mode(
+            color_line, color_base, module.DRIVING_MODE)
+        module.stop_on_line(color_line, driving_sensor, (module.BASE_VELOCITY, module.BASE_VELOCITY))
+        while not (module.sensor_on_line(color_line, parking_sensor) and robot.y > PLACE[0]):
+            module.follow_line(color_left, color_right, driving_sensor, steering_offset, True)
+        module.empty_parking_spot(color_line, driving_sensor)
+        start = w.clock
+        parked = module.park(color_line, color_base, parking_sensor)
+        result['park'] = w.clock - start
+        result['offset'] = abs(robot.y - center[1])
+        heading = math.degrees(robot.heading) % 180  # Square to the track, which runs along y, is 0 or 180
+        result['heading'] = min(heading, 180 - heading)
+        result['clearance'] = clearance(robot, track)
+        start = w.clock
+        unparked = module.unpark(color_line, color_base, driving_sensor, Link())
+        result['unpark'] = w.clock - start
+        end = w.clock + FOLLOW_TIME
+        while w.clock < end:
+            module.follow_line(color_left, color_right, driving_sensor, steering_offset, True)
+        result['error'] = float(w.tracking_errors([robot])[0])
+        result['lost'] = parked == LOST or unparked == LOST
+        module.drive_robot((0, 0))
+
+    robot = w.add_robot(script=mission.SCRIPT, target=target, **overrides)
+    robot.gain = list(options.get('gain', (1.0, 1.0)))
+    robot.slip = list(options.get('slip', (0.0, 0.0)))
+    w.run(TIMEOUT)
+    if robot.error:
+        raise RuntimeError(robot.error)
+    return result
+
+
+def main():
+    """Prints mean and spread of each metric per condition and method"""
+    jobs = [(condition, trajectory, seed) for condition in CONDITIONS for _, trajectory in METHODS for seed in SEEDS]
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+        results = list(pool.map(run, jobs))
+
+    print('trajectory profiles: park %.2f s, unpark %.2f s' % (park_time()/1000, unpark_time()/1000))
+    print('%-10s %-15s %12s %12s %9s %8s %9s %9s %5s' % ('condition', 'method', 'park s', 'unpark s', 'offset cm',
+                                                        'heading', 'clear cm', 'error cm', 'lost'))
+    for condition in CONDITIONS:
+        for name, trajectory in METHODS:
+            runs = [r for (c, t, _), r in zip(jobs, results) if c == condition and t == trajectory and r]
+            if len(runs) < len(SEEDS):
+                print('%-10s %-15s %d of %d runs did not finish' % (condition, name, len(SEEDS) - len(runs), len(SEEDS)))
+            if not runs:
+                continue
+
+            def spread(key):
+                values = [r[key] for r in runs]
+                return '%5.2f +-%4.2f' % (np.mean(values), np.std(values))
+            print('%-10s %-15s %12s %12s %9.1f %8.1f %9.1f %9.2f %5d' % (
+                condition, name, spread('park'), spread('unpark'), np.mean([r['offset'] for r in runs]),
+                np.mean([r['heading'] for r in runs]), np.mean([r['clearance'] for r in runs]),
+                np.mean([r['error'] for r in runs]), sum(r['lost'] for r in runs)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Two-robot check of platooning: a follower behind a stop-and-go leader, with and without speed sharing
+
+Both robots run robot/main.py, the follower as the Bluetooth server and the
+leader as the client. Without sharing the follower keeps its gap from the
+ultrasonic distance alone. Velocity changes sum how much the follower's
+commanded velocity moves up and down per second, its braking and
+re-accelerating. Collisions also count corners touching in tight curves,
+where the leader's body swings back toward a follower that already stands.
+They happen in hairpins with the robots at 100 to 220 deg to each other,
+where the ultrasonic sensor sees neither robot, so sharing, which counts
+only while the sensor sees the leader, does not change them.
+"""
+import math
+import os
+import sys
+
+import world
+from cruise_check import start_on_line
+from pybricks.messaging import BluetoothMailboxClient, Mailbox
+
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+from platoon import SpeedLink, MAILBOX  # noqa: E402
+
+SCRIPT = os.path.join(world.REPO_DIR, 'robot', 'main.py')
+
+# Scenario definitions
+LEADER_VELOCITIES = (250, 150, 300, 100)  # deg/s, cycled every LEADER_DRIVE
+LEADER_DRIVE = 8  # s
+LEADER_STOP = 3  # s, after each cycle of velocities
+FOLLOWER_DELAY = 12  # s
+FOLLOWER_VELOCITY = 400
+DURATION = 150  # s
+
+
+def leader(w, sharing):
+    """Returns a target that changes velocity and stops now and then, the Bluetooth client.
+    It drives from the start and connects once the follower listens
+    """
+    def run(module):
+        args = start_on_line(module)
+        steering_offset = args[3]
+        client = None
+        module.trace.enter(module.DRIVING, module.clock.time())
+        while True:
+            for velocity in LEADER_VELOCITIES:
+                module.BASE_VELOCITY = velocity
+                end = module.clock.time() + 1000*LEADER_DRIVE
+                while module.clock.time() < end:
+                    module.follow_line(*args, True)
+                    if client is None and any(r.listening for r in w.robots):
+                        client = BluetoothMailboxClient()
+                        client.connect('follower')
+                        if sharing:
+                            module.platoon = SpeedLink(Mailbox(MAILBOX, client))
+            module.drive_robot((0, 0))
+            if module.platoon is not None:
+                module.platoon.share(0, module.DRIVING, steering_offset, module.clock.time())
+            module.wait(LEADER_STOP*1000)
+    return run
+
+
+def follower(module):
+    """Follows the line with cruise control, the Bluetooth server"""
+    args = start_on_line(module)
+    module.connect()
+    module.trace.enter(module.DRIVING, module.clock.time())
+    while True:
+        module.follow_line(*args, True)
+
+
+def run(sharing, map_name='map'):
+    """Returns follower metrics with or without speed sharing"""
+    w = world.World(map_name)
+    front = w.add_robot(script=SCRIPT, target=leader(w, sharing), name='leader')
+    back = w.add_robot(script=SCRIPT, target=follower, start_time=FOLLOWER_DELAY,
+                       BASE_VELOCITY=FOLLOWER_VELOCITY, PLATOONING=sharing, name='follower')
+
+    gaps = []
+    state = {'stops': 0, 'stopped': False, 'change': 0.0, 'command': None}
+
+    def observe(w):
+        if not back.present():
+            return
+        gaps.append(math.hypot(front.x-back.x, front.y-back.y) - back.config['body_length'])
+        command = sum(back.command)/2
+        if state['command'] is not None:
+            state['change'] += abs(command - state['command'])
+        state['command'] = command
+        stopped = back.command == [0, 0]
+        if stopped and not state['stopped']:
+            state['stops'] += 1
+        state['stopped'] = stopped
+    w.observers.append(observe)
+    w.run(DURATION)
+
+    for robot in w.robots:
+        if robot.error:
+            raise RuntimeError(robot.error)
+    return {
+        'collisions': back.collisions,
+        'min_gap': min(gaps),
+        'mean_gap': sum(gaps)/len(gaps),
+        'stops': state['stops'],
+        'change': state['change']/(DURATION-FOLLOWER_DELAY),
+        'mean_speed': back.distance_driven/(DURATION-FOLLOWER_DELAY),
+        'messages': front.module.platoon.messages if sharing else 0,
+    }
+
+
+def main():
+    """Prints follower metrics with the ultrasonic gap alone and with the shared velocity"""
+    print('%-10s %10s %10s %11s %6s %15s %15s %9s' % (
+        'follower', 'collisions', 'min gap cm', 'mean gap cm', 'stops', 'changes deg/s/s', 'mean speed cm/s', 'messages'))
+    for name, sharing in (('ultrasonic', False), ('platoon', True)):
+        m = run(sharing)
+        print('%-10s %10d %10.1f %11.1f %6d %15.0f %15.1f %9d' % (
+            name, m['collisions'], m['min_gap'], m['mean_gap'], m['stops'], m['change'], m['mean_speed'], m['messages']))
+
+
+if __name__ == '__main__':
+    main()
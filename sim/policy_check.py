@@ -0,0 +1,81 @@
+"""Tabular steering of robot/policy.py against the cubic of norm(): table fidelity, lookup cost and lap time
+
+The cubic table is checked against norm() over every calibration and
+reading in the 0-100 reflection range, within the quantization of its
+buckets. The timings compare norm_q() with a lookup under CPython only.
+Lap times come from seeds the training does not use.
+"""
+import argparse
+import os
+import sys
+
+import world
+import train_policy
+from fastpath_check import REFLECTIONS, bench
+from optimize import current_parameters
+
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+import fastpath  # noqa: E402
+import policy as steering  # noqa: E402
+
+# Check definitions
+SEEDS = (10, 11)
+MAPS = ('map', 'map_2', 'map_3')
+SLOPE_TOLERANCE = 1.1  # Bucket widths of norm() change a table entry may be off by
+
+
+def check_table(module, policy):
+    """Returns the largest difference from norm() where |norm()| <= 1, in the norm() change over one bucket"""
+    worst = 0
+    for left in REFLECTIONS:
+        for right in REFLECTIONS:
+            if left == right:
+                continue
+            for current in REFLECTIONS:
+                expected = module.norm(left, right, current)
+                if abs(expected) > 1:
+                    continue
+                policy.row = steering.error_bucket(left, right, current, policy.error_scale, policy.error_bins)*policy.error_bins
+                actual = policy.steer_q(left, right, current, 0)/fastpath.ONE
+                t = (2*current - left - right)/(left - right)
+                slope = module.NORM_GAIN*(3*t*t + 1)/2/policy.error_scale  # norm() change over one bucket
+                worst = max(worst, abs(actual - expected)/max(slope, 1/(1 << steering.STEER_SHIFT)))
+    return worst
+
+
+def main():
+    """Prints the table check, CPython timings per lookup and lap times of the cubic and trained tables"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--policy', default=train_policy.POLICY)
+    args = parser.parse_args()
+
+    w = world.World()
+    module = w.add_robot(script=train_policy.mission.SCRIPT).module
+    cubic = train_policy.blob(train_policy.cubic_table(current_parameters()['NORM_GAIN']))
+    error = check_table(module, steering.SteeringPolicy(cubic))
+    print('cubic table: largest difference from norm() %.2f buckets, ok %s' % (error, error <= SLOPE_TOLERANCE))
+    print('table size: %d bytes' % len(cubic))
+
+    gain_q = int(module.NORM_GAIN*fastpath.ONE)
+    policy = steering.SteeringPolicy(cubic)
+
+    norm_us = bench(fastpath.norm_q, 22, 80, 47, gain_q)
+    lookup_us = bench(policy.steer_q, 22, 80, 47, 200)
+    print('steering per tick under CPython: norm_q %.2f us, lookup %.2f us' % (norm_us, lookup_us))
+
+    tables = [('cubic', cubic)]
+    if os.path.exists(args.policy):
+        with open(args.policy, 'rb') as f:
+            tables.append(('trained', f.read()))
+    else:
+        print('No %s, run sim/train_policy.py first' % args.policy)
+    print('%-8s %-6s %10s %8s' % ('table', 'map', 'lap s', 'lost s'))
+    for name, data in tables:
+        for map_name in MAPS:
+            results = [train_policy.run((data, seed, map_name, train_policy.DURATION)) for seed in SEEDS]
+            print('%-8s %-6s %10.2f %8.1f' % (name, map_name, sum(r[0] for r in results)/len(results),
+                                               sum(r[1] for r in results)/len(results)))
+
+
+if __name__ == '__main__':
+    main()
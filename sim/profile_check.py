@@ -0,0 +1,71 @@
+"""Profiler summaries of robot/main.py: a simulated mission, next to a summary from the brick
+
+The mission runs with PROFILER on and writes the same CSV the brick writes
+to PROFILER_FILE. Host times are CPython plus the simulated sensors, so
+compare the calls per second and how the time splits between functions
+rather than the microseconds. Run from the repository root:
+
+    python sim/profile_check.py
+    python sim/profile_check.py --brick profiler.csv
+"""
+import argparse
+import csv
+import os
+import sys
+
+import mission
+import world
+
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+from profiler import FIELDS  # noqa: E402
+
+# Check definitions
+DURATION = 120  # s of simulated mission
+OUTPUT = os.path.join(world.REPO_DIR, 'sim', 'profiler.csv')
+
+
+def load(path):
+    """Returns the summary rows of a profiler file by function name"""
+    with open(path) as f:
+        return {row['name']: {k: int(row[k]) for k in FIELDS[1:]} for row in csv.DictReader(f)}
+
+
+def main():
+    """Profiles a simulated mission and prints its summary, with the brick's next to it if given"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--brick', help='profiler summary written by the robot')
+    parser.add_argument('--out', default=OUTPUT)
+    parser.add_argument('--duration', type=float, default=DURATION)
+    parser.add_argument('--map', default='map')
+    args = parser.parse_args()
+
+    metrics = mission.run_mission(map_name=args.map, duration=args.duration, profile=args.out)
+    if metrics['error']:
+        raise RuntimeError(metrics['error'])
+    summaries = [('sim', load(args.out))]
+    if args.brick:
+        summaries.append(('brick', load(args.brick)))
+
+    # Every summary's share of time is against its own follow_line, the driving tick
+    header = '%-26s' % 'function'
+    for name, _ in summaries:
+        header += ' %10s %9s %9s %8s' % (name + ' calls', 'mean us', 'worst us', 'tick %')
+    print(header)
+    names = [name for name, row in summaries[0][1].items() if row['calls']]
+    names += [name for _, rows in summaries[1:] for name, row in rows.items() if row['calls'] and name not in names]
+    for name in names:
+        line = '%-26s' % name
+        for _, rows in summaries:
+            row = rows.get(name)
+            tick = rows.get('follow_line', {}).get('total_ms')
+            if row is None or not row['calls']:
+                line += ' %10s %9s %9s %8s' % ('-', '-', '-', '-')
+                continue
+            share = 100*row['total_ms']/tick if tick else 0
+            line += ' %10d %9d %9d %8.1f' % (row['calls'], row['mean_us'], row['worst_us'], share)
+        print(line)
+    print('summary written to %s' % args.out)
+
+
+if __name__ == '__main__':
+    main()
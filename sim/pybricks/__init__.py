@@ -0,0 +1,30 @@
+"""Simulated stand-ins for the pybricks modules used by the robot scripts
+
+Devices bind to the robot that is being loaded or running on this thread.
+"""
+import threading
+
+_local = threading.local()
+
+
+def bind(robot):
+    """Binds devices created or called on this thread to a simulated robot"""
+    _local.robot = robot
+
+
+def robot():
+    """Returns the simulated robot bound to this thread"""
+    return _local.robot
+
+
+class SimTime:
+    """Replaces the time module of a script with the virtual clock"""
+
+    def __init__(self, world):
+        self.world = world
+
+    def time(self):
+        return self.world.clock
+
+    def sleep(self, seconds):
+        self.world.sleep(robot(), seconds)
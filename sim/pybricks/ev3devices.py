@@ -0,0 +1,49 @@
+"""Simulated pybricks.ev3devices"""
+from pybricks import robot
+from pybricks.parameters import Direction
+
+
+class Motor:
+    def __init__(self, port, positive_direction=Direction.CLOCKWISE, gears=None):
+        self.robot = robot()
+        self.wheel = 0 if self.robot.role(port) == 'left_motor' else 1
+        self.sign = 1 if positive_direction == Direction.CLOCKWISE else -1
+        self.offset = 0.0
+
+    def run(self, speed):
+        self.robot.run_motor(self.wheel, self.sign*speed)
+
+    def stop(self):
+        self.run(0)
+
+    def brake(self):
+        self.run(0)
+
+    def hold(self):
+        self.run(0)
+
+    def speed(self):
+        return int(self.sign*self.robot.wheel_speed[self.wheel])
+
+    def angle(self):
+        return int(self.sign*self.robot.wheel_angle[self.wheel] - self.offset)
+
+    def reset_angle(self, angle=0):
+        self.offset = self.sign*self.robot.wheel_angle[self.wheel] - angle
+
+
+class ColorSensor:
+    def __init__(self, port):
+        self.robot = robot()
+        self.role = self.robot.role(port)
+
+    def reflection(self):
+        return self.robot.read_reflection(self.role)
+
+
+class UltrasonicSensor:
+    def __init__(self, port):
+        self.robot = robot()
+
+    def distance(self, silent=False):
+        return self.robot.read_distance()
@@ -0,0 +1,31 @@
+"""Simulated pybricks.hubs"""
+from pybricks import robot
+
+
+class _Speaker:
+    def __init__(self, r):
+        self.robot = r
+
+    def beep(self, frequency=500, duration=100):
+        self.robot.beeps += 1
+
+    def say(self, text):
+        pass
+
+
+class _Light:
+    def __init__(self, r):
+        self.robot = r
+
+    def on(self, color):
+        self.robot.light = color
+
+    def off(self):
+        self.robot.light = None
+
+
+class EV3Brick:
+    def __init__(self):
+        r = robot()
+        self.speaker = _Speaker(r)
+        self.light = _Light(r)
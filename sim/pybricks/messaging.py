@@ -0,0 +1,87 @@
+"""Simulated pybricks.messaging, links robots in the same world
+
+A server takes as many clients as wait_for_connection() is asked for and
+sends every message to all of them, like the brick does when no brick name
+is given.
+"""
+from pybricks import robot
+
+POLL_TIME = 0.01  # s
+
+
+class BluetoothMailboxServer:
+    def __init__(self):
+        self.robot = robot()
+
+    def wait_for_connection(self, count=1):
+        r = self.robot
+        r.listening = count - len(r.peers)
+        while len(r.peers) < count:
+            r.world.sleep(r, POLL_TIME)
+
+
+class BluetoothMailboxClient:
+    def __init__(self):
+        self.robot = robot()
+
+    def connect(self, brick):
+        r = self.robot
+        while not r.peers:
+            for other in r.world.robots:
+                if other.listening and other is not r:
+                    other.listening -= 1
+                    r.peers.append(other)
+                    other.peers.append(r)
+                    break
+            else:
+                r.world.sleep(r, POLL_TIME)
+
+
+class Mailbox:
+    def __init__(self, name, connection):
+        self.name = name
+        self.robot = connection.robot
+        self.seen = 0
+
+    def send(self, value, brick=None):
+        r = self.robot
+        for peer in r.peers:
+            if r.world.bt_loss and r.world.bt_random.random() < r.world.bt_loss:
+                r.world.bt_dropped += 1
+                continue
+            inbox = peer.mailboxes.setdefault(self.name, [])
+            inbox.append((r.world.clock + r.world.bt_latency, value))
+
+    def _delivered(self):
+        r = self.robot
+        return [v for t, v in r.mailboxes.get(self.name, []) if t <= r.world.clock]
+
+    def read(self):
+        delivered = self._delivered()
+        self.seen = len(delivered)
+        return delivered[-1] if delivered else None
+
+    def wait(self):
+        r = self.robot
+        while len(self._delivered()) <= self.seen:
+            r.world.sleep(r, POLL_TIME)
+
+    def wait_new(self):
+        old = self.read()
+        while True:
+            self.wait()
+            new = self.read()
+            if new != old:
+                return new
+
+
+class TextMailbox(Mailbox):
+    pass
+
+
+class NumericMailbox(Mailbox):
+    pass
+
+
+class LogicMailbox(Mailbox):
+    pass
@@ -0,0 +1,23 @@
+"""Simulated pybricks.parameters"""
+
+
+class Port:
+    A, B, C, D = 'A', 'B', 'C', 'D'
+    S1, S2, S3, S4 = 'S1', 'S2', 'S3', 'S4'
+
+
+class Color:
+    BLACK, BLUE, GREEN, YELLOW, RED, WHITE, BROWN = 'BLACK', 'BLUE', 'GREEN', 'YELLOW', 'RED', 'WHITE', 'BROWN'
+    ORANGE, CYAN, GRAY, MAGENTA, VIOLET = 'ORANGE', 'CYAN', 'GRAY', 'MAGENTA', 'VIOLET'
+
+
+class Direction:
+    CLOCKWISE, COUNTERCLOCKWISE = 'CLOCKWISE', 'COUNTERCLOCKWISE'
+
+
+class Stop:
+    COAST, BRAKE, HOLD = 'COAST', 'BRAKE', 'HOLD'
+
+
+class Button:
+    LEFT, RIGHT, UP, DOWN, CENTER = 'LEFT', 'RIGHT', 'UP', 'DOWN', 'CENTER'
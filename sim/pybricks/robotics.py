@@ -0,0 +1,24 @@
+"""Simulated pybricks.robotics"""
+import math
+
+
+class DriveBase:
+    def __init__(self, left_motor, right_motor, wheel_diameter, axle_track):
+        self.left_motor = left_motor
+        self.right_motor = right_motor
+        self.wheel_diameter = wheel_diameter
+        self.axle_track = axle_track
+
+    def settings(self, straight_speed=None, straight_acceleration=None, turn_rate=None, turn_acceleration=None):
+        pass
+
+    def drive(self, speed, turn_rate):
+        """Drives at speed mm/s turning turn_rate deg/s"""
+        deg_per_mm = 360/(math.pi*self.wheel_diameter)
+        turn = turn_rate*self.axle_track/2*math.pi/180
+        self.left_motor.run((speed+turn)*deg_per_mm)
+        self.right_motor.run((speed-turn)*deg_per_mm)
+
+    def stop(self):
+        self.left_motor.run(0)
+        self.right_motor.run(0)
@@ -0,0 +1,35 @@
+"""Simulated pybricks.tools"""
+from pybricks import robot
+
+
+def wait(time):
+    """Waits time ms of simulated time"""
+    r = robot()
+    r.world.sleep(r, time/1000)
+
+
+class StopWatch:
+    """Stop watch on the simulated clock, in ms"""
+
+    def __init__(self):
+        self.world = robot().world
+        self.start = self.world.clock
+        self.paused = None
+
+    def time(self):
+        now = self.paused if self.paused is not None else self.world.clock
+        return int((now-self.start)*1000)
+
+    def reset(self):
+        self.start = self.world.clock
+        if self.paused is not None:
+            self.paused = self.start
+
+    def pause(self):
+        if self.paused is None:
+            self.paused = self.world.clock
+
+    def resume(self):
+        if self.paused is not None:
+            self.start += self.world.clock - self.paused
+            self.paused = None
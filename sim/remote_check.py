@@ -0,0 +1,138 @@
+"""Remote brain checks: the UDP link to sim/brain.py on this machine, then missions over slower simulated links
+
+The loopback part sends frames from robot/remote.py to a brain thread on a
+local socket in real time, the stand-in for the radio. The missions run
+robot/main.py with its link replaced by one with latency, jitter and loss in
+simulated time, and show how much of the driving the host does and when the
+brick falls back to its own follow_line().
+"""
+import heapq
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+import mission
+import world
+from brain import Brain, answer
+
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+import remote  # noqa: E402
+
+# Loopback definitions
+FRAMES = 2000
+FRAME_TIME = 0.005  # s between frames
+
+# Mission definitions
+DURATION = 120  # s
+BRAIN_TIME = 0.003  # s the host takes per frame
+LINKS = ((0.005, 0.0), (0.02, 0.05), (0.04, 0.2), (0.1, 0.0))  # One-way latency s, loss
+JITTER = 0.5  # Latencies vary this much either way
+SAMPLE_TIME = 0.1  # s
+
+
+class SimLink:
+    """One end of a simulated link, messages arrive after a jittered latency in simulated time or not at all"""
+
+    def __init__(self, world, latency, loss, rng):
+        self.world = world
+        self.latency = latency
+        self.loss = loss
+        self.rng = rng
+        self.inbox = []
+        self.other = None
+        self.count = 0
+
+    def send(self, data):
+        if self.rng.random() < self.loss:
+            return
+        delay = self.latency*(1 + JITTER*(2*self.rng.random() - 1))
+        self.count += 1
+        heapq.heappush(self.other.inbox, (self.world.clock + delay, self.count, bytes(data)))
+
+    def read(self):
+        if self.inbox and self.inbox[0][0] <= self.world.clock:
+            return heapq.heappop(self.inbox)[2]
+        return None
+
+
+def loopback():
+    """Returns the RemoteBrain after FRAMES frames to a brain thread on a local UDP socket"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    threading.Thread(target=answer, args=(sock, Brain()), daemon=True).start()
+    brain = remote.RemoteBrain(remote.SocketLink('127.0.0.1', sock.getsockname()[1]))
+    start = time.monotonic()
+    for i in range(FRAMES):
+        now = int((time.monotonic() - start)*1000)
+        brain.step(now, 40, 80, 2550, 10*i, 10*i, 20, 80, -1)
+        time.sleep(FRAME_TIME)
+    return brain
+
+
+def host(link):
+    """Returns a peer target that runs the brain behind link"""
+    def run(robot):
+        brain = Brain(robot.world.robots[0].module.BASE_VELOCITY, robot.world.robots[0].module.NORM_GAIN)
+        while True:
+            data = link.read()
+            if data is None:
+                robot.world.sleep(robot, 0.001)
+                continue
+            robot.world.sleep(robot, BRAIN_TIME)
+            link.send(brain.command(data))
+    return run
+
+
+def run(latency=None, loss=0.0, seed=0):
+    """Returns the brick's RemoteBrain, the RMS cross-track error in cm and the speed in cm/s of a mission.
+    Without a latency the brick drives alone and there is no RemoteBrain
+    """
+    w = world.World(seed=seed)
+    robot = w.add_robot(script=mission.SCRIPT)
+    module = robot.module
+    w.add_peer(mission.peer(module), name='peer')
+    if latency is not None:
+        rng = random.Random(seed)
+        brick, far = SimLink(w, latency, loss, rng), SimLink(w, latency, loss, rng)
+        brick.other, far.other = far, brick
+        module.remote = remote.RemoteBrain(brick)
+        w.add_peer(host(far), name='brain')
+
+    errors = []
+    sample = [0.0]
+
+    def observe(w):
+        if w.clock - sample[0] >= SAMPLE_TIME:
+            sample[0] = w.clock
+            errors.append(w.tracking_errors([robot])[0])
+    w.observers.append(observe)
+    w.run(DURATION)
+    if robot.error:
+        raise RuntimeError(robot.error)
+    rms = (sum(e*e for e in errors)/len(errors))**0.5
+    return module.remote, rms, robot.distance_driven/DURATION
+
+
+def main():
+    """Prints the loopback link and missions over each simulated link"""
+    brain = loopback()
+    print('loopback: %d frames, %d commands, %d dropped, rtt %d ms, worst %d ms, host drove %.0f%%' % (
+        brain.sent, brain.replies, brain.dropped, brain.rtt, brain.worst, 100*brain.remote_ticks/brain.sent))
+
+    print('%10s %6s %8s %8s %8s %9s %9s %10s %10s' % ('latency ms', 'loss', 'rtt ms', 'worst ms', 'dropped',
+                                                        'fallbacks', 'host %', 'rms cm', 'speed cm/s'))
+    for latency, loss in ((None, 0.0),) + LINKS:
+        brain, rms, speed = run(latency, loss)
+        if brain is None:
+            print('%10s %6s %8s %8s %8s %9s %9s %10.2f %10.1f' % ('brick', '-', '-', '-', '-', '-', '-', rms, speed))
+            continue
+        print('%10.0f %6.2f %8d %8d %8d %9d %9.0f %10.2f %10.1f' % (
+            1000*latency, loss, brain.rtt, brain.worst, brain.dropped, brain.fallbacks,
+            100*brain.remote_ticks/max(1, brain.sent), rms, speed))
+
+
+if __name__ == '__main__':
+    main()
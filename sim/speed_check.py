@@ -0,0 +1,65 @@
+"""Single-robot check of the curvature-aware speed scheduler"""
+import os
+
+import world
+from cruise_check import start_on_line
+
+SCRIPT = os.path.join(world.REPO_DIR, 'robot', 'main.py')
+
+# Scenario definitions
+DURATION = 120  # s
+TRACK_RADIUS = 12  # cm, the robot is lost when no line is this close to its center
+SAMPLE_TIME = 0.1  # s
+BASE_VELOCITIES = (200, 250, 300, 350)
+
+
+class FixedSpeed:
+    """Scheduler stand-in that always keeps BASE_VELOCITY"""
+
+    def reset(self):
+        pass
+
+    def update(self, x):
+        return 1
+
+
+def driver(module):
+    """Follows the line like main() does between parking attempts"""
+    args = start_on_line(module)
+    while True:
+        module.follow_line(*args, True)
+
+
+def run(scheduler, velocity, map_name='map'):
+    """Returns distance driven and time off the track for one run"""
+    w = world.World(map_name)
+    robot = w.add_robot(script=SCRIPT, target=driver, BASE_VELOCITY=velocity)
+    if scheduler is not None:
+        robot.module.scheduler = scheduler
+
+    lost = [0, 0.0]
+
+    def observe(w):
+        if w.clock - lost[1] >= SAMPLE_TIME:
+            lost[1] = w.clock
+            if w.luminance(robot.x, robot.y, TRACK_RADIUS) > 254:
+                lost[0] += 1
+    w.observers.append(observe)
+    w.run(DURATION)
+
+    if robot.error:
+        raise RuntimeError(robot.error)
+    return {'distance': robot.distance_driven, 'lost': lost[0]*SAMPLE_TIME}
+
+
+def main():
+    """Prints distance driven and time off the track with and without the scheduler"""
+    print('%-10s %8s %12s %8s' % ('speed', 'velocity', 'distance cm', 'lost s'))
+    for name, make in (('fixed', FixedSpeed), ('scheduled', None)):
+        for velocity in BASE_VELOCITIES:
+            m = run(make() if make else None, velocity)
+            print('%-10s %8d %12.0f %8.1f' % (name, velocity, m['distance'], m['lost']))
+
+
+if __name__ == '__main__':
+    main()
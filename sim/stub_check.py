@@ -0,0 +1,237 @@
+"""Parking stub detection on traces: precision and recall of the single-tick line test and of robot/stubs.py
+
+record runs traced missions and writes, next to every trace, the times a
+color sensor entered a parking stub while driving, stubs being the line
+pieces not connected to the track. evaluate replays the parking sensor and driving sensor columns of the
+driving rows through both detectors. A detection within TOLERANCE of a stub
+group, stubs passed within GROUP_TIME of each other, is a hit, anything else
+a false parking scan. Traces from the robot are evaluated the same way when
+a labels file sits next to them, otherwise only the detections are counted.
+The classifier's odometry reads the encoders, which record keeps next to
+the trace. Traces without them integrate the commanded wheel speeds instead.
+Run from the repository root:
+
+    python sim/stub_check.py record runs/stubs
+    python sim/stub_check.py evaluate runs/stubs
+"""
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import analysis
+import crosstrack
+import mission
+import world
+
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+from fastpath import on_line  # noqa: E402
+from filters import HYSTERESIS  # noqa: E402
+from recorder import DRIVING  # noqa: E402
+from stubs import StubClassifier  # noqa: E402
+
+# Check definitions
+MAPS = ('map', 'map_2', 'map_3')
+NOISES = (0.0, 2.0)  # Color sensor noise of the recorded missions
+DURATION = 300  # s
+TRACE_ROWS = 40000  # Rows kept between saves, a whole mission
+LINE_LIMIT = 16  # As in robot/main.py
+PARKING_COOLDOWN = 1.6  # s, as in robot/main.py, between detections of the single-tick test
+GROUP_TIME = 2.0  # s, stubs passed this close together are one parking place
+TOLERANCE = 0.3  # s
+LINE_PERCENTILE = 2  # Of the driving sensor, where calibration is not in the trace
+SEARCH_RADIUS = 15  # cm around the start pose searched for the track
+DETECTORS = (('line test', False, False), ('classifier', True, True), ('classifier, no odometry', True, False))
+
+
+def labels_path(trace):
+    """Returns the file next to a trace that holds the stub entry times"""
+    return os.path.splitext(trace)[0] + '.stubs.csv'
+
+
+def travel_path(trace):
+    """Returns the file next to a trace that holds the mean wheel angle of every row"""
+    return os.path.splitext(trace)[0] + '.travel.csv'
+
+
+def stub_mask(map_name):
+    """Returns the line pixels of a map that are not connected to the track at the start pose"""
+    image = world.load_map(map_name)
+    line = image < crosstrack.LINE_LEVEL
+    x, y, _ = world.START_POSES[map_name]
+    r = int(SEARCH_RADIUS*world.MAP_SCALE)
+    cx, cy = int(x*world.MAP_SCALE), int(y*world.MAP_SCALE)
+    ys, xs = np.nonzero(line[cy-r:cy+r, cx-r:cx+r])
+    nearest = np.argmin((xs - r)**2 + (ys - r)**2)
+    filled = Image.fromarray(line.astype(np.uint8)*255).copy()  # A copy, fromarray() may share the read-only map
+    ImageDraw.floodfill(filled, (cx - r + int(xs[nearest]), cy - r + int(ys[nearest])), 128)
+    return np.asarray(filled) == 255
+
+
+def record_job(job):
+    """Runs one traced mission in a worker process and writes its stub labels"""
+    map_name, seed, noise, duration, path = job
+    mask = stub_mask(map_name)
+    height, width = mask.shape
+    entries = []  # ms on the script clock
+    travel = []  # deg, mean wheel angle at every trace row
+    over = [False]
+
+    def label(w, robot):
+        now = False
+        for role in ('left_light', 'right_light'):
+            x, y = robot.point(*robot.config[role])
+            px, py = int(x*world.MAP_SCALE), int(y*world.MAP_SCALE)
+            now = now or (0 <= px < width and 0 <= py < height and mask[py, px])
+        if now and not over[0] and robot.module.trace.phase == DRIVING:  # Maneuvers cross stubs on purpose
+            entries.append(robot.module.clock.time())
+        over[0] = now
+
+    def setup(module):
+        start = module.trace.start
+        module.trace.start = lambda: start(TRACE_ROWS)
+        row = module.trace.row
+
+        def traced(*args):
+            row(*args)
+            travel.append((module.left_motor.angle() + module.right_motor.angle()) >> 1)
+        module.trace.row = traced
+
+    metrics = mission.run_mission(seed=seed, map_name=map_name, duration=duration, noise=noise, trace=path,
+                                  setup=setup, observers=[label])
+    with open(labels_path(path), 'w') as f:
+        f.write('time\n')
+        f.writelines('%d\n' % t for t in entries)
+    with open(travel_path(path), 'w') as f:
+        f.write('travel\n')
+        f.writelines('%d\n' % t for t in travel)
+    return metrics
+
+
+def record(directory, seeds, duration, workers):
+    """Runs traced missions on every map and noise level into directory"""
+    os.makedirs(directory, exist_ok=True)
+    jobs = [(map_name, seed, noise, duration, os.path.join(directory, '%s_noise%g_seed%d.csv' % (map_name, noise, seed)))
+            for map_name in MAPS for noise in NOISES for seed in range(seeds)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for job, metrics in zip(jobs, pool.map(record_job, jobs)):
+            print('%s  parks %d  scans %d' % (job[-1], metrics['parks'], metrics['scans']))
+
+
+def detections(trace, classify, odometry, travel=None):
+    """Returns the times (s) the single-tick test, or the classifier, starts a parking scan on the driving rows.
+    travel holds the mean wheel angle (deg) of every row, None integrates the commanded speeds
+    """
+    if travel is None:
+        speed = (trace['left'] + trace['right'])/2
+        travel = np.concatenate(([0], np.cumsum(speed[:-1]*np.diff(trace['time']))))
+    driving = trace['reflection'][trace['phase'] == DRIVING]
+    color_line = int(np.percentile(driving, LINE_PERCENTILE))
+    color_base = int(np.percentile(driving, 100 - LINE_PERCENTILE))
+    classifier = StubClassifier(odometry)
+    classifier.calibrate(color_line, color_base)
+    found = []
+    was_driving = on = detected = False
+    last = -np.inf
+    for i in range(len(trace['time'])):
+        t = trace['time'][i]
+        if trace['phase'][i] != DRIVING:
+            was_driving = False
+            continue
+        if not was_driving:  # main() resets after every maneuver
+            classifier.reset()
+            on = detected = False
+            last = t
+            was_driving = True
+        if trace['left'][i] == 0 and trace['right'][i] == 0 and trace['reflection'][i] == 0:
+            continue  # Phase marker row
+        on = on_line(trace['parking'][i], color_line, LINE_LIMIT + HYSTERESIS if on else LINE_LIMIT)
+        stub = on
+        if classify:
+            stub = classifier.update(on, trace['reflection'][i], int(travel[i]))
+        if stub and not detected and (classify or t - last > PARKING_COOLDOWN):
+            found.append(t)
+            last = t
+        detected = stub
+    return found
+
+
+def score(found, entries):
+    """Returns hits, false detections and missed stub groups"""
+    groups = []
+    for t in entries:
+        if groups and t - groups[-1][1] < GROUP_TIME:
+            groups[-1][1] = t
+        else:
+            groups.append([t, t])
+    hit = [False]*len(groups)
+    false = 0
+    for t in found:
+        for i, (start, end) in enumerate(groups):
+            if start - TOLERANCE <= t <= end + TOLERANCE:
+                hit[i] = True
+                break
+        else:
+            false += 1
+    return sum(hit), false, hit.count(False)
+
+
+def evaluate_job(path):
+    """Returns the detections of both detectors on one trace and its labels if there are any"""
+    trace, _ = analysis.load(path)
+    entries = None
+    if os.path.exists(labels_path(path)):
+        entries = list(np.atleast_1d(np.loadtxt(labels_path(path), skiprows=1, ndmin=1))/1000)
+    travel = None
+    if os.path.exists(travel_path(path)):
+        travel = np.loadtxt(travel_path(path), skiprows=1, ndmin=1)
+    found = {name: detections(trace, classify, odometry, travel) for name, classify, odometry in DETECTORS}
+    return found, entries
+
+
+def evaluate(paths, workers):
+    """Prints precision and recall of both detectors per trace and over all of them"""
+    traces = []
+    for path in paths:
+        traces += sorted(glob.glob(os.path.join(path, '*.csv'))) if os.path.isdir(path) else [path]
+    traces = [t for t in traces if not t.endswith(('.pose.csv', '.stubs.csv', '.travel.csv'))]
+    totals = {name: [0, 0, 0] for name, _, _ in DETECTORS}
+    print('%-36s %-22s %5s %5s %7s' % ('trace', 'detector', 'hits', 'false', 'missed'))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, (found, entries) in zip(traces, pool.map(evaluate_job, traces)):
+            for name, times in found.items():
+                if entries is None:
+                    print('%-36s %-22s %5d %5s %7s' % (os.path.basename(path), name, len(times), '-', '-'))
+                    continue
+                counts = score(times, entries)
+                totals[name] = [a + b for a, b in zip(totals[name], counts)]
+                print('%-36s %-22s %5d %5d %7d' % ((os.path.basename(path), name) + counts))
+    for name, (hits, false, missed) in totals.items():
+        if hits + false + missed:
+            print('%-22s precision %.2f  recall %.2f' % (name, hits/max(1, hits + false), hits/max(1, hits + missed)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    commands = parser.add_subparsers(dest='command', required=True)
+    recorder = commands.add_parser('record', help='run traced missions with stub labels')
+    recorder.add_argument('directory')
+    recorder.add_argument('--seeds', type=int, default=2)
+    recorder.add_argument('--duration', type=float, default=DURATION)
+    evaluator = commands.add_parser('evaluate', help='print precision and recall per trace')
+    evaluator.add_argument('paths', nargs='+', help='traces or directories of traces')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.directory, args.seeds, args.duration, args.workers)
+    else:
+        evaluate(args.paths, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""robot/sysfs.py against a fake ev3dev sysfs tree: readings, motor writes and reads per second
+
+pybricks itself cannot run on the host, so the reference paths are the two
+usual ways of reading an attribute file from Python: opening it for every
+read, and keeping it open but reading it as text with int(). The fake tree
+is made of regular files, so the rates show the Python side of each path
+and not the kernel drivers behind a real sysfs.
+"""
+import os
+import sys
+import tempfile
+import time
+
+import world
+from pybricks.parameters import Port
+
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+import sysfs  # noqa: E402
+
+# Fake tree definitions, class -> (directory, port, driver, attributes)
+DEVICES = [
+    (sysfs.SENSOR_CLASS, 'sensor0', Port.S2, 'lego-ev3-color', {'mode': 'COL-COLOR', 'value0': '47'}),
+    (sysfs.SENSOR_CLASS, 'sensor1', Port.S3, 'lego-ev3-color', {'mode': 'COL-COLOR', 'value0': '12'}),
+    (sysfs.SENSOR_CLASS, 'sensor2', Port.S4, 'lego-ev3-us', {'mode': 'US-DIST-IN', 'value0': '2550'}),
+    (sysfs.MOTOR_CLASS, 'motor0', Port.B, 'lego-ev3-l-motor',
+     {'count_per_rot': '360', 'speed_sp': '0', 'command': '', 'position': '-1234', 'speed': '0'}),
+    (sysfs.MOTOR_CLASS, 'motor1', Port.C, 'lego-ev3-l-motor',
+     {'count_per_rot': '360', 'speed_sp': '0', 'command': '', 'position': '98765', 'speed': '0'}),
+]
+
+# Benchmark definitions
+BENCH_TIME = 1.0  # s per path
+
+
+def make_tree(root):
+    """Writes the fake devices under root"""
+    for cls, name, port, driver, attributes in DEVICES:
+        path = os.path.join(root, cls, name)
+        os.makedirs(path)
+        attributes = dict(attributes, address=sysfs.PORT_PREFIX + sysfs.ADDRESSES[port], driver_name=driver)
+        for attribute, value in attributes.items():
+            with open(os.path.join(path, attribute), 'w') as f:
+                f.write(value + '\n' if value else '')
+
+
+def attribute(root, cls, name, attribute):
+    with open(os.path.join(root, cls, name, attribute)) as f:
+        return f.read()
+
+
+def check(root):
+    """Returns a list of (check, ok) for readings and writes through the backend"""
+    right = sysfs.ColorSensor(Port.S2, root)
+    left = sysfs.ColorSensor(Port.S3, root)
+    obstacle = sysfs.UltrasonicSensor(Port.S4, root)
+    motor = sysfs.Motor(Port.B, root)
+    other = sysfs.Motor(Port.C, root)
+    results = [
+        ('color modes', attribute(root, sysfs.SENSOR_CLASS, 'sensor0', 'mode').startswith('COL-REFLECT')),
+        ('ultrasonic mode', attribute(root, sysfs.SENSOR_CLASS, 'sensor2', 'mode').startswith('US-DIST-CM')),
+        ('reflections', (right.reflection(), left.reflection()) == (47, 12)),
+        ('distance', obstacle.distance() == 2550),
+        ('angles', (motor.angle(), other.angle()) == (-1234, 98765)),
+    ]
+    motor.run(250)
+    results.append(('run', attribute(root, sysfs.MOTOR_CLASS, 'motor0', 'speed_sp') == '+00250' and
+                    attribute(root, sysfs.MOTOR_CLASS, 'motor0', 'command').startswith('run-forever')))
+    os.truncate(os.path.join(root, sysfs.MOTOR_CLASS, 'motor0', 'speed_sp'), 0)
+    motor.run(250)
+    results.append(('unchanged speed not written', attribute(root, sysfs.MOTOR_CLASS, 'motor0', 'speed_sp') == ''))
+    other.run(-1234.5)
+    results.append(('negative speed', attribute(root, sysfs.MOTOR_CLASS, 'motor1', 'speed_sp') == '-01234'))
+    motor.stop()
+    results.append(('stop', attribute(root, sysfs.MOTOR_CLASS, 'motor0', 'command').startswith('stop')))
+    return results
+
+
+def rate(fn, values=1):
+    """Returns values read per second"""
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < BENCH_TIME:
+        for _ in range(1000):
+            fn()
+        calls += 1000
+    return calls*values/(time.perf_counter() - start)
+
+
+def main():
+    """Prints the backend checks and reads per second of each path"""
+    with tempfile.TemporaryDirectory() as root:
+        make_tree(root)
+        results = check(root)
+        print('%-28s %s' % ('check', 'ok'))
+        for name, ok in results:
+            print('%-28s %s' % (name, ok))
+
+        path = os.path.join(sysfs.find_device(sysfs.SENSOR_CLASS, Port.S2, root), 'value0')
+
+        def open_per_read():
+            with open(path) as f:
+                return int(f.read())
+
+        text = open(path)
+
+        def kept_open():
+            text.seek(0)
+            return int(text.read())
+
+        sensor = sysfs.ColorSensor(Port.S2, root)
+        print('%-28s %12s' % ('path', 'reads/s'))
+        for name, fn, values in (('open per read', open_per_read, 1), ('kept open, text and int()', kept_open, 1),
+                                 ('preadv into buffer', sensor.reflection, 1)):
+            print('%-28s %12.0f' % (name, rate(fn, values)))
+        text.close()
+
+
+if __name__ == '__main__':
+    main()
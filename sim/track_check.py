@@ -0,0 +1,68 @@
+"""Single-robot check of fused two-sensor line tracking against following one edge"""
+import math
+import os
+
+import world
+
+SCRIPT = os.path.join(world.REPO_DIR, 'robot', 'main.py')
+
+# Scenario definitions
+DURATION = 120  # s
+TRACK_RADIUS = 12  # cm, the robot is lost when no line is this close to its center
+SAMPLE_TIME = 0.1  # s
+BASE_VELOCITIES = (200, 300, 400, 500)
+KICK_PERIOD = 5  # s, between heading disturbances
+KICK_ANGLE = 25  # deg
+
+
+def driver(fused):
+    """Returns a target that follows the line like main() does between parking attempts"""
+    def run(module):
+        color_line, color_base = module.calibrate()
+        driving_sensor, parking_sensor, color_left, color_right, steering_offset = module.driving_mode(
+            color_line, color_base, module.DRIVING_MODE)
+        module.stop_on_line(color_line, driving_sensor, (module.BASE_VELOCITY, module.BASE_VELOCITY))
+        while True:
+            if fused:
+                module.follow_line_fused(color_line, color_base, driving_sensor, parking_sensor, steering_offset)
+            else:  # main() checks the parking sensor every tick as well
+                module.follow_line(color_left, color_right, driving_sensor, steering_offset, True)
+                module.sensor_on_line(color_line, parking_sensor)
+    return run
+
+
+def run(fused, velocity, kicks=False, map_name='map'):
+    """Returns distance driven and time off the track for one run"""
+    w = world.World(map_name)
+    robot = w.add_robot(script=SCRIPT, target=driver(fused), BASE_VELOCITY=velocity)
+
+    lost = [0, 0.0, KICK_PERIOD]  # Samples, last sample, next kick
+
+    def observe(w):
+        if w.clock - lost[1] >= SAMPLE_TIME:
+            lost[1] = w.clock
+            if w.luminance(robot.x, robot.y, TRACK_RADIUS) > 254:
+                lost[0] += 1
+        if kicks and w.clock >= lost[2]:
+            lost[2] += KICK_PERIOD
+            robot.heading += math.radians(KICK_ANGLE)*(1 if int(w.clock/KICK_PERIOD) % 2 else -1)
+    w.observers.append(observe)
+    w.run(DURATION)
+
+    if robot.error:
+        raise RuntimeError(robot.error)
+    return {'distance': robot.distance_driven, 'lost': lost[0]*SAMPLE_TIME}
+
+
+def main():
+    """Prints distance driven and time off the track for both tracking modes, with and without disturbances"""
+    print('%-6s %-6s %8s %12s %8s' % ('mode', 'kicks', 'velocity', 'distance cm', 'lost s'))
+    for kicks in (False, True):
+        for name, fused in (('edge', False), ('fused', True)):
+            for velocity in BASE_VELOCITIES:
+                m = run(fused, velocity, kicks)
+                print('%-6s %-6s %8d %12.0f %8.1f' % (name, 'yes' if kicks else 'no', velocity, m['distance'], m['lost']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Policy search for the tabular steering of robot/policy.py, scored by simulated lap time
+
+Run from the repository root, e.g. python sim/train_policy.py --generations 30.
+The table starts as the cubic of norm() at every bucket center, so the first
+parent drives like the current robot. Every generation mutates the cells the
+parent visited, by error bucket and cell by cell, (1+lambda) with the step
+size adapted by the success rate, and a child replaces the parent only if it
+is faster on the same maps and seeds. The best table is written as the blob robot/main.py loads with
+TABULAR_STEERING, progress is checkpointed after every generation.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import mission
+import world
+from cruise_check import start_on_line
+from optimize import current_parameters, save_json
+
+sys.path.append(os.path.join(world.REPO_DIR, 'robot'))
+import policy as steering  # noqa: E402
+
+# Training definitions
+CHILDREN = 8
+GENERATIONS = 30
+SEEDS = (0, 1)
+MAPS = ('map', 'map_2')
+DURATION = 60  # s
+NOISE = 1.0  # Reflection units, so the table does not learn one noiseless path
+SIGMA = 0.05  # Initial mutation step, turn rate
+SIGMA_MIN = 0.01
+MUTATION_RATE = 0.2  # Part of the visited cells also changed on their own per child
+LOST_PENALTY = 60  # s of lap time per s off the track
+TURN_LIMIT = 127/(1 << steering.STEER_SHIFT)
+CHECKPOINT = os.path.join(world.SIM_DIR, 'train_policy_checkpoint.json')
+POLICY = os.path.join(world.REPO_DIR, 'robot', 'policy.bin')
+
+
+class CountingPolicy(steering.SteeringPolicy):
+    """SteeringPolicy that counts the table cells it looks up"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.visits = {}
+
+    def steer_q(self, color_left, color_right, color_current, velocity):
+        b = steering.error_bucket(color_left, color_right, color_current, self.error_scale, self.error_bins)
+        i = min(self.speed_bins - 1, max(0, velocity//self.speed_step))*self.size + self.row + b
+        self.visits[i] = self.visits.get(i, 0) + 1
+        return super().steer_q(color_left, color_right, color_current, velocity)
+
+
+def cubic_table(gain):
+    """Returns the table of turn rates that steers like norm()"""
+    bins, scale = steering.ERROR_BINS, steering.ERROR_SCALE
+    row = []
+    for b in range(bins):
+        t = (b - bins//2 + 0.5)/scale
+        row.append(gain*(t**3+t)/2)
+    return np.tile(np.clip(row, -TURN_LIMIT, TURN_LIMIT), (steering.SPEED_BINS, bins, 1))
+
+
+def blob(table):
+    """Returns the policy blob of a table"""
+    return steering.pack(table.tolist())
+
+
+def driver(module):
+    """Follows the line like main() does between parking attempts"""
+    args = start_on_line(module)
+    module.policy.reset()
+    while True:
+        module.follow_line(*args, True)
+
+
+def run(job):
+    """Drives one table on one map and seed in a worker process, returns lap time, time lost and visited cells"""
+    data, seed, map_name, duration = job
+    w = world.World(map_name, seed=seed, noise=NOISE)
+    robot = w.add_robot(script=mission.SCRIPT, target=driver)
+    robot.module.policy = CountingPolicy(data)
+
+    lost = [0, 0.0]
+
+    def observe(w):
+        if w.clock - lost[1] >= mission.SAMPLE_TIME:
+            lost[1] = w.clock
+            if w.luminance(robot.x, robot.y, mission.TRACK_RADIUS) > 254:
+                lost[0] += 1
+    w.observers.append(observe)
+    w.run(duration)
+
+    if robot.error:
+        raise RuntimeError(robot.error)
+    speed = robot.distance_driven/duration
+    lap_time = mission.TRACK_LENGTH[map_name]/speed if speed > 0 else math.inf
+    visited = list(robot.module.policy.visits)
+    return lap_time, lost[0]*mission.SAMPLE_TIME, visited
+
+
+def score(pool, table, seeds, maps, duration):
+    """Returns the cost, mean lap time, time lost and visited cells of a table"""
+    data = blob(table)
+    results = list(pool.map(run, [(data, seed, map_name, duration) for map_name in maps for seed in seeds]))
+    lap_time = sum(r[0] for r in results)/len(results)
+    lost = sum(r[1] for r in results)/len(results)
+    visited = sorted(set(i for r in results for i in r[2]))
+    return min(lap_time, mission.FAILURE_PENALTY) + LOST_PENALTY*lost, lap_time, lost, visited
+
+
+def mutate(table, visited, sigma, rng):
+    """Returns a child with the visited cells changed, by error bucket and some of them on their own"""
+    child = table.copy()
+    flat = child.reshape(-1)
+    cells = np.array(visited)
+    shared = sigma*rng.standard_normal(steering.ERROR_BINS)  # The same change for an error bucket in every state
+    step = shared[cells % steering.ERROR_BINS]
+    own = rng.random(len(cells)) < MUTATION_RATE
+    step[own] += sigma*rng.standard_normal(own.sum())
+    flat[cells] = np.clip(flat[cells] + step, -TURN_LIMIT, TURN_LIMIT)
+    return child
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--generations', type=int, default=GENERATIONS)
+    parser.add_argument('--children', type=int, default=CHILDREN)
+    parser.add_argument('--seeds', type=int, default=len(SEEDS))
+    parser.add_argument('--map', action='append', choices=sorted(mission.TRACK_LENGTH), help='default: %s' % ', '.join(MAPS))
+    parser.add_argument('--duration', type=float, default=DURATION)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--checkpoint', default=CHECKPOINT)
+    parser.add_argument('--policy', default=POLICY)
+    args = parser.parse_args()
+    seeds = range(args.seeds)
+    maps = args.map or MAPS
+    rng = np.random.default_rng(0)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        if os.path.exists(args.checkpoint):
+            with open(args.checkpoint) as f:
+                checkpoint = json.load(f)
+            table = np.array(checkpoint['table'])
+            sigma = checkpoint['sigma']
+            generation = checkpoint['generation']
+            rng.bit_generator.state = checkpoint['rng']
+            cost, lap_time, lost, visited = checkpoint['cost'], checkpoint['lap_time'], checkpoint['lost'], checkpoint['visited']
+            print('Resumed at generation %d' % generation)
+        else:
+            table = cubic_table(current_parameters()['NORM_GAIN'])
+            sigma = SIGMA
+            generation = 0
+            cost, lap_time, lost, visited = score(pool, table, seeds, maps, args.duration)
+            print('cubic          cost %8.2f  lap %7.2f s  lost %4.1f s  cells %d' % (cost, lap_time, lost, len(visited)))
+
+        while generation < args.generations:
+            children = [mutate(table, visited, sigma, rng) for _ in range(args.children)]
+            scores = [score(pool, child, seeds, maps, args.duration) for child in children]
+            best = min(range(len(children)), key=lambda i: scores[i][0])
+            successes = sum(s[0] < cost for s in scores)
+            if scores[best][0] < cost:
+                table = children[best]
+                cost, lap_time, lost, _ = scores[best]
+                visited = sorted(set(visited) | set(scores[best][3]))
+            sigma = max(SIGMA_MIN, sigma*math.exp(successes/len(children) - 0.2))  # 1/5 success rule
+            generation += 1
+
+            save_json(args.checkpoint, {
+                'table': table.tolist(), 'sigma': sigma, 'generation': generation, 'rng': rng.bit_generator.state,
+                'cost': cost, 'lap_time': lap_time, 'lost': lost, 'visited': visited,
+            })
+            with open(args.policy + '.tmp', 'wb') as f:
+                f.write(blob(table))
+            os.replace(args.policy + '.tmp', args.policy)
+            print('generation %3d  cost %8.2f  lap %7.2f s  lost %4.1f s  sigma %.3f  cells %d' % (
+                generation, cost, lap_time, lost, sigma, len(visited)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Single-robot check of parameter hot-reload: a mailbox update while driving and a file update while idle
+
+The mission runs robot/main.py with HOT_RELOAD against the usual peer. A
+host, connected as a second Bluetooth client as on the track, sends a
+message on TUNING_MAILBOX at MESSAGE_TIME and the tuning file is
+written at FILE_TIME, the robot takes the file in at its next parking or
+turn. Every physics step checks that NORM_GAIN_Q matches NORM_GAIN, so no
+tick drove with half an update.
+"""
+import os
+import tempfile
+
+import mission
+import world
+from pybricks.messaging import BluetoothMailboxClient, TextMailbox
+from pybricks.tools import wait
+
+# Scenario definitions
+DURATION = 150  # s
+MESSAGE_TIME = 30  # s
+MESSAGE = 'BASE_VELOCITY=300 NORM_GAIN=0.8 UNKNOWN=1'
+FILE_TIME = 60  # s
+FILE_UPDATES = '{"BASE_VELOCITY": 250, "PARK_LIMIT": 3.5}'
+WATCHED = ('BASE_VELOCITY', 'NORM_GAIN', 'PARK_LIMIT')
+
+
+def host(module):
+    """Returns a Bluetooth client target that sends MESSAGE on the tuning mailbox at MESSAGE_TIME"""
+    def run(robot):
+        client = BluetoothMailboxClient()
+        client.connect('server')
+        mbox = TextMailbox(module.TUNING_MAILBOX, client)
+        wait(int(1000*(MESSAGE_TIME - robot.world.clock)))
+        mbox.send(MESSAGE)
+    return run
+
+
+def main():
+    """Prints when each update reached the script and the speed between updates"""
+    path = os.path.join(tempfile.mkdtemp(), 'tuning.json')
+    w = world.World()
+    robot = w.add_robot(script=mission.SCRIPT, HOT_RELOAD=True, TUNING_FILE=path)
+    module = robot.module
+    w.add_peer(mission.peer(module), name='peer')
+    w.add_peer(host(module), name='host')
+
+    state = {'written': False, 'torn': 0}
+    values = {name: getattr(module, name) for name in WATCHED}
+    changes = []  # (time, name, value, distance driven)
+
+    def observe(w):
+        if not state['written'] and w.clock >= FILE_TIME:
+            state['written'] = True
+            with open(path, 'w') as f:
+                f.write(FILE_UPDATES)
+        if module.NORM_GAIN_Q != int(module.NORM_GAIN*module.ONE) and module.NORM_GAIN_Q != module.ONE:  # ONE before calibrate()
+            state['torn'] += 1
+        for name in WATCHED:
+            value = getattr(module, name)
+            if value != values[name]:
+                values[name] = value
+                changes.append((w.clock, name, value, robot.distance_driven))
+    w.observers.append(observe)
+    w.run(DURATION)
+    if robot.error:
+        raise RuntimeError(robot.error)
+
+    print('message at %d s: %s' % (MESSAGE_TIME, MESSAGE))
+    print('file at %d s: %s' % (FILE_TIME, FILE_UPDATES))
+    print('%8s %-14s %8s %14s' % ('time s', 'parameter', 'value', 'speed cm/s'))
+    start, distance = 0.0, 0.0
+    for time, name, value, driven in changes:
+        speed = (driven - distance)/(time - start) if time > start else 0
+        print('%8.2f %-14s %8s %14.1f' % (time, name, value, speed))
+        start, distance = time, driven
+    print('%8s %-14s %8s %14.1f' % ('end', '', '', (robot.distance_driven - distance)/(DURATION - start)))
+    print('updates applied %d, ticks with a torn update %d' % (module.tuning.updates, state['torn']))
+
+
+if __name__ == '__main__':
+    main()
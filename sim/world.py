@@ -0,0 +1,534 @@
+"""Host-side simulator that runs the robot scripts against the GearsBot maps"""
+import importlib.util
+import json
+import math
+import os
+import pickle
+import random
+import select
+import sys
+import threading
+import traceback
+import zlib
+
+import numpy as np
+from PIL import Image
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SIM_DIR)
+MAPS_DIR = os.path.join(REPO_DIR, 'gearsbot')
+ROBOT_CONFIG = os.path.join(MAPS_DIR, 'lab_2_robot_low_sensors.json')
+
+if SIM_DIR not in sys.path:
+    sys.path.insert(0, SIM_DIR)
+
+import pybricks  # noqa: E402  (the simulated stand-in next to this file)
+import crosstrack  # noqa: E402
+import raycast  # noqa: E402
+import reflectance  # noqa: E402
+
+# World definitions
+MAP_SCALE = 10  # Pixels per cm
+PHYSICS_DT = 0.002  # s
+MOTOR_TAU = 0.05  # s, first order lag between commanded and actual wheel speed
+MOTOR_MAX_SPEED = 1000  # deg/s
+
+# Sensor definitions
+ULTRASONIC_MAX = 2550  # mm
+ULTRASONIC_HALF_ANGLE = math.radians(15)
+ULTRASONIC_RAYS = 7
+ULTRASONIC_PERIOD = 0.1  # s, the sensor holds its last measurement this long
+
+# Time spent in each hardware call, the scripts busy-loop on sensor reads
+COLOR_READ_TIME = 0.002
+DISTANCE_READ_TIME = 0.004
+MOTOR_CMD_TIME = 0.001
+
+# Port layouts
+PORTS_EV3 = {'B': 'left_motor', 'C': 'right_motor', 'S3': 'left_light', 'S4': 'ultrasonic', 'S2': 'right_light'}
+PORTS_GEARSBOT = {'A': 'left_motor', 'B': 'right_motor', 'S1': 'left_light', 'S2': 'ultrasonic', 'S3': 'right_light'}
+
+# Start poses (x cm, y cm, heading deg) with the left sensor on the line, right sensor on base
+START_POSES = {
+    'map': (302.5, 100.0, 60.0),
+    'map_2': (302.5, 100.0, 60.0),
+    'map_3': (241.0, 94.0, 60.0),
+}
+
+_maps = {}
+
+
+class SimulationEnd(Exception):
+    """Raised inside a robot thread when the simulated mission is over"""
+
+
+def load_map(name='map'):
+    """Returns the luminance of a GearsBot map as a uint8 array, cached per process"""
+    if name not in _maps:
+        image = Image.open(os.path.join(MAPS_DIR, name + '.png')).convert('L')
+        _maps[name] = np.asarray(image, dtype=np.uint8)
+    return _maps[name]
+
+
+def load_robot_config(path=ROBOT_CONFIG):
+    """Returns robot geometry in cm from a GearsBot robot description"""
+    with open(path) as f:
+        data = json.load(f)
+
+    config = {
+        'wheel_diameter': data['wheelDiameter'],
+        'axle_track': data['bodyWidth'] + 2*data['wheelToBodyOffset'] + data['wheelWidth'],
+        'body_length': data['bodyLength'],
+        'body_width': data['bodyWidth'],
+    }
+    for component in data['components']:
+        lateral, _, forward = component['position']
+        if component['type'] == 'ColorSensor':
+            role = 'left_light' if lateral < 0 else 'right_light'
+        elif component['type'] == 'UltrasonicSensor':
+            role = 'ultrasonic'
+        else:
+            continue
+        config[role] = (forward, -lateral)  # (forward, left) offsets from the robot center
+    return config
+
+
+def port_layout(path):
+    """Returns the port layout used by a script"""
+    if os.path.basename(os.path.dirname(os.path.abspath(path))) == 'gearsbot':
+        return PORTS_GEARSBOT
+    return PORTS_EV3
+
+
+def _overlap(a, b):
+    """Returns true if two convex polygons overlap (separating axis test)"""
+    for poly in (a, b):
+        for i in range(len(poly)):
+            x1, y1 = poly[i]
+            x2, y2 = poly[(i+1) % len(poly)]
+            nx, ny = y1-y2, x2-x1
+            pa = [nx*x + ny*y for x, y in a]
+            pb = [nx*x + ny*y for x, y in b]
+            if max(pa) < min(pb) or max(pb) < min(pa):
+                return False
+    return True
+
+
+class SimRobot:
+    """State of one simulated robot"""
+
+    def __init__(self, world, index, pose, config, ports, seed, start_time=0.0, name=None, ghost=False):
+        self.world = world
+        self.index = index
+        self.name = name or 'robot%d' % index
+        self.x, self.y = pose[0], pose[1]
+        self.heading = math.radians(pose[2])
+        self.config = config
+        self.ports = ports
+        self.random = random.Random(seed)
+        self.start_time = start_time
+        self.ghost = ghost  # Runs a target but has no body in the world
+
+        self.command = [0.0, 0.0]  # Commanded wheel speeds, deg/s
+        self.gain = [1.0, 1.0]  # Actual over commanded wheel speed, per motor
+        self.slip = [0.0, 0.0]  # Part of each wheel's rotation that does not move the robot
+        self.wheel_speed = [0.0, 0.0]
+        self.wheel_angle = [0.0, 0.0]
+        self.light = None
+        self.driving = None  # Config key of the color sensor the script steers on, None while unknown
+        self.beeps = 0
+        self.collisions = 0
+        self.distance_driven = 0.0
+
+        self.mailboxes = {}  # Name -> list of (delivery time, value) received by this robot
+        self.peers = []  # Robots connected over Bluetooth, a server has one per client
+        self.listening = 0  # Clients a server still takes
+
+        self.target = None
+        self.module = None
+        self.thread = None
+        self.wake = start_time
+        self.started = False
+        self.alive = True
+        self.error = None
+
+    # Geometry
+    def present(self):
+        """Returns true once the robot has been placed in the world"""
+        return not self.ghost and self.world.clock >= self.start_time
+
+    def point(self, forward, left):
+        """Returns world coordinates of a point given in robot coordinates"""
+        c, s = math.cos(self.heading), math.sin(self.heading)
+        return self.x + c*forward + s*left, self.y + s*forward - c*left
+
+    def footprint(self):
+        """Returns the corners of the robot body"""
+        half_l, half_w = self.config['body_length']/2, self.config['body_width']/2
+        return [self.point(half_l, half_w), self.point(half_l, -half_w),
+                self.point(-half_l, -half_w), self.point(-half_l, half_w)]
+
+    def state(self):
+        """Returns the robot's part of World.snapshot()"""
+        return ((self.x, self.y, self.heading), self.command, self.gain, self.slip, self.wheel_speed, self.wheel_angle,
+                self.light, self.driving, self.beeps, self.collisions, self.distance_driven, self.mailboxes,
+                [peer.index for peer in self.peers], self.listening, self.random.getstate(), self.wake)
+
+    def set_state(self, state):
+        """Sets the robot to a state() of the same world"""
+        (pose, command, gain, slip, wheel_speed, wheel_angle, self.light, self.driving, self.beeps, self.collisions,
+         self.distance_driven, mailboxes, peers, self.listening, random_state, self.wake) = state
+        self.x, self.y, self.heading = pose
+        self.command, self.gain, self.slip = list(command), list(gain), list(slip)
+        self.wheel_speed, self.wheel_angle = list(wheel_speed), list(wheel_angle)
+        self.mailboxes = {name: list(inbox) for name, inbox in mailboxes.items()}
+        self.peers = [self.world.robots[i] for i in peers]
+        self.random.setstate(random_state)
+
+    def role(self, port):
+        """Returns the device role connected to a port"""
+        return self.ports[port]
+
+    # Sensors
+    def reflection(self, role):
+        """Returns the simulated reflection (0-100) under a color sensor"""
+        x, y = self.point(*self.config[role])
+        return self.world.sensors.reflection(x, y, self.world.clock)
+
+    def distance(self):
+        """Returns the simulated ultrasonic distance in mm"""
+        return self.world.distances()[self.index]
+
+    # Hardware calls from the script thread
+    def read_reflection(self, role):
+        value = self.reflection(role)
+        self.world.sleep(self, COLOR_READ_TIME)
+        return value
+
+    def read_distance(self):
+        value = self.distance()
+        self.world.sleep(self, DISTANCE_READ_TIME)
+        return value
+
+    def run_motor(self, wheel, speed):
+        self.command[wheel] = speed
+        self.world.sleep(self, MOTOR_CMD_TIME)
+
+    # Physics
+    def step(self, dt):
+        """Advances wheel speeds, encoders and pose by dt seconds"""
+        alpha = min(1.0, dt/MOTOR_TAU)
+        for i in range(2):
+            target = max(-MOTOR_MAX_SPEED, min(MOTOR_MAX_SPEED, self.command[i]*self.gain[i]))
+            self.wheel_speed[i] += alpha*(target-self.wheel_speed[i])
+            self.wheel_angle[i] += self.wheel_speed[i]*dt
+
+        cm_per_deg = math.pi*self.config['wheel_diameter']/360
+        v_left = self.wheel_speed[0]*(1-self.slip[0])*cm_per_deg
+        v_right = self.wheel_speed[1]*(1-self.slip[1])*cm_per_deg
+        v = (v_left+v_right)/2
+        self.heading += (v_left-v_right)/self.config['axle_track']*dt
+        self.x += math.cos(self.heading)*v*dt
+        self.y += math.sin(self.heading)*v*dt
+        self.distance_driven += abs(v)*dt
+
+
+class World:
+    """Simulated world with a map, robots and a virtual clock
+
+    Every robot runs its script in its own thread, but only one thread runs at
+    a time. Hardware calls hand control back to the scheduler, which advances
+    the physics to the earliest waiting robot, so runs are deterministic.
+
+    snapshot() and restore() save and set everything but the scripts: poses,
+    encoders, the clock, random states and mailboxes. A script's own state
+    is on its thread's stack, which only a fork copies, so what-if runs fork
+    the process from the running script with branch().
+    """
+
+    def __init__(self, map_name='map', seed=0, bt_latency=0.05, walls=(), noise=0.0, drift=0.0, bt_loss=0.0,
+                 gradient=(0.0, 0.0)):
+        self.map_name = map_name
+        self.map = load_map(map_name)
+        self.scale = MAP_SCALE
+        self.sensors = reflectance.ColorSensorModel(reflectance.load_table(map_name, self.map), MAP_SCALE,
+                                                    noise=noise, drift=drift, gradient=gradient, seed=seed)
+        self.seed = seed
+        self.bt_latency = bt_latency
+        self.bt_loss = bt_loss  # Probability that a mailbox message is lost
+        self.bt_random = random.Random(seed)
+        self.bt_dropped = 0
+        self.clock = 0.0
+        self.robots = []
+        self._cond = threading.Condition()
+        self._running = None
+        self._stopping = False
+        self._overlapping = set()
+        self.observers = []  # Called with the world after every physics step
+        self.caster = raycast.RayCaster(walls, max_range=ULTRASONIC_MAX/10)
+        self._distances = None
+        self._distance_time = None
+        self._cross_track = None
+        self._branch = None  # (write fd, duration, measure) in a branch process, see branch()
+
+    # Map
+    def luminance(self, x, y, radius=None):
+        """Returns mean map luminance (0-255) in a square around a point in cm"""
+        return self.sensors.luminance(x, y, radius)
+
+    def tracking_errors(self, robots=None):
+        """Returns the cross-track error in cm of robots (every robot by default) at the color sensor each steers
+        on, see crosstrack.CrossTrack. A robot whose script has not chosen a driving mode yet is measured at the
+        nearer of its two sensors
+        """
+        if self._cross_track is None:  # The first world of a map builds its field, later ones map the cache
+            field = crosstrack.load_field(self.map_name, self.map, os.path.join(MAPS_DIR, self.map_name + '.png'),
+                                          self.scale)
+            self._cross_track = crosstrack.CrossTrack(field, self.scale)
+        robots = self.robots if robots is None else robots
+        errors = []
+        for key in ('left_light', 'right_light'):
+            points = np.array([r.point(*r.config[r.driving or key]) for r in robots]).reshape(-1, 2).T
+            errors.append(self._cross_track.error(points))
+        return np.minimum(*errors)
+
+    def distances(self):
+        """Returns every robot's ultrasonic distance in mm, refreshed for all robots at once"""
+        if self._distance_time is None or self.clock - self._distance_time >= ULTRASONIC_PERIOD:
+            robots = [r for r in self.robots if r.present()]
+            distances = np.full(len(self.robots), ULTRASONIC_MAX)
+            if robots:
+                origins = [r.point(*r.config['ultrasonic']) for r in robots]
+                footprints = [r.footprint() for r in robots]
+                seen = self.caster.cast(np.array(origins), [r.heading for r in robots], np.array(footprints),
+                                        ULTRASONIC_HALF_ANGLE, ULTRASONIC_RAYS)
+                distances[[r.index for r in robots]] = np.round(seen*10).astype(int)
+            self._distances = distances.tolist()
+            self._distance_time = self.clock
+        return self._distances
+
+    # Robots
+    def add_robot(self, pose=None, script=None, target=None, start_time=0.0, ports=None, config=None, name=None, **overrides):
+        """Adds a robot running a script (its main() unless target is given)"""
+        if pose is None:
+            pose = START_POSES[self.map_name]
+        if ports is None:
+            ports = port_layout(script) if script else PORTS_EV3
+        robot = SimRobot(self, len(self.robots), pose, config or load_robot_config(), ports,
+                         seed=self.seed*1000 + len(self.robots), start_time=start_time, name=name)
+        self.robots.append(robot)
+        if script:
+            robot.module = self.load_script(script, robot, overrides)
+        if target is not None:
+            robot.target = lambda: target(robot.module)
+        elif robot.module is not None:
+            robot.target = robot.module.main
+        return robot
+
+    def add_peer(self, target, name=None):
+        """Adds a bodiless robot running target(robot), e.g. a Bluetooth peer"""
+        robot = SimRobot(self, len(self.robots), (0, 0, 0), load_robot_config(), PORTS_EV3,
+                         seed=self.seed*1000 + len(self.robots), name=name, ghost=True)
+        self.robots.append(robot)
+        robot.target = lambda: target(robot)
+        return robot
+
+    def load_script(self, path, robot, overrides=None):
+        """Imports a robot script with its hardware bound to a simulated robot"""
+        pybricks.bind(robot)
+        script_dir = os.path.dirname(os.path.abspath(path))
+        if script_dir not in sys.path:
+            sys.path.append(script_dir)
+        name = 'sim_%s_%d' % (os.path.splitext(os.path.basename(path))[0], robot.index)
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.time = pybricks.SimTime(self)
+        module.random = robot.random
+        module.print = lambda *args, **kwargs: None
+        if hasattr(module, 'driving_mode'):  # Mode 1 steers on the left sensor, -1 on the right one
+            choose = module.driving_mode
+
+            def driving_mode(color_line, color_base, mode):
+                robot.driving = 'left_light' if mode == 1 else 'right_light'
+                return choose(color_line, color_base, mode)
+            module.driving_mode = driving_mode
+        for key, value in (overrides or {}).items():
+            setattr(module, key, value)
+        return module
+
+    # Snapshots
+    def snapshot(self):
+        """Returns the state of the world and its robots, without their scripts, as compressed bytes"""
+        state = (self.clock, self.bt_random.getstate(), self.bt_dropped, self.sensors.rng.bit_generator.state,
+                 sorted(self._overlapping), self._distances, self._distance_time, [r.state() for r in self.robots])
+        return zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+    def restore(self, data):
+        """Sets the world to a snapshot() of a world with the same robots, before run() or from a script"""
+        (self.clock, bt_random, self.bt_dropped, sensors, overlapping, self._distances, self._distance_time,
+         robots) = pickle.loads(zlib.decompress(data))
+        if len(robots) != len(self.robots):
+            raise ValueError('Snapshot of %d robots, the world has %d' % (len(robots), len(self.robots)))
+        self.bt_random.setstate(bt_random)
+        self.sensors.rng.bit_generator.state = sensors
+        self._overlapping = set(overlapping)
+        for robot, state in zip(self.robots, robots):
+            robot.set_state(state)
+
+    def branch(self, count, duration, measure, processes=None):
+        """Forks the world count times from the running script, each fork runs on alone until duration s.
+        Returns (index, None) in fork index, which goes on from here, and (None, results) in this process,
+        where results[index] is what measure(world) returned at the end of fork index. At most processes
+        forks (all cores by default) run at a time, copy on write from this one. Only the calling robot's
+        thread lives on in a fork, so every other robot must be done or have no script.
+        """
+        robot = pybricks.robot()
+        others = [r.name for r in self.robots if r is not robot and r.alive and r.target is not None]
+        if others:
+            raise RuntimeError('Cannot branch with other scripts running: %s' % ', '.join(others))
+        processes = processes or os.cpu_count()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        results = [None]*count
+        running = {}  # Read fd -> (index, pid, data so far)
+        index = 0
+        while index < count or running:
+            while index < count and len(running) < processes:
+                read, write = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(read)
+                    for fd in running:
+                        os.close(fd)
+                    self._branch = (write, duration, measure)
+                    return index, None
+                os.close(write)
+                running[read] = (index, pid, [])
+                index += 1
+            for fd in select.select(list(running), [], [])[0]:
+                chunk = os.read(fd, 1 << 16)
+                if chunk:
+                    running[fd][2].append(chunk)
+                    continue
+                i, pid, chunks = running.pop(fd)
+                os.close(fd)
+                os.waitpid(pid, 0)
+                if not chunks:
+                    raise RuntimeError('Branch %d ended without a result' % i)
+                results[i], error = pickle.loads(b''.join(chunks))
+                if error:
+                    raise RuntimeError('Branch %d failed:\n%s' % (i, error))
+        return None, results
+
+    def _end_branch(self):
+        """Sends the result of a fork to the process it came from and exits"""
+        write, duration, measure = self._branch
+        try:
+            self.advance(duration)
+            data = pickle.dumps((measure(self), None), pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            data = pickle.dumps((None, traceback.format_exc()))
+        with os.fdopen(write, 'wb') as f:
+            f.write(data)
+        os._exit(0)
+
+    # Scheduling
+    def sleep(self, robot, dt):
+        """Blocks the calling robot thread for dt seconds of simulated time"""
+        if self._branch is not None:  # The only thread of a fork schedules itself
+            robot.wake = self.clock + dt
+            if robot.wake > self._branch[1]:
+                self._end_branch()
+            self.advance(robot.wake)
+            return
+        with self._cond:
+            robot.wake = self.clock + dt
+            self._running = None
+            self._cond.notify_all()
+            while self._running is not robot:
+                self._cond.wait()
+            if self._stopping:
+                raise SimulationEnd()
+
+    def _thread_main(self, robot):
+        pybricks.bind(robot)
+        with self._cond:
+            while self._running is not robot:
+                self._cond.wait()
+        try:
+            if not self._stopping:
+                robot.target()
+        except SimulationEnd:
+            pass
+        except Exception:
+            robot.error = traceback.format_exc()
+        finally:
+            if self._branch is not None:
+                self._end_branch()
+            with self._cond:
+                robot.alive = False
+                self._running = None
+                self._cond.notify_all()
+
+    def _resume(self, robot):
+        """Runs a robot thread until its next hardware call"""
+        if not robot.started:
+            robot.started = True
+            robot.thread = threading.Thread(target=self._thread_main, args=(robot,), daemon=True)
+            robot.thread.start()
+        with self._cond:
+            self._running = robot
+            self._cond.notify_all()
+            while self._running is robot:
+                self._cond.wait()
+
+    def advance(self, t):
+        """Advances the physics to time t"""
+        while self.clock < t - 1e-9:
+            dt = min(PHYSICS_DT, t-self.clock)
+            for robot in self.robots:
+                if robot.present():
+                    robot.step(dt)
+            self.clock += dt
+            self._check_collisions()
+            for observer in self.observers:
+                observer(self)
+
+    def _check_collisions(self):
+        present = [r for r in self.robots if r.present()]
+        for i in range(len(present)):
+            for j in range(i+1, len(present)):
+                a, b = present[i], present[j]
+                key = (a.index, b.index)
+                if abs(a.x-b.x) + abs(a.y-b.y) > a.config['body_length'] + b.config['body_length']:
+                    self._overlapping.discard(key)
+                    continue
+                if _overlap(a.footprint(), b.footprint()):
+                    if key not in self._overlapping:
+                        a.collisions += 1
+                        b.collisions += 1
+                        self._overlapping.add(key)
+                else:
+                    self._overlapping.discard(key)
+
+    def run(self, duration):
+        """Runs the mission for duration seconds of simulated time"""
+        while True:
+            runnable = [r for r in self.robots if r.alive and r.target is not None]
+            if not runnable:
+                break
+            robot = min(runnable, key=lambda r: (r.wake, r.index))
+            if robot.wake > duration:
+                break
+            self.advance(robot.wake)
+            self._resume(robot)
+        self.advance(duration)
+        self.stop()
+
+    def stop(self):
+        """Ends every robot thread"""
+        self._stopping = True
+        for robot in self.robots:
+            if robot.started and robot.alive:
+                self._resume(robot)